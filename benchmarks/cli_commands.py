@@ -0,0 +1,48 @@
+"""Cost per command of KeyValueStoreCLI, without any I/O.
+
+Run with ``python -m benchmarks.cli_commands``. The overhead column is the
+time spent by the CLI itself: the total minus the time of calling the
+transaction directly.
+"""
+import timeit
+
+from keyvaluestore.cli import KeyValueStoreCLI
+from keyvaluestore.system import KeyValueStoreSystem
+
+NUMBER_OF_COMMANDS = 200_000
+
+COMMANDS = [
+    ("SET key value", lambda transaction: transaction.set("key", "value")),
+    ("GET key", lambda transaction: transaction.get("key", None)),
+    ("get key", lambda transaction: transaction.get("key", None)),
+    ("UNSET key", lambda transaction: transaction.unset("key")),
+    ("NUMEQUALTO value", lambda transaction: transaction.number_of_keys_with_value("value")),
+    ("SET key", lambda transaction: None),
+    ("BANANA", lambda transaction: None),
+]
+
+
+class DiscardedOutput:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def main():
+    cli = KeyValueStoreCLI(KeyValueStoreSystem(), cli_output=DiscardedOutput())
+    cli.execute("BEGIN")
+    transaction = KeyValueStoreSystem().begin()
+    print(f"{'command':<20} {'total':>12} {'overhead':>12}")
+    for line, direct_call in COMMANDS:
+        total = timeit.timeit(lambda: cli.execute(line), number=NUMBER_OF_COMMANDS)
+        direct = timeit.timeit(lambda: direct_call(transaction), number=NUMBER_OF_COMMANDS)
+        print(
+            f"{line:<20} {total / NUMBER_OF_COMMANDS * 1e9:>9.0f} ns"
+            f" {(total - direct) / NUMBER_OF_COMMANDS * 1e9:>9.0f} ns"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Throughput of one KeyValueStoreSystem shared by several threads.
+
+Run with ``python -m benchmarks.concurrency``. Readers run read-only
+transactions over a preloaded keyspace and writers commit small
+transactions on keys of their own, so none of them conflict. Keep in
+mind that CPython runs one thread at a time: what this shows is that
+throughput does not collapse as threads are added, because readers never
+take a lock and disjoint writers only share the short publish step.
+"""
+import threading
+import time
+
+from keyvaluestore.system import KeyValueStoreSystem
+
+NUMBER_OF_KEYS = 10_000
+DURATION = 1.0
+
+
+def main():
+    print(f"{'readers':>8} {'writers':>8} {'reads/s':>12} {'commits/s':>12}")
+    for readers, writers in [(1, 0), (2, 0), (4, 0), (8, 0), (0, 1), (0, 2), (0, 4), (0, 8), (4, 4)]:
+        reads, commits = measure(readers, writers)
+        print(f"{readers:>8} {writers:>8} {reads / DURATION:>12,.0f} {commits / DURATION:>12,.0f}")
+
+
+def measure(readers, writers):
+    system = preloaded_system()
+    deadline = time.perf_counter() + DURATION
+    results = {"reads": [], "commits": []}
+
+    def read():
+        count = 0
+        while time.perf_counter() < deadline:
+            transaction = system.begin()
+            for number in range(0, NUMBER_OF_KEYS, 100):
+                transaction.get(f"key-{number}")
+            transaction.rollback()
+            count += NUMBER_OF_KEYS // 100
+        results["reads"].append(count)
+
+    def write(writer):
+        count = 0
+        while time.perf_counter() < deadline:
+            transaction = system.begin()
+            transaction.set(f"writer-{writer}-{count % 1000}", count)
+            transaction.commit()
+            count += 1
+        results["commits"].append(count)
+
+    threads = [threading.Thread(target=read) for _ in range(readers)]
+    threads += [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(results["reads"]), sum(results["commits"])
+
+
+def preloaded_system():
+    system = KeyValueStoreSystem()
+    transaction = system.begin()
+    for number in range(NUMBER_OF_KEYS):
+        transaction.set(f"key-{number}", number)
+    transaction.commit()
+    return system
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,192 @@
+import argparse
+import asyncio
+import sys
+import threading
+
+from keyvaluestore import bench, transfer
 from keyvaluestore.cli import KeyValueStoreCLI
+from keyvaluestore.mapped import MappedStorage
+from keyvaluestore.metrics import Metrics, start_metrics_server
+from keyvaluestore.replication import ReplicationFollower, ReplicationLeader
+from keyvaluestore.server import serve
+from keyvaluestore.shared import SharedSnapshots
+from keyvaluestore.snapshot import SnapshotFile
+from keyvaluestore.storage import CachedStorage, CompactStorage, InMemoryStorage
 from keyvaluestore.system import KeyValueStoreSystem
+from keyvaluestore.wal import WriteAheadLog
+
+STORAGES = {"memory": InMemoryStorage, "compact": CompactStorage}
+
+parser = argparse.ArgumentParser(prog="python -m keyvaluestore")
+parser.add_argument(
+    "--storage",
+    choices=STORAGES,
+    default="memory",
+    help="how the keys are kept in memory, compact uses less memory when many keys share their values",
+)
+parser.add_argument("--data", help="keep the keys in this memory-mapped file, which can be larger than the memory")
+parser.add_argument(
+    "--cache-size", type=int, help="keep this many of the most recently read keys of the --data file in memory"
+)
+parser.add_argument(
+    "--serializable",
+    action="store_true",
+    help="make commits also conflict when another commit changed what the transaction read, not only what it writes",
+)
+parser.add_argument("--log", help="keep the data in this write-ahead log instead of only in memory")
+parser.add_argument(
+    "--sync",
+    choices=WriteAheadLog.SYNC_POLICIES,
+    default=WriteAheadLog.SYNC_ALWAYS,
+    help="when the write-ahead log is synced to disk",
+)
+parser.add_argument(
+    "--sync-interval", type=float, default=0.01, help="seconds between syncs with --sync interval"
+)
+parser.add_argument("--snapshot", help="start from this snapshot file and write checkpoints to it, also when the program ends")
+parser.add_argument(
+    "--checkpoint-interval", type=float, help="seconds between checkpoints, written in the background"
+)
+parser.add_argument(
+    "--expire-interval", type=float, default=1.0, help="seconds between deletions of the keys that expired"
+)
+parser.add_argument(
+    "--metrics", action="store_true", help="count and time the transactions, shown by the STATS command"
+)
+parser.add_argument(
+    "--metrics-port", type=int, help="serve the metrics in the Prometheus format at /metrics, implies --metrics"
+)
+parser.add_argument(
+    "--shared-memory", help="publish snapshots of the store in shared memory under this name, for reader processes"
+)
+parser.add_argument(
+    "--publish-interval", type=float, default=1.0, help="seconds between snapshots published with --shared-memory"
+)
+parser.add_argument("--replication-port", type=int, help="stream the commits to the followers that connect to this port")
+parser.add_argument(
+    "--follow",
+    metavar="HOST:PORT",
+    help="start from a snapshot of the leader at this address and apply its commits, without accepting any other",
+)
+mode = parser.add_mutually_exclusive_group()
+mode.add_argument(
+    "--batch",
+    action="store_true",
+    default=None,
+    help="run the commands without prompts and with buffered output, the default when the input is not a terminal",
+)
+mode.add_argument("--interactive", dest="batch", action="store_false", help="show the help and the prompts")
+commands = parser.add_subparsers(dest="command", title="commands")
+serve_parser = commands.add_parser("serve", help="serve the CLI protocol over TCP to many clients")
+serve_parser.add_argument("--host", default="127.0.0.1")
+serve_parser.add_argument("--port", type=int, default=7379)
+bench_parser = commands.add_parser("bench", help="measure the store with reproducible workloads")
+bench_parser.add_argument(
+    "--workload", action="append", choices=bench.WORKLOADS, help="run only this workload, can be repeated"
+)
+bench_parser.add_argument("--operations", type=int, default=bench.DEFAULT_OPERATIONS, help="operations per workload")
+bench_parser.add_argument("--seed", type=int, default=0)
+bench_parser.add_argument("--output", help="save the results to this JSON file")
+bench_parser.add_argument("--baseline", help="compare with the results saved in this JSON file")
+import_parser = commands.add_parser("import", help="write every key of a dump to the store, replacing the ones it has")
+import_parser.add_argument("path")
+import_parser.add_argument("--format", choices=transfer.FORMATS, default="binary")
+export_parser = commands.add_parser("export", help="write every key of the store to a dump, while commits go on")
+export_parser.add_argument("path")
+export_parser.add_argument("--format", choices=transfer.FORMATS, default="binary")
+arguments = parser.parse_args()
+if arguments.checkpoint_interval and not arguments.snapshot:
+    parser.error("--checkpoint-interval requires --snapshot")
+if arguments.data and arguments.storage != "memory":
+    parser.error("--data cannot be used with --storage")
+if arguments.cache_size and not arguments.data:
+    parser.error("--cache-size requires --data")
+if arguments.follow and (arguments.log or arguments.snapshot):
+    parser.error("--follow cannot be used with --log or --snapshot, the follower starts from the leader")
+if arguments.follow and arguments.command == "import":
+    parser.error("import cannot be used with --follow, the keys must be written to the leader")
+if arguments.command == "bench":
+    bench.main(arguments, STORAGES[arguments.storage])
+    sys.exit()
+
+log = WriteAheadLog(arguments.log, arguments.sync, arguments.sync_interval) if arguments.log else None
+snapshot_file = SnapshotFile(arguments.snapshot) if arguments.snapshot else None
+storage = MappedStorage(arguments.data) if arguments.data else STORAGES[arguments.storage]()
+if arguments.cache_size:
+    storage = CachedStorage(storage, max_entries=arguments.cache_size)
+metrics = Metrics() if arguments.metrics or arguments.metrics_port else None
+follower = None
+if arguments.follow:
+    host, _, port = arguments.follow.rpartition(":")
+    follower = ReplicationFollower(host, int(port), storage)
+    system = follower.system
+    system.metrics = metrics
+else:
+    system = KeyValueStoreSystem(
+        storage, log=log, snapshot_file=snapshot_file, metrics=metrics, serializable=arguments.serializable
+    )
+leader = ReplicationLeader(system, port=arguments.replication_port) if arguments.replication_port else None
+if arguments.metrics_port:
+    start_metrics_server(lambda: metrics.to_prometheus(system.statistics()), port=arguments.metrics_port)
+shared_snapshots = SharedSnapshots(system, arguments.shared_memory) if arguments.shared_memory else None
+stop_background_threads = threading.Event()
+
+
+def checkpoint_periodically():
+    while not stop_background_threads.wait(arguments.checkpoint_interval):
+        system.checkpoint()
+
+
+def expire_keys_periodically():
+    while not stop_background_threads.wait(arguments.expire_interval):
+        while system.expire_keys() == KeyValueStoreSystem.EXPIRE_BATCH_SIZE:
+            pass
+
+
+def publish_periodically():
+    while not stop_background_threads.wait(arguments.publish_interval):
+        shared_snapshots.publish()
+
 
-cli = KeyValueStoreCLI(KeyValueStoreSystem())
-cli.run()
+if arguments.checkpoint_interval:
+    checkpointer = threading.Thread(target=checkpoint_periodically, daemon=True)
+    checkpointer.start()
+if shared_snapshots is not None:
+    publisher = threading.Thread(target=publish_periodically, daemon=True)
+    publisher.start()
+expirer = threading.Thread(target=expire_keys_periodically, daemon=True)
+expirer.start()
+if arguments.command == "serve":
+    try:
+        asyncio.run(serve(system, arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
+elif arguments.command == "import":
+    number_of_keys = transfer.import_items(system, arguments.path, arguments.format)
+    print(f"Imported {number_of_keys} keys")
+elif arguments.command == "export":
+    number_of_keys = transfer.export_items(system, arguments.path, arguments.format)
+    print(f"Exported {number_of_keys} keys")
+else:
+    batch = not sys.stdin.isatty() if arguments.batch is None else arguments.batch
+    if batch:
+        cli_input = open(sys.stdin.fileno(), buffering=1 << 20, closefd=False)
+        cli_output = open(sys.stdout.fileno(), "w", buffering=1 << 20, closefd=False)
+        KeyValueStoreCLI(system, cli_input, cli_output, batch=True).run()
+    else:
+        KeyValueStoreCLI(system).run()
+stop_background_threads.set()
+expirer.join()
+if arguments.checkpoint_interval:
+    checkpointer.join()
+if shared_snapshots is not None:
+    publisher.join()
+    shared_snapshots.close()
+if leader is not None:
+    leader.close()
+if snapshot_file is not None:
+    system.checkpoint()
+if follower is not None:
+    follower.close()
+else:
+    system.end()
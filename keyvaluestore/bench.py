@@ -0,0 +1,252 @@
+"""Reproducible workloads to compare the performance of the store across commits.
+
+Run with ``python -m keyvaluestore bench``. Every workload runs in a
+process of its own, so the peak memory it reports is its own, and uses a
+random generator with a fixed seed, so two runs do the same operations.
+Latencies are measured per operation, whose meaning depends on the
+workload, and ``--output`` saves the results as JSON to pass them later
+as ``--baseline``.
+"""
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+
+from keyvaluestore.cli import KeyValueStoreCLI
+from keyvaluestore.system import KeyValueStoreSystem
+
+DEFAULT_OPERATIONS = 100_000
+NUMBER_OF_KEYS = 10_000
+NUMBER_OF_VALUES = 100
+
+
+class DiscardedOutput:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def preloaded_system(storage_class):
+    system = KeyValueStoreSystem(storage_class())
+    transaction = system.begin()
+    transaction.set_many((f"key-{number}", f"value-{number % NUMBER_OF_VALUES}") for number in range(NUMBER_OF_KEYS))
+    transaction.commit()
+    return system
+
+
+def random_key(generator):
+    return f"key-{generator.randrange(NUMBER_OF_KEYS)}"
+
+
+def random_value(generator):
+    return f"value-{generator.randrange(NUMBER_OF_VALUES)}"
+
+
+def read_heavy(system, operations, generator):
+    """Transactions of ten operations, nine reads and one write"""
+    latencies = []
+    for _ in range(operations // 10):
+        transaction = system.begin()
+        for step in range(10):
+            key = random_key(generator)
+            start = time.perf_counter_ns()
+            if step == 9:
+                transaction.set(key, random_value(generator))
+            else:
+                transaction.get(key, None)
+            latencies.append(time.perf_counter_ns() - start)
+        transaction.commit()
+    return latencies, {}
+
+
+def write_heavy(system, operations, generator):
+    """Commits of ten new values each, an operation being one commit"""
+    latencies = []
+    for _ in range(operations // 10):
+        transaction = system.begin()
+        for _ in range(10):
+            transaction.set(random_key(generator), random_value(generator))
+        start = time.perf_counter_ns()
+        transaction.commit()
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies, {}
+
+
+def long_transactions(system, operations, generator):
+    """A few transactions that write and read back thousands of keys, nested once in a while"""
+    latencies = []
+    transaction_size = max(operations // 10, 1)
+    for _ in range(10):
+        transaction = system.begin()
+        for step in range(transaction_size):
+            key = f"long-{generator.randrange(transaction_size)}"
+            start = time.perf_counter_ns()
+            if step % 1000 == 999:
+                transaction.begin()
+            elif step % 2:
+                transaction.get(key, None)
+            else:
+                transaction.set(key, step)
+            latencies.append(time.perf_counter_ns() - start)
+        while transaction.nesting_level:
+            transaction.commit()
+        transaction.commit()
+    return latencies, {}
+
+
+def high_conflict(system, operations, generator, number_of_threads=4, number_of_hot_keys=8):
+    """Threads that increment a few hot keys, an operation being one commit, successful or not"""
+    seeds = [generator.random() for _ in range(number_of_threads)]
+    results = []
+
+    def increment(seed):
+        thread_generator = random.Random(seed)
+        latencies = []
+        conflicts = 0
+        for _ in range(operations // number_of_threads):
+            transaction = system.begin()
+            key = f"hot-{thread_generator.randrange(number_of_hot_keys)}"
+            transaction.set(key, transaction.get(key, 0) + 1)
+            start = time.perf_counter_ns()
+            try:
+                transaction.commit()
+            except KeyValueStoreSystem.TransactionConflict:
+                transaction.rollback()
+                conflicts += 1
+            latencies.append(time.perf_counter_ns() - start)
+        results.append((latencies, conflicts))
+
+    threads = [threading.Thread(target=increment, args=(seed,)) for seed in seeds]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies = [latency for thread_latencies, _ in results for latency in thread_latencies]
+    return latencies, {"conflicts": sum(conflicts for _, conflicts in results)}
+
+
+def numequalto_heavy(system, operations, generator):
+    """NUMEQUALTO in transactions that changed some of the keys and commits of other transactions"""
+    latencies = []
+    for _ in range(operations // 100):
+        writer = system.begin()
+        writer.set(random_key(generator), random_value(generator))
+        transaction = system.begin()
+        for _ in range(10):
+            transaction.set(random_key(generator), random_value(generator))
+        writer.commit()
+        for _ in range(100):
+            value = random_value(generator)
+            start = time.perf_counter_ns()
+            transaction.number_of_keys_with_value(value)
+            latencies.append(time.perf_counter_ns() - start)
+        transaction.rollback()
+    return latencies, {}
+
+
+def cli_replay(system, operations, generator):
+    """Commands of a generated script run by the CLI, an operation being one command"""
+    lines = []
+    while len(lines) < operations:
+        lines.append("BEGIN")
+        for _ in range(8):
+            choice = generator.random()
+            if choice < 0.5:
+                lines.append(f"GET {random_key(generator)}")
+            elif choice < 0.9:
+                lines.append(f"SET {random_key(generator)} {random_value(generator)}")
+            else:
+                lines.append(f"NUMEQUALTO {random_value(generator)}")
+        lines.append("COMMIT")
+    cli = KeyValueStoreCLI(system, cli_output=DiscardedOutput(), batch=True)
+    latencies = []
+    for line in lines[:operations]:
+        start = time.perf_counter_ns()
+        cli.execute(line)
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies, {}
+
+
+WORKLOADS = {
+    "read-heavy": read_heavy,
+    "write-heavy": write_heavy,
+    "long-transactions": long_transactions,
+    "high-conflict": high_conflict,
+    "numequalto-heavy": numequalto_heavy,
+    "cli-replay": cli_replay,
+}
+
+
+def run_workload(name, storage_class, operations, seed) -> dict:
+    system = preloaded_system(storage_class)
+    generator = random.Random(seed)
+    start = time.perf_counter()
+    latencies, extra = WORKLOADS[name](system, operations, generator)
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    result = {
+        "operations": len(latencies),
+        "seconds": seconds,
+        "operations_per_second": len(latencies) / seconds if seconds else 0.0,
+        "p50_us": latencies[len(latencies) // 2] / 1000 if latencies else 0.0,
+        "p99_us": latencies[int(len(latencies) * 0.99)] / 1000 if latencies else 0.0,
+        "peak_rss_mib": peak_rss_mib(),
+    }
+    result.update(extra)
+    return result
+
+
+def peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes and macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def run(names, storage_class, operations=DEFAULT_OPERATIONS, seed=0, isolated=True) -> dict:
+    results = {}
+    for name in names:
+        if isolated:
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                results[name] = pool.apply(run_workload, (name, storage_class, operations, seed))
+        else:
+            results[name] = run_workload(name, storage_class, operations, seed)
+    return {
+        "python": platform.python_version(),
+        "storage": storage_class.__name__,
+        "operations": operations,
+        "seed": seed,
+        "workloads": results,
+    }
+
+
+def report(results, baseline=None, output=sys.stdout):
+    output.write(f"{'workload':<20} {'ops/s':>12} {'p50':>10} {'p99':>10} {'peak RSS':>10}")
+    output.write(f" {'vs baseline':>12}\n" if baseline else "\n")
+    for name, result in results["workloads"].items():
+        output.write(
+            f"{name:<20} {result['operations_per_second']:>12,.0f} {result['p50_us']:>8.1f}us"
+            f" {result['p99_us']:>8.1f}us {result['peak_rss_mib']:>7.1f}MiB"
+        )
+        previous = baseline["workloads"].get(name) if baseline else None
+        if previous and previous["operations_per_second"]:
+            output.write(f" {result['operations_per_second'] / previous['operations_per_second']:>11.2f}x")
+        output.write("\n")
+
+
+def main(arguments, storage_class):
+    names = arguments.workload or list(WORKLOADS)
+    results = run(names, storage_class, arguments.operations, arguments.seed)
+    baseline = None
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    report(results, baseline)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
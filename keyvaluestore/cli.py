@@ -16,132 +16,231 @@ class KeyValueStoreCLI:
 
         You can use the following commands:
 
-                BEGIN           🔸 start a new transaction
-                        SET             Set a key-value pair.
+                BEGIN           🔸 start a new transaction, nested in the
+                                   current one if there is one
+                        SET             Set a key-value pair, that expires
+                                        in n seconds with EX n.
+                        EXPIRE          Make a key expire in n seconds.
                         UNSET           Unset a key
                         GET             Get the value associated with a key.
+                        MSET            Set many key-value pairs.
+                        MGET            Get the values of many keys.
+                        MUNSET          Unset many keys.
+                        SCAN            Get the keys from a key to another,
+                                        not included, in order.
+                        PREFIX          Get the keys that start with a
+                                        prefix, in order.
                         NUMEQUALTO      Returns the number of keys that are
                                         associated with the given value.
                 COMMIT          🔸 commit the current transaction.
                 ROLLBACK        🔸 rollback the current
                                    transaction.
+                STATS           🔸 show the counters and gauges of
+                                   the store
                 HELP            🔸 show this help message
                 END             🔸 end the program
         """
     )
 
     ERROR_TRANSACTION_IS_MISSING = "ERROR: Enter BEGIN command to start"
+    ERROR_TRANSACTION_CONFLICT = "ERROR: Another transaction changed the same keys, enter ROLLBACK to start again"
+    ERROR_READ_ONLY = "ERROR: This store is a follower, changes must be made in the leader, enter ROLLBACK"
     PROMPT = "Enter the command:  (HELP): "
 
     _transaction: Union[Transaction, "NoTransaction"]
 
-    def __init__(self, system: KeyValueStoreSystem, cli_input=sys.stdin, cli_output=sys.stdout):
+    BATCH_READ_SIZE = 1 << 16
+
+    def __init__(self, system: KeyValueStoreSystem, cli_input=sys.stdin, cli_output=sys.stdout, batch=False):
         self._input = cli_input
         self._output = cli_output
+        self._batch = batch
         self._system = system
         self._transaction = NoTransaction()
         self._is_still_running = True
-        self._register_commands()
-
-    def _register_commands(self):
-        self._commands = {
-            "BEGIN": self._begin,
-            "SET": self._set,
-            "GET": self._get,
-            "UNSET": self._unset,
-            "NUMEQUALTO": self._numequalto,
-            "COMMIT": self._commit,
-            "ROLLBACK": self._rollback,
-            "HELP": self._help,
-            "END": self._end,
-        }
 
     def run(self):
+        if self._batch:
+            self._run_batch()
+            return
         self._help()
         self._prompt()
         line = self._input.readline()
         while self._is_still_running and line:
-            line = line.strip()
-            if line:
-                self._process_line(line)
+            self.execute(line)
             if self._is_still_running:
                 self._prompt()
                 line = self._input.readline()
 
-    def _prompt(self):
-        self._output.write(KeyValueStoreCLI.PROMPT)
+    def _run_batch(self):
+        # Without a user waiting for each answer, there are no prompts and the output is flushed once
+        lines = self._input.readlines(KeyValueStoreCLI.BATCH_READ_SIZE)
+        while self._is_still_running and lines:
+            for line in lines:
+                self.execute(line)
+                if not self._is_still_running:
+                    break
+            else:
+                lines = self._input.readlines(KeyValueStoreCLI.BATCH_READ_SIZE)
         self._output.flush()
 
-    def _process_line(self, line):
-        command = line.split()[0].upper()
-        if command in self._commands:
-            self._execute_command(command, line)
-        else:
-            self._output.write(f"ERROR: Unknown command '{command}'\n")
-
-    def _execute_command(self, command, line):
+    @property
+    def is_still_running(self):
+        return self._is_still_running
+
+    def execute(self, line):
+        # The line is split once and its arguments are passed to the handler of the command
+        tokens = line.split()
+        if not tokens:
+            return
+        command = KeyValueStoreCLI.COMMANDS.get(tokens[0]) or KeyValueStoreCLI.COMMANDS.get(tokens[0].upper())
+        if command is None:
+            self._output.write(f"ERROR: Unknown command '{tokens[0].upper()}'\n")
+            return
+        arity, handler = command
+        if isinstance(arity, tuple) and not arity[0] <= len(tokens) - 1 <= arity[1]:
+            self._output.write(f"ERROR: Expected {arity[0]} to {arity[1]} arguments but got {len(tokens) - 1}\n")
+            return
+        if isinstance(arity, int) and len(tokens) - 1 != arity:
+            self._output.write(f"ERROR: Expected {arity} arguments but got {len(tokens) - 1}\n")
+            return
         try:
-            self._commands[command](line)
-        except TransactionIsMissing:
-            self._output.write(f"{KeyValueStoreCLI.ERROR_TRANSACTION_IS_MISSING}\n")
+            handler(self, *tokens[1:])
         except ValueError as error:
             self._output.write(f"ERROR: {error}\n")
+        except TransactionIsMissing:
+            self._output.write(f"{KeyValueStoreCLI.ERROR_TRANSACTION_IS_MISSING}\n")
+        except KeyValueStoreSystem.TransactionConflict:
+            self._output.write(f"{KeyValueStoreCLI.ERROR_TRANSACTION_CONFLICT}\n")
+        except KeyValueStoreSystem.ReadOnly:
+            self._output.write(f"{KeyValueStoreCLI.ERROR_READ_ONLY}\n")
 
-    def _help(self, _=""):
+    def _prompt(self):
+        self._output.write(KeyValueStoreCLI.PROMPT)
+        self._output.flush()
+
+    def _help(self, *_):
         self._output.write(f"{KeyValueStoreCLI.HELP}")
 
-    def _begin(self, line):
-        self._assert_number_of_arguments_equal_to(0, line)
-        self._transaction = self._system.begin()
+    def _begin(self):
+        if isinstance(self._transaction, NoTransaction):
+            self._transaction = self._system.begin()
+        else:
+            self._transaction.begin()
         self._output.write("OK\n")
 
-    def _commit(self, line):
-        self._assert_number_of_arguments_equal_to(0, line)
+    def _commit(self):
+        is_nested = self._transaction.nesting_level > 0
         self._transaction.commit()
-        self._transaction = NoTransaction()
+        if not is_nested:
+            self._transaction = NoTransaction()
         self._output.write("OK\n")
 
-    def _rollback(self, line):
-        self._assert_number_of_arguments_equal_to(0, line)
+    def _rollback(self):
         self._transaction.rollback()
         self._output.write("OK\n")
 
-    def _set(self, line):
-        self._assert_number_of_arguments_equal_to(2, line)
-        _, key, value = line.split()
-        self._transaction.set(key, value)
+    def _set(self, key, value, *options):
+        time_to_live = None
+        if options:
+            if options[0].upper() != "EX" or len(options) != 2:
+                raise ValueError(f"Unknown option '{' '.join(options)}'")
+            time_to_live = self._parse_seconds(options[1])
+        self._transaction.set(key, value, time_to_live)
         self._output.write(f"{key}={value}\n")
 
-    def _get(self, line):
-        self._assert_number_of_arguments_equal_to(1, line)
-        _, key = line.split()
-        try:
-            value = self._transaction.get(key)
-            self._output.write(f"{value}\n")
-        except KeyError:
-            self._output.write("(NULL)\n")
-
-    def _unset(self, line):
-        self._assert_number_of_arguments_equal_to(1, line)
-        _, key = line.split()
+    def _expire(self, key, seconds):
+        is_set = self._transaction.expire(key, self._parse_seconds(seconds))
+        self._output.write("1\n" if is_set else "0\n")
+
+    @staticmethod
+    def _parse_seconds(seconds):
+        if not seconds.isdigit() or not int(seconds):
+            raise ValueError(f"The seconds must be a positive number but got '{seconds}'")
+        return int(seconds)
+
+    def _get(self, key):
+        value = self._transaction.get(key, None)
+        self._output.write("(NULL)\n" if value is None else f"{value}\n")
+
+    def _unset(self, key):
         self._transaction.unset(key)
         self._output.write("OK\n")
 
-    def _numequalto(self, line):
-        self._assert_number_of_arguments_equal_to(1, line)
-        _, value = line.split()
+    def _mset(self, *keys_and_values):
+        if not keys_and_values or len(keys_and_values) % 2:
+            self._output.write(f"ERROR: Expected pairs of keys and values but got {len(keys_and_values)} arguments\n")
+            return
+        self._transaction.set_many(zip(keys_and_values[::2], keys_and_values[1::2]))
+        self._output.write("OK\n")
+
+    def _mget(self, *keys):
+        if not keys:
+            self._output.write("ERROR: Expected at least 1 argument but got 0\n")
+            return
+        values = self._transaction.get_many(keys)
+        self._output.write(" ".join("(NULL)" if value is None else f"{value}" for value in values) + "\n")
+
+    def _munset(self, *keys):
+        if not keys:
+            self._output.write("ERROR: Expected at least 1 argument but got 0\n")
+            return
+        self._transaction.unset_many(keys)
+        self._output.write("OK\n")
+
+    def _scan(self, start, end, limit=None):
+        self._write_items(self._transaction.scan(start, end, self._parse_limit(limit)))
+
+    def _prefix(self, prefix, limit=None):
+        self._write_items(self._transaction.prefix(prefix, self._parse_limit(limit)))
+
+    @staticmethod
+    def _parse_limit(limit):
+        if limit is None:
+            return None
+        if not limit.isdigit():
+            raise ValueError(f"The limit must be a number but got '{limit}'")
+        return int(limit)
+
+    def _write_items(self, items):
+        line = " ".join(f"{key}={value}" for key, value in items)
+        self._output.write(f"{line or '(EMPTY)'}\n")
+
+    def _numequalto(self, value):
         number = self._transaction.number_of_keys_with_value(value)
         self._output.write(f"{number}\n")
 
-    def _end(self, line):
-        self._assert_number_of_arguments_equal_to(0, line)
+    def _stats(self):
+        metrics = self._system.metrics
+        statistics = {} if metrics is None else metrics.summary()
+        statistics.update(self._system.statistics())
+        for name, value in statistics.items():
+            # Only the quantiles are floats, counters and gauges are written with all their digits
+            self._output.write(f"{name} {value:g}\n" if isinstance(value, float) else f"{name} {value}\n")
+
+    def _end(self):
         self._is_still_running = False
         self._output.write("Good bye\n")
 
-    def _assert_number_of_arguments_equal_to(self, expected, line):
-        actual = len(line.split()) - 1
-        if actual != expected:
-            raise ValueError(f"Expected {expected} arguments but got {actual}")
+    # Number of arguments, a range of them or None for any, and handler of each command
+    COMMANDS = {
+        "BEGIN": (0, _begin),
+        "SET": ((2, 4), _set),
+        "EXPIRE": (2, _expire),
+        "GET": (1, _get),
+        "UNSET": (1, _unset),
+        "MSET": (None, _mset),
+        "MGET": (None, _mget),
+        "MUNSET": (None, _munset),
+        "SCAN": ((2, 3), _scan),
+        "PREFIX": ((1, 2), _prefix),
+        "NUMEQUALTO": (1, _numequalto),
+        "COMMIT": (0, _commit),
+        "ROLLBACK": (0, _rollback),
+        "STATS": (0, _stats),
+        "HELP": (None, _help),
+        "END": (0, _end),
+    }
 
 
 class NoTransaction:
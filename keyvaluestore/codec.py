@@ -0,0 +1,86 @@
+import struct
+
+from keyvaluestore.system import Transaction
+
+LENGTH = struct.Struct(">I")
+VERSION = struct.Struct(">Q")
+DEADLINE = struct.Struct(">d")
+
+DELETED = b"d"
+
+
+class UnsupportedValue(TypeError):
+    """Raised when a key or a value cannot be encoded"""
+
+
+_ENCODERS = {
+    str: (b"s", str.encode),
+    bytes: (b"b", bytes),
+    int: (b"i", lambda value: str(value).encode()),
+    float: (b"f", lambda value: repr(value).encode()),
+}
+
+_DECODERS = {
+    b"s": lambda data: str(data, "utf-8"),
+    b"b": bytes,
+    b"i": lambda data: int(bytes(data)),
+    b"f": lambda data: float(bytes(data)),
+}
+
+
+def encode_value(value) -> bytes:
+    if value is Transaction.TOMBSTONE:
+        return DELETED + LENGTH.pack(0)
+    try:
+        tag, encode = _ENCODERS[type(value)]
+    except KeyError:
+        raise UnsupportedValue(f"Cannot encode values of type {type(value).__name__}") from None
+    data = encode(value)
+    return tag + LENGTH.pack(len(data)) + data
+
+
+def decode_value(buffer, offset: int) -> tuple:
+    """Decode the value that starts at offset and return it with the offset where it ends"""
+    tag = bytes(buffer[offset : offset + 1])
+    (length,) = LENGTH.unpack_from(buffer, offset + 1)
+    start = offset + 1 + LENGTH.size
+    if tag == DELETED:
+        return Transaction.TOMBSTONE, start
+    return _DECODERS[tag](buffer[start : start + length]), start + length
+
+
+def encode_writes(writes) -> bytes:
+    parts = [LENGTH.pack(len(writes))]
+    for key, value in writes.items():
+        parts.append(encode_value(key))
+        parts.append(encode_value(value))
+    return b"".join(parts)
+
+
+def decode_writes(buffer, offset: int = 0) -> tuple:
+    (number_of_writes,) = LENGTH.unpack_from(buffer, offset)
+    offset += LENGTH.size
+    writes = {}
+    for _ in range(number_of_writes):
+        key, offset = decode_value(buffer, offset)
+        writes[key], offset = decode_value(buffer, offset)
+    return writes, offset
+
+
+def encode_deadlines(deadlines) -> bytes:
+    parts = [LENGTH.pack(len(deadlines))]
+    for key, deadline in deadlines.items():
+        parts.append(encode_value(key))
+        parts.append(DEADLINE.pack(deadline))
+    return b"".join(parts)
+
+
+def decode_deadlines(buffer, offset: int = 0) -> tuple:
+    (number_of_deadlines,) = LENGTH.unpack_from(buffer, offset)
+    offset += LENGTH.size
+    deadlines = {}
+    for _ in range(number_of_deadlines):
+        key, offset = decode_value(buffer, offset)
+        (deadlines[key],) = DEADLINE.unpack_from(buffer, offset)
+        offset += DEADLINE.size
+    return deadlines, offset
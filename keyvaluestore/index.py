@@ -0,0 +1,71 @@
+from bisect import bisect_left, bisect_right
+
+
+class SortedKeys:
+    """Set of keys kept in order, to iterate over ranges of them.
+
+    The keys are split in sorted buckets of up to ``2 * bucket_size`` keys,
+    so adding or removing one only shifts the keys of its bucket. The last
+    key of every bucket is kept in a separate list to find the bucket of a
+    key by bisection.
+    """
+
+    def __init__(self, keys=(), bucket_size=1000):
+        self._bucket_size = bucket_size
+        keys = sorted(set(keys))
+        self._buckets = [keys[start : start + bucket_size] for start in range(0, len(keys), bucket_size)]
+        self._last_keys = [bucket[-1] for bucket in self._buckets]
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+    def __contains__(self, key):
+        index = bisect_left(self._last_keys, key)
+        if index == len(self._buckets):
+            return False
+        bucket = self._buckets[index]
+        position = bisect_left(bucket, key)
+        return position < len(bucket) and bucket[position] == key
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._last_keys.append(key)
+            return
+        index = min(bisect_left(self._last_keys, key), len(self._buckets) - 1)
+        bucket = self._buckets[index]
+        position = bisect_left(bucket, key)
+        if position < len(bucket) and bucket[position] == key:
+            return
+        bucket.insert(position, key)
+        self._last_keys[index] = bucket[-1]
+        if len(bucket) > 2 * self._bucket_size:
+            self._buckets[index : index + 1] = [bucket[: self._bucket_size], bucket[self._bucket_size :]]
+            self._last_keys[index : index + 1] = [bucket[self._bucket_size - 1], bucket[-1]]
+
+    def discard(self, key):
+        index = bisect_left(self._last_keys, key)
+        if index == len(self._buckets):
+            return
+        bucket = self._buckets[index]
+        position = bisect_left(bucket, key)
+        if position == len(bucket) or bucket[position] != key:
+            return
+        del bucket[position]
+        if bucket:
+            self._last_keys[index] = bucket[-1]
+        else:
+            del self._buckets[index]
+            del self._last_keys[index]
+
+    def keys_from(self, start, number_of_keys, inclusive=True) -> list:
+        """Get up to number_of_keys keys in order from start, or from the first key if start is None"""
+        find = bisect_left if inclusive else bisect_right
+        index = 0 if start is None else find(self._last_keys, start)
+        keys = []
+        while index < len(self._buckets) and len(keys) < number_of_keys:
+            bucket = self._buckets[index]
+            position = 0 if start is None or keys else find(bucket, start)
+            keys.extend(bucket[position : position + number_of_keys - len(keys)])
+            index += 1
+        return keys
@@ -0,0 +1,284 @@
+import mmap
+import os
+import struct
+import zlib
+from collections import Counter
+
+from keyvaluestore.codec import LENGTH, VERSION, decode_value, encode_value
+from keyvaluestore.storage import LockStripes, Storage, update_count
+
+MAGIC = b"KVSHASH1"
+# Magic, whether the last change was completed, version of the last commit, number of slots, slots used by
+# keys or deleted keys, number of keys, end of the data and bytes of data that no slot points to anymore
+HEADER = struct.Struct(">8sQQQQQQQ")
+# Hash of the key and offset of its record, or one of the offsets below
+SLOT = struct.Struct(">IQ")
+EMPTY = 0
+DELETED = 1
+
+MINIMUM_NUMBER_OF_SLOTS = 1024
+# The data is compacted when more than half of it is garbage and there is at least this much garbage
+MINIMUM_GARBAGE_TO_COMPACT = 1 << 20
+
+
+class CorruptStorage(ValueError):
+    """Raised when a file was not written by MappedStorage"""
+
+
+class MappedStorage(Storage):
+    """Storage that keeps the keys in a memory-mapped file, so they do not need to fit in memory.
+
+    The file starts with a header and an open-addressing hash table with
+    linear probing, followed by the records that the slots point to. A
+    record is the version of a key followed by the key and its value, as
+    encoded in the log. Records are never changed: writing a key appends a
+    new record and points its slot to it, so reads do not lock. When half
+    the slots are used, or half the records are garbage, the file is
+    rewritten with only the records in use. Readers keep reading the
+    mapping they started with.
+
+    Opening the file only maps it. The number of keys per value is counted
+    the first time it is asked for and kept up to date after that.
+
+    Changes reach the file through the page cache, so they survive the
+    process, but only a write-ahead log makes them survive a crash of the
+    machine.
+    """
+
+    def __init__(self, path, number_of_lock_stripes=64):
+        self._path = path
+        self._key_locks = LockStripes(number_of_lock_stripes)
+        self._value_counts = None
+        if not os.path.exists(path):
+            self._write_file(MINIMUM_NUMBER_OF_SLOTS, last_version=0, records=())
+        self._open()
+
+    def _open(self):
+        self._file = open(self._path, "r+b")
+        mapped = mmap.mmap(self._file.fileno(), 0)
+        if len(mapped) < HEADER.size or mapped[: len(MAGIC)] != MAGIC:
+            mapped.close()
+            self._file.close()
+            raise CorruptStorage(self._path)
+        (
+            _,
+            is_clean,
+            self._last_version,
+            number_of_slots,
+            self._used_slots,
+            self._number_of_keys,
+            self._data_end,
+            self._garbage,
+        ) = HEADER.unpack_from(mapped)
+        # The number of slots is read with the mapping, so readers never mix a mapping with another table
+        self._mapping = (mapped, number_of_slots)
+        if not is_clean:
+            self._count_slots()
+
+    def _write_header(self, is_clean):
+        mapped, number_of_slots = self._mapping
+        HEADER.pack_into(
+            mapped,
+            0,
+            MAGIC,
+            is_clean,
+            self._last_version,
+            number_of_slots,
+            self._used_slots,
+            self._number_of_keys,
+            self._data_end,
+            self._garbage,
+        )
+
+    def _count_slots(self):
+        # The process stopped in the middle of a change, so the counters of the header can be wrong
+        mapped, number_of_slots = self._mapping
+        self._used_slots = self._number_of_keys = 0
+        live_data = 0
+        for _, offset in SLOT.iter_unpack(mapped[HEADER.size : data_start(number_of_slots)]):
+            if offset != EMPTY:
+                self._used_slots += 1
+            if offset > DELETED:
+                self._number_of_keys += 1
+                live_data += _record_end(mapped, offset) - offset
+        self._garbage = self._data_end - data_start(number_of_slots) - live_data
+        self._write_header(is_clean=True)
+
+    def _write_file(self, number_of_slots, last_version, records):
+        """Write a new file with the given (hash, record) pairs and replace the current one"""
+        table = bytearray(SLOT.size * number_of_slots)
+        data_end = data_start(number_of_slots)
+        number_of_keys = 0
+        temporary_path = f"{self._path}.tmp"
+        with open(temporary_path, "wb", buffering=1 << 20) as new_file:
+            new_file.write(bytes(HEADER.size + len(table)))
+            for key_hash, record in records:
+                index = key_hash % number_of_slots
+                while SLOT.unpack_from(table, index * SLOT.size)[1] != EMPTY:
+                    index = (index + 1) % number_of_slots
+                SLOT.pack_into(table, index * SLOT.size, key_hash, data_end)
+                new_file.write(record)
+                data_end += len(record)
+                number_of_keys += 1
+            new_file.seek(0)
+            new_file.write(
+                HEADER.pack(MAGIC, True, last_version, number_of_slots, number_of_keys, number_of_keys, data_end, 0)
+            )
+            new_file.write(table)
+        os.replace(temporary_path, self._path)
+
+    def _rewrite(self, number_of_new_keys):
+        mapped, _ = self._mapping
+        number_of_slots = MINIMUM_NUMBER_OF_SLOTS
+        while (self._number_of_keys + number_of_new_keys) * 4 > number_of_slots:
+            number_of_slots *= 2
+        records = (
+            (key_hash, mapped[offset : _record_end(mapped, offset)]) for key_hash, offset in self._used_records()
+        )
+        self._write_file(number_of_slots, self._last_version, records)
+        self._file.close()
+        self._open()
+
+    def _used_records(self):
+        mapped, number_of_slots = self._mapping
+        for key_hash, offset in SLOT.iter_unpack(mapped[HEADER.size : data_start(number_of_slots)]):
+            if offset > DELETED:
+                yield key_hash, offset
+
+    def get(self, key):
+        mapped, number_of_slots = self._mapping
+        encoded_key = encode_value(key)
+        offset = find_slot(mapped, number_of_slots, encoded_key, zlib.crc32(encoded_key))[1]
+        if offset is None:
+            return None
+        (version,) = VERSION.unpack_from(mapped, offset)
+        return version, decode_value(mapped, offset + VERSION.size + len(encoded_key))[0]
+
+    def set(self, key, version, value):
+        self.apply(version, {key: value}, [])
+
+    def delete(self, key):
+        self.apply(0, {}, [key])
+
+    def apply(self, version, values, deleted_keys):
+        data_size = self._data_end - data_start(self._mapping[1])
+        if (self._used_slots + len(values)) * 2 > self._mapping[1] or (
+            self._garbage > MINIMUM_GARBAGE_TO_COMPACT and self._garbage * 2 > data_size
+        ):
+            self._rewrite(len(values))
+        self._write_header(is_clean=False)
+        # The records are written first, and the slots are pointed to them once the data end covers them
+        encoded_keys = [encode_value(key) for key in values]
+        encoded_version = VERSION.pack(version)
+        records = [encoded_version + key + encode_value(value) for key, value in zip(encoded_keys, values.values())]
+        offset = self._append(b"".join(records))
+        mapped, number_of_slots = self._mapping
+        for encoded_key, record, value in zip(encoded_keys, records, values.values()):
+            key_hash = zlib.crc32(encoded_key)
+            index, previous_offset = find_slot(mapped, number_of_slots, encoded_key, key_hash)
+            if previous_offset is None:
+                if SLOT.unpack_from(mapped, _slot_position(index))[1] == EMPTY:
+                    self._used_slots += 1
+                self._number_of_keys += 1
+            else:
+                self._forget(mapped, previous_offset, len(encoded_key))
+            if self._value_counts is not None:
+                update_count(self._value_counts, value, 1)
+            SLOT.pack_into(mapped, _slot_position(index), key_hash, offset)
+            offset += len(record)
+        for key in deleted_keys:
+            encoded_key = encode_value(key)
+            key_hash = zlib.crc32(encoded_key)
+            index, previous_offset = find_slot(mapped, number_of_slots, encoded_key, key_hash)
+            if previous_offset is not None:
+                self._forget(mapped, previous_offset, len(encoded_key))
+                self._number_of_keys -= 1
+                SLOT.pack_into(mapped, _slot_position(index), key_hash, DELETED)
+        self._write_header(is_clean=True)
+
+    def _append(self, data):
+        mapped, number_of_slots = self._mapping
+        offset = self._data_end
+        if offset + len(data) > len(mapped):
+            size = max(len(mapped) * 2, offset + len(data))
+            os.ftruncate(self._file.fileno(), size)
+            # The old mapping is left to the readers that still use it
+            mapped = mmap.mmap(self._file.fileno(), size)
+            self._mapping = (mapped, number_of_slots)
+        mapped[offset : offset + len(data)] = data
+        self._data_end = offset + len(data)
+        self._write_header(is_clean=False)
+        return offset
+
+    def _forget(self, mapped, offset, key_length):
+        """Account for a record that no slot will point to"""
+        self._garbage += _record_end(mapped, offset) - offset
+        if self._value_counts is not None:
+            value, _ = decode_value(mapped, offset + VERSION.size + key_length)
+            update_count(self._value_counts, value, -1)
+
+    def number_of_keys_with_value(self, a_value):
+        if self._value_counts is None:
+            mapped, _ = self._mapping
+            self._value_counts = Counter(
+                decode_value(mapped, value_start(mapped, offset))[0] for _, offset in self._used_records()
+            )
+        return self._value_counts[a_value]
+
+    def keys(self):
+        mapped, _ = self._mapping
+        return [decode_value(mapped, offset + VERSION.size)[0] for _, offset in self._used_records()]
+
+    def locking(self, keys):
+        return self._key_locks.locking(keys)
+
+    def last_version(self):
+        return self._last_version
+
+    def set_last_version(self, version):
+        self._last_version = version
+        self._write_header(is_clean=True)
+
+    def close(self):
+        mapped, _ = self._mapping
+        mapped.flush()
+        mapped.close()
+        self._file.close()
+
+
+def find_slot(mapped, number_of_slots, encoded_key, key_hash):
+    """Return the index of the slot of the key, or of the first free slot for it, and the offset of its record"""
+    index = key_hash % number_of_slots
+    free_index = None
+    key_start = VERSION.size
+    key_end = key_start + len(encoded_key)
+    unpack_slot = SLOT.unpack_from
+    while True:
+        slot_hash, offset = unpack_slot(mapped, HEADER.size + index * SLOT.size)
+        if offset == EMPTY:
+            return (index if free_index is None else free_index), None
+        if offset == DELETED:
+            if free_index is None:
+                free_index = index
+        elif slot_hash == key_hash and mapped[offset + key_start : offset + key_end] == encoded_key:
+            return index, offset
+        index = (index + 1) % number_of_slots
+
+
+def _slot_position(index):
+    return HEADER.size + index * SLOT.size
+
+
+def data_start(number_of_slots):
+    return _slot_position(number_of_slots)
+
+
+def value_start(mapped, offset):
+    (key_length,) = LENGTH.unpack_from(mapped, offset + VERSION.size + 1)
+    return offset + VERSION.size + 1 + LENGTH.size + key_length
+
+
+def _record_end(mapped, offset):
+    start = value_start(mapped, offset)
+    (value_length,) = LENGTH.unpack_from(mapped, start + 1)
+    return start + 1 + LENGTH.size + value_length
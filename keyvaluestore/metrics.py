@@ -0,0 +1,134 @@
+"""Counters and latency histograms of a KeyValueStoreSystem.
+
+A system records metrics only when it is created with a ``Metrics``, in
+which case ``begin`` returns transactions that measure themselves, so
+without one the transactions run exactly the same code as before.
+"""
+import math
+import threading
+from bisect import bisect_left
+
+# From about a microsecond to 16 seconds, and from 1 to about a million writes
+LATENCY_BUCKETS = tuple(2.0**exponent for exponent in range(-20, 5))
+SIZE_BUCKETS = tuple(float(4**exponent) for exponent in range(11))
+
+PROMETHEUS_PREFIX = "keyvaluestore"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Number of observations up to each bound, plus one for those above the last"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, quantile: float) -> float:
+        """Upper bound of the bucket of the observation at that quantile"""
+        if not self.count:
+            return 0.0
+        rank = quantile * self.count
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return math.inf
+
+
+class Metrics:
+    """What the transactions of a system did, shared by all their threads"""
+
+    COUNTERS = ("transactions", "commits", "conflicts", "rollbacks", "expired_keys")
+    HISTOGRAMS = {
+        "get_seconds": LATENCY_BUCKETS,
+        "commit_seconds": LATENCY_BUCKETS,
+        "numequalto_seconds": LATENCY_BUCKETS,
+        "transaction_writes": SIZE_BUCKETS,
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(Metrics.COUNTERS, 0)
+        self.histograms = {name: Histogram(bounds) for name, bounds in Metrics.HISTOGRAMS.items()}
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, name, value):
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    def summary(self) -> dict:
+        """The counters and the count, median and 99th percentile of every histogram"""
+        with self._lock:
+            summary = dict(self.counters)
+            for name, histogram in self.histograms.items():
+                summary[f"{name}_count"] = histogram.count
+                summary[f"{name}_p50"] = histogram.quantile(0.5)
+                summary[f"{name}_p99"] = histogram.quantile(0.99)
+        return summary
+
+    def to_prometheus(self, gauges=None) -> str:
+        """The metrics, and the given gauges, in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            for name, value in self.counters.items():
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter")
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}_total {value}")
+            for name, histogram in self.histograms.items():
+                lines.extend(_histogram_lines(f"{PROMETHEUS_PREFIX}_{name}", histogram))
+        lines.extend(_gauge_lines(gauges or {}))
+        return "\n".join(lines) + "\n"
+
+
+def _gauge_lines(gauges):
+    for name, value in gauges.items():
+        yield f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge"
+        yield f"{PROMETHEUS_PREFIX}_{name} {value}"
+
+
+def _histogram_lines(name, histogram):
+    yield f"# TYPE {name} histogram"
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        yield f'{name}_bucket{{le="{bound!r}"}} {cumulative}'
+    yield f'{name}_bucket{{le="+Inf"}} {histogram.count}'
+    yield f"{name}_sum {histogram.sum!r}"
+    yield f"{name}_count {histogram.count}"
+
+
+def start_metrics_server(render, host="127.0.0.1", port=9379):
+    """Serve the text returned by render at /metrics, from a thread of its own"""
+    # Imported here, since http.server brings the email package along, a few megabytes that only this needs
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,91 @@
+class ReadSet:
+    """What a serializable transaction read, to find out at commit whether a later commit changed it.
+
+    Keys are kept in a set until there are ``MAX_KEYS`` of them, and then
+    in a bloom filter, which keeps the memory of large read sets bounded at
+    the cost of a few conflicts for keys that were not read. Scans keep
+    their range and NUMEQUALTO its value, so commits that add or remove a
+    key with that value, or in that range, conflict too.
+    """
+
+    __slots__ = ("_keys", "_bloom_filter", "_ranges", "_prefixes", "_values")
+
+    MAX_KEYS = 1 << 14
+
+    def __init__(self):
+        self._keys = set()
+        self._bloom_filter = None
+        self._ranges = []
+        self._prefixes = []
+        self._values = set()
+
+    def __bool__(self):
+        return bool(self._keys or self._bloom_filter or self._ranges or self._prefixes or self._values)
+
+    def add_key(self, key):
+        if self._bloom_filter is not None:
+            self._bloom_filter.add(key)
+            return
+        self._keys.add(key)
+        if len(self._keys) > ReadSet.MAX_KEYS:
+            self._bloom_filter = BloomFilter()
+            for key in self._keys:
+                self._bloom_filter.add(key)
+            self._keys = set()
+
+    def add_keys(self, keys):
+        for key in keys:
+            self.add_key(key)
+
+    def add_range(self, start, end):
+        self._ranges.append((start, end))
+
+    def add_prefix(self, prefix):
+        self._prefixes.append(prefix)
+
+    def add_value(self, value):
+        self._values.add(value)
+
+    def is_changed_by(self, written_keys, value_count_deltas) -> bool:
+        """Whether a commit that wrote those keys and changed those counts of values changed what was read"""
+        if any(value_count_deltas[value] for value in self._values):
+            return True
+        keys = self._bloom_filter if self._bloom_filter is not None else self._keys
+        for key in written_keys:
+            if key in keys:
+                return True
+            for start, end in self._ranges:
+                if (start is None or key >= start) and (end is None or key < end):
+                    return True
+            for prefix in self._prefixes:
+                if key.startswith(prefix):
+                    return True
+        return False
+
+
+class BloomFilter:
+    """Set that can tell that a key is not in it, but only that it may be"""
+
+    __slots__ = ("_bits",)
+
+    # With 4 hashes, one in about 40 keys that were not added are found in it after adding a million keys
+    NUMBER_OF_BITS = 1 << 23
+    NUMBER_OF_HASHES = 4
+
+    def __init__(self):
+        self._bits = bytearray(BloomFilter.NUMBER_OF_BITS // 8)
+
+    def add(self, key):
+        for position in _positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in _positions(key))
+
+
+def _positions(key):
+    # Double hashing, as good as independent hashes for a bloom filter
+    first_hash = hash(key)
+    second_hash = hash((key, 1)) | 1
+    for number in range(BloomFilter.NUMBER_OF_HASHES):
+        yield (first_hash + number * second_hash) % BloomFilter.NUMBER_OF_BITS
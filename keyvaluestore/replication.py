@@ -0,0 +1,203 @@
+"""Replication of the commits of a KeyValueStoreSystem, the leader, to followers over TCP.
+
+A follower that connects gets a snapshot of the leader, in the format of
+SnapshotFile, and then the record of every later commit, in the format
+of the write-ahead log, in commit order. The leader starts to queue the
+commits for a follower before it takes the snapshot, so none is lost
+between both, and the follower skips the ones the snapshot has.
+
+Followers apply every commit with the version it had in the leader, so
+a follower at some version has exactly what the leader had then, and
+``wait_for`` lets a client read its own writes from a follower. Commits
+are streamed as soon as the leader applies them, which is once its log
+made them durable.
+"""
+import os
+import queue
+import socket
+import struct
+import tempfile
+import threading
+import zlib
+from typing import Optional
+
+from keyvaluestore.snapshot import SnapshotFile
+from keyvaluestore.storage import Storage
+from keyvaluestore.system import KeyValueStoreSystem
+from keyvaluestore.wal import FRAME, decode_record, encode_record
+
+# Size of the snapshot that starts the stream
+SNAPSHOT_SIZE = struct.Struct(">Q")
+
+
+class ReplicationError(ConnectionError):
+    """Raised when the stream of the leader ends or is corrupt"""
+
+
+class ReplicationLeader:
+    """Listener for the followers of a system, with a thread that streams its commits to each one.
+
+    A follower that cannot keep up makes its queue grow, and one that
+    disconnects is forgotten: it has to start again from a new snapshot.
+    """
+
+    def __init__(self, system: KeyValueStoreSystem, host="127.0.0.1", port=7380):
+        self._system = system
+        self._listener = socket.create_server((host, port))
+        self.address = self._listener.getsockname()
+        self._queues = []
+        self._lock = threading.Lock()
+        self._is_closed = False
+        self._acceptor = threading.Thread(target=self._accept_followers, daemon=True)
+        self._acceptor.start()
+
+    def _accept_followers(self):
+        while True:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_follower, args=(connection,), daemon=True).start()
+
+    def _serve_follower(self, connection):
+        commits = queue.SimpleQueue()
+
+        def enqueue(version, writes, deadlines):
+            commits.put((version, writes, deadlines))
+
+        with self._lock:
+            if self._is_closed:
+                connection.close()
+                return
+            self._queues.append(commits)
+        self._system.add_commit_listener(enqueue)
+        try:
+            with connection:
+                version = self._send_snapshot(connection)
+                while True:
+                    # The commits queued while the previous ones were sent are sent together
+                    batch = [commits.get()]
+                    while not commits.empty():
+                        batch.append(commits.get())
+                    records = [encode_record(*commit) for commit in batch if commit is not None and commit[0] > version]
+                    if records:
+                        connection.sendall(b"".join(records))
+                    if None in batch:
+                        return
+        except OSError:
+            pass
+        finally:
+            self._system.remove_commit_listener(enqueue)
+            with self._lock:
+                self._queues.remove(commits)
+
+    def _send_snapshot(self, connection) -> int:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot")
+            version = self._system.write_snapshot(SnapshotFile(path))
+            with open(path, "rb") as snapshot:
+                connection.sendall(SNAPSHOT_SIZE.pack(os.path.getsize(path)))
+                connection.sendfile(snapshot)
+        return version
+
+    def close(self):
+        with self._lock:
+            self._is_closed = True
+            for commits in self._queues:
+                commits.put(None)
+        try:
+            # Closing the socket does not wake up the thread blocked in accept
+            self._listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._listener.close()
+        self._acceptor.join()
+
+
+class ReplicationFollower:
+    """Read-only copy of the system of a leader, kept up to date by a thread of its own.
+
+    The follower starts from the snapshot sent by the leader, so creating
+    it waits for the whole snapshot. Its system raises ``ReadOnly`` on any
+    commit with writes.
+    """
+
+    RECEIVE_BUFFER_SIZE = 1 << 20
+
+    def __init__(self, host, port, storage: Optional[Storage] = None):
+        self._connection = socket.create_connection((host, port))
+        self._stream = self._connection.makefile("rb", buffering=ReplicationFollower.RECEIVE_BUFFER_SIZE)
+        self._condition = threading.Condition()
+        self.error = None
+        try:
+            self.system = self._receive_snapshot(storage)
+        except BaseException:
+            self._close_connection()
+            raise
+        self._receiver = threading.Thread(target=self._receive_commits, daemon=True)
+        self._receiver.start()
+
+    def _receive_snapshot(self, storage) -> KeyValueStoreSystem:
+        (size,) = SNAPSHOT_SIZE.unpack(self._read(SNAPSHOT_SIZE.size))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot")
+            with open(path, "wb") as snapshot:
+                while size:
+                    chunk = self._stream.read(min(size, ReplicationFollower.RECEIVE_BUFFER_SIZE))
+                    if not chunk:
+                        raise ReplicationError("The leader closed the connection in the middle of the snapshot")
+                    snapshot.write(chunk)
+                    size -= len(chunk)
+            return KeyValueStoreSystem(storage, snapshot_file=SnapshotFile(path), read_only=True)
+
+    def _receive_commits(self):
+        try:
+            while True:
+                length, checksum = FRAME.unpack(self._read(FRAME.size))
+                payload = self._read(length)
+                if zlib.crc32(payload) != checksum:
+                    raise ReplicationError("Corrupt record")
+                self.system.replicate(*decode_record(payload))
+                with self._condition:
+                    self._condition.notify_all()
+        except (OSError, ValueError) as error:
+            with self._condition:
+                self.error = error
+                self._condition.notify_all()
+
+    def _read(self, size) -> bytes:
+        data = self._stream.read(size)
+        if len(data) < size:
+            raise ReplicationError("The leader closed the connection")
+        return data
+
+    @property
+    def position(self) -> int:
+        """Version of the last commit of the leader applied"""
+        return self.system.last_commit
+
+    def wait_for(self, version: int, timeout: Optional[float] = None) -> bool:
+        """Wait until the commit of the leader with that version is applied, or the stream stops"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.position >= version or self.error is not None, timeout)
+            return self.position >= version
+
+    def begin(self):
+        return self.system.begin()
+
+    def close(self):
+        self._shut_down_connection()
+        self._receiver.join()
+        self._close_connection()
+        self.system.end()
+
+    def _shut_down_connection(self):
+        # Wakes up the receiver, which has to return before the stream it reads is closed
+        try:
+            self._connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _close_connection(self):
+        self._stream.close()
+        self._connection.close()
@@ -0,0 +1,140 @@
+import asyncio
+from collections import deque
+
+from keyvaluestore.cli import KeyValueStoreCLI
+from keyvaluestore.system import KeyValueStoreSystem
+
+MAX_LINE_LENGTH = 1 << 20
+
+
+class ResponseBuffer:
+    """Output of a KeyValueStoreCLI that collects what it writes until it is sent"""
+
+    __slots__ = ("_parts",)
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, text):
+        self._parts.append(text)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        text = "".join(self._parts)
+        self._parts.clear()
+        return text.encode()
+
+
+class KeyValueStoreProtocol(asyncio.Protocol):
+    """One client connection, speaking the same line protocol as the CLI.
+
+    Every connection has its own transaction, created with the CLI on the
+    first command, so idle connections only hold the transport and this
+    object. The commands that arrive together are executed together and their
+    responses are sent with a single write.
+
+    With a write-ahead log, COMMIT waits for it, so it runs in the default
+    executor of the loop, which serves the other connections meanwhile and
+    lets their commits share the sync of the log. The connection stops
+    reading until its commit ends, and the commands after it wait for it.
+    Without a log, commits do not wait and run in the loop like the rest.
+    """
+
+    __slots__ = (
+        "_system",
+        "_transport",
+        "_cli",
+        "_responses",
+        "_received",
+        "_lines",
+        "_is_committing",
+        "_is_writing_paused",
+    )
+
+    ERROR_LINE_TOO_LONG = "ERROR: Line too long\n"
+
+    def __init__(self, system: KeyValueStoreSystem):
+        self._system = system
+        self._transport = None
+        self._cli = None
+        self._responses = None
+        self._received = b""
+        self._lines = deque()
+        self._is_committing = False
+        self._is_writing_paused = False
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def data_received(self, data):
+        lines = (self._received + data).split(b"\n")
+        self._received = lines.pop()
+        if len(self._received) > MAX_LINE_LENGTH:
+            self._transport.write(KeyValueStoreProtocol.ERROR_LINE_TOO_LONG.encode())
+            self._transport.close()
+            return
+        if not lines:
+            return
+        if self._cli is None:
+            self._responses = ResponseBuffer()
+            self._cli = KeyValueStoreCLI(self._system, cli_output=self._responses)
+        self._lines.extend(lines)
+        if not self._is_committing:
+            self._execute_lines()
+
+    def _execute_lines(self):
+        while self._lines:
+            line = self._lines.popleft().decode(errors="replace")
+            command = line.split(maxsplit=1)[:1] if self._system.has_log else None
+            if command and command[0].upper() == "COMMIT":
+                self._is_committing = True
+                self._transport.pause_reading()
+                self._transport.write(self._responses.take())
+                commit = asyncio.get_running_loop().run_in_executor(None, self._cli.execute, line)
+                commit.add_done_callback(self._end_commit)
+                return
+            self._cli.execute(line)
+            if not self._cli.is_still_running:
+                break
+        self._transport.write(self._responses.take())
+        if not self._cli.is_still_running:
+            self._transport.close()
+
+    def _end_commit(self, commit):
+        try:
+            commit.result()
+        except BaseException:
+            self._transport.close()
+            raise
+        if self._cli is None:
+            return
+        self._is_committing = False
+        if not self._is_writing_paused:
+            self._transport.resume_reading()
+        self._execute_lines()
+
+    def pause_writing(self):
+        self._is_writing_paused = True
+        self._transport.pause_reading()
+
+    def resume_writing(self):
+        self._is_writing_paused = False
+        if not self._is_committing:
+            self._transport.resume_reading()
+
+    def connection_lost(self, exc):
+        self._cli = None
+        self._responses = None
+
+
+async def start_server(system: KeyValueStoreSystem, host, port) -> asyncio.Server:
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(lambda: KeyValueStoreProtocol(system), host, port, backlog=1024)
+
+
+async def serve(system: KeyValueStoreSystem, host="127.0.0.1", port=7379):
+    server = await start_server(system, host, port)
+    async with server:
+        await server.serve_forever()
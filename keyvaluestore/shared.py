@@ -0,0 +1,276 @@
+"""Snapshots of a KeyValueStoreSystem in shared memory, for readers in other processes.
+
+The process that owns the system publishes its committed state with
+``SharedSnapshots.publish``, and any number of processes read it with a
+``SharedSnapshotReader`` or a ``ReaderPool``, without the GIL of the writer
+and without copying more than the values they read.
+
+A snapshot is a segment of shared memory laid out like the file of a
+MappedStorage, a header and a hash table of the keys followed by their
+records, with a second table after the records that has the number of
+keys of each value. Segments are never changed: a small control block
+has the name of the newest one, behind a sequence number that is odd
+while it is being changed, and every publication creates a new segment
+and unlinks the previous one. Readers that still have the previous one
+mapped keep reading it, and move to the new one with their next read.
+"""
+import multiprocessing
+import os
+import struct
+import sys
+import threading
+import zlib
+from collections import Counter
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Optional
+
+from keyvaluestore.codec import VERSION, decode_value, encode_value
+from keyvaluestore.mapped import EMPTY, HEADER, MAGIC, MINIMUM_NUMBER_OF_SLOTS, SLOT, data_start, find_slot
+from keyvaluestore.system import KeyValueStoreSystem
+
+# Sequence number, odd while the rest changes, followed by the version of the snapshot and the name of its segment
+SEQUENCE = struct.Struct(">Q")
+PUBLISHED = struct.Struct(">Q64s")
+CONTROL = struct.Struct(">Q" + PUBLISHED.format[1:])
+# Number of slots of the table of values, after the records of the keys
+VALUE_TABLE_HEADER = struct.Struct(">Q")
+# Hash of the value, offset of the value and number of keys with it
+VALUE_SLOT = struct.Struct(">IQQ")
+
+
+class SharedSnapshots:
+    """Publisher of the snapshots of a system, under the name of its control block.
+
+    Only one process publishes, but it can do it from any thread. The
+    segments live until ``close``, so a publisher that crashes leaves them
+    behind, as files in /dev/shm on Linux.
+    """
+
+    def __init__(self, system: KeyValueStoreSystem, name: Optional[str] = None):
+        self._system = system
+        self._control = _shared_memory(name, create=True, size=CONTROL.size)
+        self._segment = None
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self.publish()
+
+    @property
+    def name(self) -> str:
+        return self._control.name
+
+    @property
+    def version(self) -> int:
+        return CONTROL.unpack_from(self._control.buf)[1]
+
+    def publish(self) -> int:
+        """Publish the last commit, unless it is already published, and return its version"""
+        with self._lock:
+            snapshot = self._system.take_snapshot()
+            try:
+                if self._segment is not None and snapshot == self.version:
+                    return snapshot
+                segment = _write_segment(f"{self.name}_{snapshot}", snapshot, self._system.items(snapshot))
+            finally:
+                self._system.release_snapshot(snapshot)
+            self._sequence += 1
+            SEQUENCE.pack_into(self._control.buf, 0, self._sequence)
+            PUBLISHED.pack_into(self._control.buf, SEQUENCE.size, snapshot, segment.name.encode())
+            self._sequence += 1
+            SEQUENCE.pack_into(self._control.buf, 0, self._sequence)
+            if self._segment is not None:
+                _unlink(self._segment)
+            self._segment = segment
+            return snapshot
+
+    def close(self):
+        with self._lock:
+            _unlink(self._segment)
+            _unlink(self._control)
+
+
+class SharedSnapshotReader:
+    """Reads of the newest snapshot published under a name, from any process"""
+
+    def __init__(self, name: str):
+        self._control = _shared_memory(name)
+        self._sequence = None
+        self._segment = None
+        self._buffer = None
+        self._number_of_slots = 0
+        self._value_table_start = 0
+        self._number_of_value_slots = 0
+        self.version = 0
+
+    def get(self, key, default_if_key_does_not_exist: Any = KeyError):
+        self._refresh()
+        encoded_key = encode_value(key)
+        offset = find_slot(self._buffer, self._number_of_slots, encoded_key, zlib.crc32(encoded_key))[1]
+        if offset is None:
+            if default_if_key_does_not_exist is KeyError:
+                raise KeyError(key)
+            return default_if_key_does_not_exist
+        return decode_value(self._buffer, offset + VERSION.size + len(encoded_key))[0]
+
+    def number_of_keys_with_value(self, a_value) -> int:
+        self._refresh()
+        encoded_value = encode_value(a_value)
+        value_hash = zlib.crc32(encoded_value)
+        index = value_hash % self._number_of_value_slots
+        while True:
+            slot_hash, offset, number_of_keys = VALUE_SLOT.unpack_from(
+                self._buffer, self._value_table_start + index * VALUE_SLOT.size
+            )
+            if offset == EMPTY:
+                return 0
+            if slot_hash == value_hash and self._buffer[offset : offset + len(encoded_value)] == encoded_value:
+                return number_of_keys
+            index = (index + 1) % self._number_of_value_slots
+
+    def _refresh(self):
+        # Checking that nothing was published is a single read of the sequence number
+        if SEQUENCE.unpack_from(self._control.buf)[0] == self._sequence:
+            return
+        while True:
+            sequence, version, name = CONTROL.unpack_from(self._control.buf)
+            if sequence % 2 or SEQUENCE.unpack_from(self._control.buf)[0] != sequence:
+                continue
+            try:
+                segment = _shared_memory(name.rstrip(b"\0").decode())
+            except FileNotFoundError:
+                # It was replaced and unlinked before it could be opened
+                continue
+            break
+        self._close_segment()
+        self._segment = segment
+        self._buffer = segment.buf
+        self._number_of_slots, _, _, data_end = HEADER.unpack_from(self._buffer)[3:7]
+        (self._number_of_value_slots,) = VALUE_TABLE_HEADER.unpack_from(self._buffer, data_end)
+        self._value_table_start = data_end + VALUE_TABLE_HEADER.size
+        self._sequence = sequence
+        self.version = version
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._buffer = None
+            self._segment.close()
+            self._segment = None
+
+    def close(self):
+        self._close_segment()
+        self._control.close()
+
+
+class ReaderPool:
+    """Processes that read the snapshots published under a name, to read with more than one core.
+
+    The keys of a ``get_many`` are split between the processes, which can
+    read different snapshots if one is published meanwhile.
+    """
+
+    def __init__(self, name: str, processes: Optional[int] = None):
+        self._processes = processes or os.cpu_count()
+        context = multiprocessing.get_context("spawn")
+        self._pool = context.Pool(self._processes, initializer=_start_reader, initargs=(name,))
+
+    def get_many(self, keys, default_if_key_does_not_exist: Any = None) -> list:
+        keys = list(keys)
+        chunk_size = -(-len(keys) // self._processes) or 1
+        chunks = [keys[start : start + chunk_size] for start in range(0, len(keys), chunk_size)]
+        arguments = [(chunk, default_if_key_does_not_exist) for chunk in chunks]
+        return [value for values in self._pool.starmap(_get_many, arguments) for value in values]
+
+    def number_of_keys_with_value(self, a_value) -> int:
+        return self._pool.apply(_number_of_keys_with_value, (a_value,))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+_reader: Optional[SharedSnapshotReader] = None
+
+
+def _start_reader(name):
+    global _reader
+    _reader = SharedSnapshotReader(name)
+
+
+def _get_many(keys, default_if_key_does_not_exist):
+    return [_reader.get(key, default_if_key_does_not_exist) for key in keys]
+
+
+def _number_of_keys_with_value(a_value):
+    return _reader.number_of_keys_with_value(a_value)
+
+
+def _shared_memory(name, create=False, size=0) -> SharedMemory:
+    # The publisher unlinks the segments, not the resource tracker when the first process that used them ends
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name, create, size, track=False)
+    shared_memory = SharedMemory(name, create, size)
+    if os.name == "posix":
+        resource_tracker.unregister(shared_memory._name, "shared_memory")
+    return shared_memory
+
+
+def _unlink(shared_memory: SharedMemory):
+    shared_memory.close()
+    if sys.version_info < (3, 13) and os.name == "posix":
+        # Before Python 3.13 unlink also unregisters the segment, which the tracker must know then
+        resource_tracker.register(shared_memory._name, "shared_memory")
+    shared_memory.unlink()
+
+
+def _write_segment(name, version, items) -> SharedMemory:
+    records = []
+    value_counts = Counter()
+    for key, value in items:
+        encoded_key = encode_value(key)
+        records.append((zlib.crc32(encoded_key), VERSION.pack(version) + encoded_key + encode_value(value)))
+        value_counts[value] += 1
+    encoded_values = [encode_value(value) for value in value_counts]
+    number_of_slots = _number_of_slots(len(records))
+    number_of_value_slots = _number_of_slots(len(encoded_values))
+    data_end = data_start(number_of_slots) + sum(len(record) for _, record in records)
+    values_start = data_end + VALUE_TABLE_HEADER.size + number_of_value_slots * VALUE_SLOT.size
+    size = values_start + sum(len(encoded_value) for encoded_value in encoded_values)
+    segment = _shared_memory(name, create=True, size=size)
+    buffer = segment.buf
+    HEADER.pack_into(buffer, 0, MAGIC, True, version, number_of_slots, len(records), len(records), data_end, 0)
+    offset = data_start(number_of_slots)
+    for key_hash, record in records:
+        _pack_into_free_slot(buffer, SLOT, HEADER.size, number_of_slots, key_hash, offset)
+        buffer[offset : offset + len(record)] = record
+        offset += len(record)
+    VALUE_TABLE_HEADER.pack_into(buffer, data_end, number_of_value_slots)
+    value_table_start = data_end + VALUE_TABLE_HEADER.size
+    offset = values_start
+    for encoded_value, number_of_keys in zip(encoded_values, value_counts.values()):
+        value_hash = zlib.crc32(encoded_value)
+        _pack_into_free_slot(buffer, VALUE_SLOT, value_table_start, number_of_value_slots, value_hash, offset, number_of_keys)
+        buffer[offset : offset + len(encoded_value)] = encoded_value
+        offset += len(encoded_value)
+    del buffer
+    return segment
+
+
+def _number_of_slots(number_of_entries):
+    # Tables are never changed once written, so they can be fuller than those of MappedStorage
+    number_of_slots = MINIMUM_NUMBER_OF_SLOTS
+    while number_of_entries * 2 > number_of_slots:
+        number_of_slots *= 2
+    return number_of_slots
+
+
+def _pack_into_free_slot(buffer, slot, table_start, number_of_slots, entry_hash, *fields):
+    index = entry_hash % number_of_slots
+    while slot.unpack_from(buffer, table_start + index * slot.size)[1] != EMPTY:
+        index = (index + 1) % number_of_slots
+    slot.pack_into(buffer, table_start + index * slot.size, entry_hash, *fields)
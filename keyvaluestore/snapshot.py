@@ -0,0 +1,70 @@
+import mmap
+import os
+import struct
+
+from keyvaluestore.codec import decode_deadlines, decode_value, encode_deadlines, encode_value
+
+MAGIC = b"KVSSNAP2"
+# Magic, version of the last commit in the snapshot and number of items
+HEADER = struct.Struct(">8sQQ")
+# Snapshots without deadlines, written before keys could expire
+MAGIC_WITHOUT_DEADLINES = b"KVSSNAP1"
+
+
+class CorruptSnapshot(ValueError):
+    """Raised when a snapshot file was not written by SnapshotFile"""
+
+
+class SnapshotFile:
+    """Point-in-time copy of every key, used to start without replaying the whole log.
+
+    The file is written next to its final path and renamed when it is
+    complete, so a crash while writing keeps the previous snapshot. It is
+    read through a memory map, decoding one item at a time. The deadlines of
+    the keys that expire are written before the items.
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def write(self, version, items, deadlines=None):
+        temporary_path = f"{self._path}.tmp"
+        with open(temporary_path, "wb", buffering=1 << 20) as snapshot:
+            snapshot.write(HEADER.pack(MAGIC, version, 0))
+            snapshot.write(encode_deadlines(deadlines or {}))
+            number_of_items = 0
+            for key, value in items:
+                snapshot.write(encode_value(key))
+                snapshot.write(encode_value(value))
+                number_of_items += 1
+            snapshot.seek(0)
+            snapshot.write(HEADER.pack(MAGIC, version, number_of_items))
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary_path, self._path)
+
+    def read(self):
+        """Return the version of the snapshot, an iterator over its items and the deadlines of its keys"""
+        if not os.path.exists(self._path):
+            return 0, iter(()), {}
+        with open(self._path, "rb") as snapshot:
+            header = snapshot.read(HEADER.size)
+            if len(header) < HEADER.size or header[: len(MAGIC)] not in (MAGIC, MAGIC_WITHOUT_DEADLINES):
+                raise CorruptSnapshot(self._path)
+            magic, version, number_of_items = HEADER.unpack(header)
+            if magic == MAGIC_WITHOUT_DEADLINES:
+                return version, self._read_items(number_of_items, HEADER.size), {}
+            with mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                deadlines, offset = decode_deadlines(mapped, HEADER.size)
+        return version, self._read_items(number_of_items, offset), deadlines
+
+    def _read_items(self, number_of_items, offset):
+        with open(self._path, "rb") as snapshot, mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            buffer = memoryview(mapped)
+            try:
+                for _ in range(number_of_items):
+                    key, offset = decode_value(buffer, offset)
+                    value, offset = decode_value(buffer, offset)
+                    yield key, value
+            finally:
+                buffer.release()
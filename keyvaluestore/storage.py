@@ -0,0 +1,381 @@
+import sys
+import threading
+from abc import ABCMeta, abstractmethod
+from array import array
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from contextlib import ExitStack, contextmanager
+from itertools import chain, repeat
+from typing import Optional
+
+
+class Storage(metaclass=ABCMeta):
+    """Where KeyValueStoreSystem keeps the last committed entry of each key.
+
+    An entry is a ``(version, value)`` tuple. Storages also keep the number
+    of keys per value and provide the locks commits take on the keys they
+    write.
+    """
+
+    @abstractmethod
+    def get(self, key) -> Optional[tuple]:
+        """Get the entry of a key or None if the key does not exist"""
+
+    @abstractmethod
+    def set(self, key, version, value):
+        """Replace the entry of a key"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove the entry of a key if it exists"""
+
+    def apply(self, version, values: dict, deleted_keys: list):
+        """Store the values and delete the keys written by a commit"""
+        for key, value in values.items():
+            self.set(key, version, value)
+        for key in deleted_keys:
+            self.delete(key)
+
+    @abstractmethod
+    def number_of_keys_with_value(self, a_value):
+        """Get the number of keys with the same value"""
+
+    @abstractmethod
+    def keys(self) -> list:
+        """Get a copy of the existing keys"""
+
+    @abstractmethod
+    def locking(self, keys):
+        """Context manager that holds the locks of the given keys"""
+
+    def last_version(self) -> int:
+        """Get the version of the last commit kept by a storage that outlives the process"""
+        return 0
+
+    def set_last_version(self, version):
+        """Remember the version of the last commit whose writes were stored"""
+
+    def close(self):
+        """Release the resources of the storage"""
+
+
+class InMemoryStorage(Storage):
+    def __init__(self, number_of_lock_stripes=64):
+        self._entries = {}
+        self._value_counts = Counter()
+        self._key_locks = LockStripes(number_of_lock_stripes)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, version, value):
+        previous_entry = self._entries.get(key)
+        if previous_entry is not None:
+            update_count(self._value_counts, previous_entry[1], -1)
+        self._entries[key] = (version, value)
+        update_count(self._value_counts, value, 1)
+
+    def delete(self, key):
+        previous_entry = self._entries.pop(key, None)
+        if previous_entry is not None:
+            update_count(self._value_counts, previous_entry[1], -1)
+
+    def apply(self, version, values, deleted_keys):
+        # Values are counted once per distinct value instead of once per key
+        removed = Counter(entry[1] for entry in map(self._entries.get, chain(values, deleted_keys)) if entry)
+        self._entries.update(zip(values, zip(repeat(version), values.values())))
+        for key in deleted_keys:
+            self._entries.pop(key, None)
+        for value, number in removed.items():
+            update_count(self._value_counts, value, -number)
+        for value, number in Counter(values.values()).items():
+            update_count(self._value_counts, value, number)
+
+    def number_of_keys_with_value(self, a_value):
+        return self._value_counts[a_value]
+
+    def keys(self):
+        return list(self._entries)
+
+    def locking(self, keys):
+        return self._key_locks.locking(keys)
+
+
+class CompactStorage(Storage):
+    """Storage for many keys that share a few values.
+
+    Values are dictionary-encoded: each distinct value is kept once, with
+    an integer id and the number of keys that have it, so values read from
+    different places do not keep a copy per key. The keys a commit gives
+    the same value share a single entry, so a key written in a large commit
+    costs only its slot in the dictionary of entries. Values of the same
+    type that compare equal share their id, so 1, 1.0 and True are kept
+    apart and read back as they were written, but are counted together,
+    like in the other storages. The ids of values no key has anymore are
+    reused.
+    """
+
+    def __init__(self, number_of_lock_stripes=64):
+        self._entries = {}
+        self._values = []
+        self._value_ids = {}
+        self._value_counts = array("Q")
+        self._free_value_ids = []
+        # Types besides str of the values ever kept, which are a few, to count the equal values of every type
+        self._value_types = set()
+        self._key_locks = LockStripes(number_of_lock_stripes)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, version, value):
+        self.apply(version, {key: value}, [])
+
+    def delete(self, key):
+        self.apply(0, {}, [key])
+
+    def apply(self, version, values, deleted_keys):
+        value_ids = self._value_ids
+        removed = Counter(
+            value_ids[_typed_value(entry[1])]
+            for entry in map(self._entries.get, chain(values, deleted_keys))
+            if entry is not None
+        )
+        # New values get their ids before any id is released, so values that stay are not released
+        typed_values = [value if type(value) is str else (type(value), value) for value in values.values()]
+        new_entries = {}
+        for typed_value, number in Counter(typed_values).items():
+            value_id = self._id_of(typed_value)
+            self._value_counts[value_id] += number
+            new_entries[typed_value] = (version, self._values[value_id])
+        self._entries.update(zip(values, map(new_entries.__getitem__, typed_values)))
+        for key in deleted_keys:
+            self._entries.pop(key, None)
+        for value_id, number in removed.items():
+            self._value_counts[value_id] -= number
+            if not self._value_counts[value_id]:
+                del value_ids[_typed_value(self._values[value_id])]
+                self._values[value_id] = None
+                self._free_value_ids.append(value_id)
+
+    def _id_of(self, typed_value):
+        value_id = self._value_ids.get(typed_value)
+        if value_id is not None:
+            return value_id
+        if type(typed_value) is str:
+            value = typed_value
+        else:
+            value_type, value = typed_value
+            self._value_types.add(value_type)
+        if self._free_value_ids:
+            value_id = self._free_value_ids.pop()
+            self._values[value_id] = value
+        else:
+            value_id = len(self._values)
+            self._values.append(value)
+            self._value_counts.append(0)
+        self._value_ids[typed_value] = value_id
+        return value_id
+
+    def number_of_keys_with_value(self, a_value):
+        value_id = self._value_ids.get(a_value) if type(a_value) is str else None
+        number = 0 if value_id is None else self._value_counts[value_id]
+        for value_type in self._value_types:
+            value_id = self._value_ids.get((value_type, a_value))
+            if value_id is not None:
+                number += self._value_counts[value_id]
+        return number
+
+    def keys(self):
+        return list(self._entries)
+
+    def locking(self, keys):
+        return self._key_locks.locking(keys)
+
+
+def _typed_value(value):
+    # Text, which is most values, is never equal to another type, so it is its own key
+    return value if type(value) is str else (type(value), value)
+
+
+class ShardedStorage(Storage):
+    """Splits the keyspace in partitions, each one with its own lock and value index"""
+
+    def __init__(self, partitioner=None):
+        self._partitioner = partitioner or HashPartitioner(16)
+        self._shards = [
+            InMemoryStorage(number_of_lock_stripes=1) for _ in range(self._partitioner.number_of_partitions)
+        ]
+
+    def _shard_of(self, key) -> InMemoryStorage:
+        return self._shards[self._partitioner.partition_of(key)]
+
+    def get(self, key):
+        return self._shard_of(key).get(key)
+
+    def set(self, key, version, value):
+        self._shard_of(key).set(key, version, value)
+
+    def delete(self, key):
+        self._shard_of(key).delete(key)
+
+    def apply(self, version, values, deleted_keys):
+        values_by_shard = {}
+        deleted_keys_by_shard = {}
+        for key, value in values.items():
+            values_by_shard.setdefault(self._partitioner.partition_of(key), {})[key] = value
+        for key in deleted_keys:
+            deleted_keys_by_shard.setdefault(self._partitioner.partition_of(key), []).append(key)
+        for partition in values_by_shard.keys() | deleted_keys_by_shard.keys():
+            self._shards[partition].apply(
+                version, values_by_shard.get(partition, {}), deleted_keys_by_shard.get(partition, [])
+            )
+
+    def number_of_keys_with_value(self, a_value):
+        return sum(shard.number_of_keys_with_value(a_value) for shard in self._shards)
+
+    def keys(self):
+        return [key for shard in self._shards for key in shard.keys()]
+
+    @contextmanager
+    def locking(self, keys):
+        keys_by_partition = {}
+        for key in keys:
+            keys_by_partition.setdefault(self._partitioner.partition_of(key), []).append(key)
+        with ExitStack() as stack:
+            for partition in sorted(keys_by_partition):
+                stack.enter_context(self._shards[partition].locking(keys_by_partition[partition]))
+            yield
+
+
+class CachedStorage(Storage):
+    """Least recently used entries of a slower storage, kept in memory.
+
+    The cache holds up to ``max_entries`` entries, and up to ``max_bytes``
+    as estimated by ``sys.getsizeof`` of the keys and values, including the
+    keys that do not exist. Commits drop the keys they write, and an entry
+    read from the storage is not cached if a commit was applied while it
+    was being read, so the cache never keeps an entry that was replaced.
+    """
+
+    ENTRY_OVERHEAD = 100
+
+    def __init__(self, storage: Storage, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self._storage = storage
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._number_of_commits = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        try:
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        number_of_commits = self._number_of_commits
+        entry = self._storage.get(key)
+        with self._lock:
+            if number_of_commits == self._number_of_commits and key not in self._entries:
+                self._entries[key] = entry
+                self._size += _size_of(key, entry)
+                self._evict()
+        return entry
+
+    def _evict(self):
+        while self._entries and (
+            (self._max_entries is not None and len(self._entries) > self._max_entries)
+            or (self._max_bytes is not None and self._size > self._max_bytes)
+        ):
+            key, entry = self._entries.popitem(last=False)
+            self._size -= _size_of(key, entry)
+            self.evictions += 1
+
+    def set(self, key, version, value):
+        self.apply(version, {key: value}, [])
+
+    def delete(self, key):
+        self.apply(0, {}, [key])
+
+    def apply(self, version, values, deleted_keys):
+        self._storage.apply(version, values, deleted_keys)
+        with self._lock:
+            self._number_of_commits += 1
+            for key in chain(values, deleted_keys):
+                if key in self._entries:
+                    self._size -= _size_of(key, self._entries.pop(key))
+
+    def number_of_keys_with_value(self, a_value):
+        return self._storage.number_of_keys_with_value(a_value)
+
+    def keys(self):
+        return self._storage.keys()
+
+    def locking(self, keys):
+        return self._storage.locking(keys)
+
+    def last_version(self):
+        return self._storage.last_version()
+
+    def set_last_version(self, version):
+        self._storage.set_last_version(version)
+
+    def close(self):
+        self._storage.close()
+
+
+def _size_of(key, entry):
+    size = CachedStorage.ENTRY_OVERHEAD + sys.getsizeof(key)
+    if entry is not None:
+        size += sys.getsizeof(entry[1])
+    return size
+
+
+class HashPartitioner:
+    def __init__(self, number_of_partitions):
+        self.number_of_partitions = number_of_partitions
+
+    def partition_of(self, key):
+        return hash(key) % self.number_of_partitions
+
+
+class RangePartitioner:
+    """Partition i holds the keys between boundaries[i - 1] (inclusive) and boundaries[i] (exclusive)"""
+
+    def __init__(self, boundaries):
+        self._boundaries = sorted(boundaries)
+        self.number_of_partitions = len(self._boundaries) + 1
+
+    def partition_of(self, key):
+        return bisect_right(self._boundaries, key)
+
+
+class LockStripes:
+    def __init__(self, number_of_stripes):
+        self._locks = [threading.Lock() for _ in range(number_of_stripes)]
+
+    @contextmanager
+    def locking(self, keys):
+        stripes = sorted({hash(key) % len(self._locks) for key in keys})
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
+
+
+def update_count(counter: Counter, value, amount: int):
+    counter[value] += amount
+    if not counter[value]:
+        del counter[value]
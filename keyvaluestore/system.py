@@ -1,136 +1,899 @@
-from abc import ABCMeta, abstractmethod
-from typing import Any
+import threading
+import time
+import weakref
+from collections import Counter
+from heapq import heapify, heappop, heappush, merge
+from itertools import chain, count, islice, takewhile
+from operator import itemgetter
+from typing import Any, Optional
+
+from keyvaluestore.index import SortedKeys
+from keyvaluestore.metrics import Metrics
+from keyvaluestore.readset import ReadSet
+from keyvaluestore.storage import CachedStorage, InMemoryStorage, Storage, update_count
 
 
 class KeyValueStoreSystem:
+    """Multi-version key-value store.
+
+    Every committed transaction gets the next commit sequence number, which
+    becomes the version of each key it writes. Transactions read from the
+    snapshot of the last commit that existed when they first accessed the
+    store, and a commit conflicts when any key it writes got a newer version
+    after that snapshot. Superseded versions are kept in the commit history
+    only while a snapshot that can see them is still open.
+
+    The system can be shared by many threads. Commits lock only the keys
+    they write, through the locks of the storage, so transactions with
+    disjoint keys validate without waiting for each other, and the short
+    step that applies a commit is the only one that is globally serialized.
+    Reading a key does not lock: a commit records what it replaces before it
+    touches the storage.
+
+    With a write-ahead log, a commit appends its record to the log, and is
+    applied and published only once the record is durable, in version
+    order, so a storage that outlives the process never has a commit that
+    the log lost. Waiting for the log holds the locks of the keys written,
+    not the global one, so concurrent commits share syncs, and serializable
+    commits check their reads against the commits waiting for it too.
+    The system is created from the snapshot file, if any, and the records
+    of the log that are newer than it. ``checkpoint`` writes a new snapshot
+    from a snapshot of the store, so commits go on while it runs, and then
+    drops the log files it made unnecessary.
+
+    Keys can have a deadline, set by the commit that writes them and
+    cleared by any later write without one. Reads hide the keys whose
+    deadline passed, and ``expire_keys`` deletes them with a commit of its
+    own, taking them in deadline order from a heap, so it never looks at
+    keys that do not expire. Until then ``number_of_keys_with_value``
+    subtracts them, finding them in the part of the heap whose deadlines
+    passed. Deleting a key that expired does not change its version for
+    the commits that write it again, since it was already gone for them.
+
+    With ``metrics``, ``begin`` returns transactions that count and time
+    what they do in it, and ``statistics`` tells how much the store is
+    holding back at any time.
+
+    Commit listeners are called with the version, the write set and the
+    deadlines of every commit, in commit order, while the commit lock is
+    held, so they should only hand them over to another thread. A
+    ``read_only`` system, such as a follower of another one, only changes
+    through ``replicate``, which applies the commits of the other system
+    with their versions.
+
+    Snapshot isolation lets two transactions that read what the other one
+    writes both commit. ``serializable`` transactions, the default of a
+    system created with ``serializable``, also remember what they read, and
+    their commit conflicts when a commit after their snapshot wrote any of
+    it. The commits after a snapshot are in the history while it is open,
+    so the check needs no locks besides the commit lock, and a transaction
+    that writes nothing commits without it.
+    """
+
     class TransactionConflict(RuntimeError):
         """Raised when a transaction tries to modify old data"""
 
+    class ReadOnly(RuntimeError):
+        """Raised when a transaction commits writes to a read-only system"""
+
     NEW_KEY = object()
 
+    LOAD_BATCH_SIZE = 1 << 16
+    SCAN_BATCH_SIZE = 256
+    EXPIRE_BATCH_SIZE = 1000
+
+    def __init__(
+        self,
+        storage: Optional[Storage] = None,
+        log=None,
+        snapshot_file=None,
+        metrics: Optional[Metrics] = None,
+        read_only=False,
+        serializable=False,
+    ):
+        self._storage = storage or InMemoryStorage()
+        self.metrics = metrics
+        self._is_read_only = read_only
+        self._is_serializable = serializable
+        self._commit_listeners = []
+        # Write sets of the commits whose record is not durable yet, by version
+        self._waiting_commits = {}
+        self._last_applied = self._last_commit = self._storage.last_version()
+        self._snapshot_file = snapshot_file
+        self._history = {}
+        self._tombstones = {}
+        # Version that commits check instead of the tombstone of the keys deleted after they expired
+        self._expired_versions = {}
+        self._snapshots = Counter()
+        self._abandoned_snapshots = []
+        self._commit_lock = threading.Lock()
+        # Notified with the commit lock held when commits are published, so they are applied in version order
+        self._publication = threading.Condition(self._commit_lock)
+        self._checkpoint_lock = threading.Lock()
+        self._sorted_keys = None
+        self._sorted_keys_lock = threading.Lock()
+        # Keys changed while the sorted keys are built without the commit lock
+        self._changed_keys = None
+        self._deadlines = {}
+        self._expirations = []
+        self._expiration_order = count()
+        self._log = None
+        snapshot_version = 0
+        if snapshot_file is not None:
+            snapshot_version = self._load(*snapshot_file.read())
+        if log is not None:
+            for version, writes, deadlines in log.replay():
+                if version > self._last_commit:
+                    self._publish(self._apply(writes, version, deadlines=deadlines))
+                elif version > snapshot_version and (deadlines or self._deadlines):
+                    # The storage kept the values of the commit, but only the log has their deadlines
+                    self._set_deadlines(writes, deadlines or {})
+            self._log = log
+
+    def _load(self, version, items, deadlines) -> int:
+        self._set_deadlines(deadlines, deadlines)
+        if version <= self._last_commit:
+            return version
+        # The storage can have the keys of an older run, which the snapshot replaces
+        stale_keys = set(self._storage.keys())
+        items = iter(items)
+        while True:
+            values = dict(islice(items, KeyValueStoreSystem.LOAD_BATCH_SIZE))
+            if not values:
+                break
+            self._storage.apply(version, values, [])
+            stale_keys.difference_update(values)
+        self._storage.apply(version, {}, list(stale_keys))
+        self._storage.set_last_version(version)
+        self._last_applied = self._last_commit = version
+        return version
+
+    def begin(self, serializable: Optional[bool] = None):
+        if serializable is None:
+            serializable = self._is_serializable
+        if self.metrics is None:
+            return SerializableTransaction(self) if serializable else Transaction(self)
+        return InstrumentedSerializableTransaction(self) if serializable else InstrumentedTransaction(self)
+
+    def end(self):
+        if self._log is not None:
+            self._log.close()
+        self._storage.close()
+
+    def checkpoint(self):
+        # One checkpoint at a time, since they write the same temporary file and remove the same log files
+        with self._checkpoint_lock:
+            # The closed log files only have commits that the snapshot, taken after closing them, has
+            if self._log is not None:
+                self._log.roll()
+            version = self.write_snapshot(self._snapshot_file)
+            if self._log is not None:
+                self._log.truncate(version)
+
+    def write_snapshot(self, snapshot_file) -> int:
+        """Write the last commit to a snapshot file, while commits go on, and return its version"""
+        snapshot = self.take_snapshot()
+        try:
+            with self._commit_lock:
+                deadlines = dict(self._deadlines)
+            snapshot_file.write(snapshot, self.items(snapshot), deadlines)
+        finally:
+            self.release_snapshot(snapshot)
+        return snapshot
+
+    @property
+    def last_commit(self) -> int:
+        return self._last_commit
+
+    @property
+    def has_log(self) -> bool:
+        """Whether commits wait for a write-ahead log"""
+        return self._log is not None
+
+    def add_commit_listener(self, listener):
+        with self._commit_lock:
+            self._commit_listeners = self._commit_listeners + [listener]
+
+    def remove_commit_listener(self, listener):
+        with self._commit_lock:
+            self._commit_listeners = [other for other in self._commit_listeners if other is not listener]
+
+    def items(self, snapshot: int):
+        """Iterate over the keys and values in a snapshot, that must be taken while iterating"""
+        with self._commit_lock:
+            keys = self._storage.keys()
+            deleted_keys = [key for key in self._tombstones if self._storage.get(key) is None]
+        for key in chain(keys, deleted_keys):
+            value = self.get(key, KeyValueStoreSystem.NEW_KEY, snapshot)
+            if value is not KeyValueStoreSystem.NEW_KEY:
+                yield key, value
+
+    def scan(self, start=None, end=None, snapshot: Optional[int] = None):
+        """Iterate in order over the keys from start to end, not included, and their values in a snapshot.
+
+        The snapshot must be taken while iterating. The keys are kept sorted
+        from the first scan on, with the deleted keys that a snapshot can
+        still see, and are read in batches, so commits wait for one batch at
+        most.
+        """
+        if self._sorted_keys is None:
+            self._build_sorted_keys()
+        inclusive = True
+        while True:
+            with self._commit_lock:
+                keys = self._sorted_keys.keys_from(start, KeyValueStoreSystem.SCAN_BATCH_SIZE, inclusive)
+            for key in keys:
+                if end is not None and key >= end:
+                    return
+                value = self.get(key, KeyValueStoreSystem.NEW_KEY, snapshot)
+                if value is not KeyValueStoreSystem.NEW_KEY:
+                    yield key, value
+            if len(keys) < KeyValueStoreSystem.SCAN_BATCH_SIZE:
+                return
+            start, inclusive = keys[-1], False
+
+    def _build_sorted_keys(self):
+        with self._sorted_keys_lock:
+            with self._commit_lock:
+                if self._sorted_keys is not None:
+                    return
+                keys = self._storage.keys()
+                keys.extend(self._tombstones)
+                self._changed_keys = set()
+            # Sorting millions of keys takes seconds, so commits go on and the keys they change are sorted later
+            sorted_keys = SortedKeys(keys)
+            with self._commit_lock:
+                for key in self._changed_keys:
+                    if key in self._tombstones or self._storage.get(key) is not None:
+                        sorted_keys.add(key)
+                    else:
+                        sorted_keys.discard(key)
+                self._sorted_keys = sorted_keys
+                self._changed_keys = None
+
+    def take_snapshot(self) -> int:
+        with self._commit_lock:
+            snapshot = self._last_commit
+            self._snapshots[snapshot] += 1
+            return snapshot
+
+    def release_snapshot(self, snapshot: int):
+        with self._commit_lock:
+            update_count(self._snapshots, snapshot, -1)
+            self._collect_garbage()
+
+    def abandon_snapshot(self, snapshot: int):
+        # Called by the garbage collector, which can interrupt a thread that holds the commit lock
+        self._abandoned_snapshots.append(snapshot)
+
+    def commit(self, writes, snapshot: Optional[int], deadlines=None, read_set: Optional[ReadSet] = None):
+        if not writes:
+            return
+        if self._is_read_only:
+            raise KeyValueStoreSystem.ReadOnly()
+        with self._storage.locking(writes):
+            for key in writes:
+                if self._version_of(key) > snapshot:
+                    raise KeyValueStoreSystem.TransactionConflict()
+            self._commit(writes, None, snapshot, deadlines, read_set)
+
+    def replicate(self, version: int, writes, deadlines=None):
+        """Apply a commit of another system with its version, which must be newer than the last one"""
+        with self._storage.locking(writes):
+            self._commit(writes, version, None, deadlines)
+
+    def import_items(self, items) -> int:
+        """Write the items in commits of LOAD_BATCH_SIZE keys, that never conflict, and return how many there were"""
+        if self._is_read_only:
+            raise KeyValueStoreSystem.ReadOnly()
+        items = iter(items)
+        number_of_items = 0
+        while True:
+            writes = dict(islice(items, KeyValueStoreSystem.LOAD_BATCH_SIZE))
+            if not writes:
+                return number_of_items
+            with self._storage.locking(writes):
+                self._commit(writes, None, None, None)
+            number_of_items += len(writes)
+
+    def _commit(self, writes, version, committing_snapshot, deadlines, read_set=None):
+        with self._commit_lock:
+            if read_set:
+                self._check_reads(read_set, committing_snapshot)
+            if version is None:
+                version = (next(reversed(self._waiting_commits)) if self._waiting_commits else self._last_applied) + 1
+            if self._log is None:
+                self._apply_and_publish(writes, version, committing_snapshot, deadlines)
+                return
+            self._log.append(version, self._log.encode(version, writes, deadlines))
+            self._waiting_commits[version] = writes
+        try:
+            self._log.wait_until_durable(version)
+        except BaseException:
+            with self._commit_lock:
+                del self._waiting_commits[version]
+            raise
+        with self._commit_lock:
+            # Records are durable in version order, but their committers can get here in any order
+            self._publication.wait_for(lambda: next(iter(self._waiting_commits)) == version)
+            del self._waiting_commits[version]
+            self._apply_and_publish(writes, version, committing_snapshot, deadlines)
+
+    def _apply_and_publish(self, writes, version, committing_snapshot, deadlines):
+        self._apply(writes, version, committing_snapshot, deadlines)
+        for listener in self._commit_listeners:
+            listener(version, writes, deadlines or {})
+        self._publish(version)
+        self._publication.notify_all()
+
+    def _check_reads(self, read_set: ReadSet, snapshot: int):
+        # The snapshot is open, so every commit after it is in the history or waiting for the log
+        for version in reversed(self._history):
+            if version <= snapshot:
+                break
+            record = self._history[version]
+            if read_set.is_changed_by(record.previous_entries, record.value_count_deltas):
+                raise KeyValueStoreSystem.TransactionConflict()
+        for writes in self._waiting_commits.values():
+            # The committer holds the locks of the keys, so the storage still has what it replaces
+            record = CommitRecord()
+            for key, value in writes.items():
+                record.remember(key, self._storage.get(key), value, self._tombstones.get(key, 0))
+            if read_set.is_changed_by(record.previous_entries, record.value_count_deltas):
+                raise KeyValueStoreSystem.TransactionConflict()
+
+    def _apply(self, writes, version=None, committing_snapshot=None, deadlines=None):
+        version = self._last_applied + 1 if version is None else version
+        expired_keys = ()
+        if deadlines or self._deadlines:
+            if self._deadlines:
+                expired_keys = {key for key in writes if self._is_expired(key)}
+            self._set_deadlines(writes, deadlines or {})
+        if self._expired_versions:
+            for key in writes:
+                self._expired_versions.pop(key, None)
+        if self._keeps_history(committing_snapshot):
+            record = CommitRecord()
+            for key, value in writes.items():
+                previous_entry = self._storage.get(key)
+                record.remember(key, previous_entry, value, self._tombstones.get(key, 0))
+                if value is Transaction.TOMBSTONE and previous_entry is not None:
+                    self._tombstones[key] = version
+                    if key in expired_keys:
+                        # The key was already gone for the transactions writing it, so they do not conflict
+                        self._expired_versions[key] = previous_entry[0]
+            self._history[version] = record
+        deleted_keys = [key for key, value in writes.items() if value is Transaction.TOMBSTONE]
+        if deleted_keys:
+            writes = {key: value for key, value in writes.items() if value is not Transaction.TOMBSTONE}
+        self._storage.apply(version, writes, deleted_keys)
+        self._storage.set_last_version(version)
+        if self._sorted_keys is not None:
+            for key in writes:
+                self._sorted_keys.add(key)
+            for key in deleted_keys:
+                if key not in self._tombstones:
+                    self._sorted_keys.discard(key)
+        elif self._changed_keys is not None:
+            self._changed_keys.update(writes)
+            self._changed_keys.update(deleted_keys)
+        self._last_applied = version
+        return version
+
+    def _set_deadlines(self, keys, deadlines):
+        for key in keys:
+            deadline = deadlines.get(key)
+            if deadline is None:
+                self._deadlines.pop(key, None)
+            else:
+                self._deadlines[key] = deadline
+                heappush(self._expirations, (deadline, next(self._expiration_order), key))
+        # Keys that got another deadline or none leave their old one in the heap until it is rebuilt
+        if len(self._expirations) > 2 * len(self._deadlines) + KeyValueStoreSystem.EXPIRE_BATCH_SIZE:
+            self._expirations = [
+                (deadline, next(self._expiration_order), key) for key, deadline in self._deadlines.items()
+            ]
+            heapify(self._expirations)
+
+    def expire_keys(self, now: Optional[float] = None) -> int:
+        """Delete up to EXPIRE_BATCH_SIZE keys whose deadline passed and return how many were deleted"""
+        if self._is_read_only:
+            return 0
+        now = time.time() if now is None else now
+        keys = []
+        with self._commit_lock:
+            while self._expirations and self._expirations[0][0] <= now and len(keys) < KeyValueStoreSystem.EXPIRE_BATCH_SIZE:
+                deadline, _, key = heappop(self._expirations)
+                if self._deadlines.get(key) == deadline:
+                    keys.append(key)
+            if not keys:
+                return 0
+            snapshot = self._last_commit
+            self._snapshots[snapshot] += 1
+        try:
+            self.commit(dict.fromkeys(keys, Transaction.TOMBSTONE), snapshot)
+        except KeyValueStoreSystem.TransactionConflict:
+            # A key was written after it expired, so the others are left for the next time
+            with self._commit_lock:
+                for key in keys:
+                    deadline = self._deadlines.get(key)
+                    if deadline is not None and deadline <= now:
+                        heappush(self._expirations, (deadline, next(self._expiration_order), key))
+            return 0
+        finally:
+            self.release_snapshot(snapshot)
+        if self.metrics is not None:
+            self.metrics.increment("expired_keys", len(keys))
+        return len(keys)
+
+    def _is_expired(self, key):
+        deadline = self._deadlines.get(key)
+        return deadline is not None and deadline <= time.time()
+
+    def statistics(self) -> dict:
+        """Open snapshots, the versions they keep and other gauges of the store"""
+        with self._commit_lock:
+            statistics = {
+                "last_commit": self._last_commit,
+                "open_snapshots": sum(self._snapshots.values()),
+                "history_versions": len(self._history),
+                "tombstones": len(self._tombstones),
+                "expiring_keys": len(self._deadlines),
+            }
+        if isinstance(self._storage, CachedStorage):
+            statistics["cache_hits"] = self._storage.hits
+            statistics["cache_misses"] = self._storage.misses
+            statistics["cache_evictions"] = self._storage.evictions
+        return statistics
+
+    def _keeps_history(self, committing_snapshot=None):
+        # The snapshot of the committing transaction is released right after its commit
+        if len(self._snapshots) == 1 and self._snapshots.get(committing_snapshot) == 1:
+            return False
+        return bool(self._snapshots)
+
+    def _publish(self, version):
+        self._last_commit = max(self._last_commit, version)
+        self._collect_garbage()
+
+    def get(self, key, default_if_key_does_not_exist: Any = KeyError, snapshot: Optional[int] = None):
+        value = self._get_entry(key, snapshot)[1]
+        if value is KeyValueStoreSystem.NEW_KEY or (self._deadlines and self._is_expired(key)):
+            if default_if_key_does_not_exist is KeyError:
+                raise KeyError(key)
+            return default_if_key_does_not_exist
+        return value
+
+    def get_many(self, keys, default_if_key_does_not_exist: Any = None, snapshot: Optional[int] = None) -> list:
+        get_entry = self._storage.get
+        values = []
+        for key in keys:
+            entry = get_entry(key)
+            if entry is None:
+                entry = (self._tombstones.get(key, 0), KeyValueStoreSystem.NEW_KEY)
+            if snapshot is not None and entry[0] > snapshot:
+                entry = self._get_entry(key, snapshot)
+            value = entry[1]
+            if value is KeyValueStoreSystem.NEW_KEY or (self._deadlines and self._is_expired(key)):
+                value = default_if_key_does_not_exist
+            values.append(value)
+        return values
+
+    def _get_entry(self, key, snapshot):
+        entry = self._storage.get(key)
+        if entry is None:
+            entry = (self._tombstones.get(key, 0), KeyValueStoreSystem.NEW_KEY)
+        if snapshot is not None:
+            while entry[0] > snapshot:
+                entry = self._history[entry[0]].previous_entries[key]
+        return entry
+
+    def _version_of(self, key):
+        version = self._expired_versions.get(key)
+        return self._get_entry(key, snapshot=None)[0] if version is None else version
+
+    def number_of_keys_with_value(self, a_value, snapshot: Optional[int] = None):
+        with self._commit_lock:
+            number = self._storage.number_of_keys_with_value(a_value)
+            if snapshot is not None:
+                for version in reversed(self._history):
+                    if version <= snapshot:
+                        break
+                    number -= self._history[version].value_count_deltas[a_value]
+            if self._deadlines:
+                for key in self._expired_keys(time.time()):
+                    if self._get_entry(key, snapshot)[1] == a_value:
+                        number -= 1
+            return number
+
+    def _expired_keys(self, now):
+        # Children have later deadlines than their parents, so the heap is walked only where deadlines passed
+        expirations = self._expirations
+        keys = set()
+        indexes = [0] if expirations else []
+        while indexes:
+            index = indexes.pop()
+            deadline, _, key = expirations[index]
+            if deadline > now:
+                continue
+            if self._deadlines.get(key) == deadline:
+                keys.add(key)
+            indexes.extend(child for child in (2 * index + 1, 2 * index + 2) if child < len(expirations))
+        return keys
+
+    def _collect_garbage(self):
+        while self._abandoned_snapshots:
+            update_count(self._snapshots, self._abandoned_snapshots.pop(), -1)
+        oldest_snapshot = min(self._snapshots) if self._snapshots else self._last_commit
+        while self._history:
+            version = next(iter(self._history))
+            if version > oldest_snapshot:
+                break
+            for key in self._history.pop(version).previous_entries:
+                if self._tombstones.get(key) == version:
+                    del self._tombstones[key]
+                    self._expired_versions.pop(key, None)
+                    if self._sorted_keys is not None and self._storage.get(key) is None:
+                        self._sorted_keys.discard(key)
+                    elif self._changed_keys is not None:
+                        self._changed_keys.add(key)
+
+
+class CommitRecord:
+    """What a commit replaced, so older snapshots can still be read"""
+
+    __slots__ = ("previous_entries", "value_count_deltas")
+
     def __init__(self):
-        self._storage = {}
+        self.previous_entries = {}
+        self.value_count_deltas = Counter()
 
-    def begin(self):
-        return Transaction(self)
+    def remember(self, key, previous_entry, new_value, tombstone_version):
+        if previous_entry is None:
+            previous_entry = (tombstone_version, KeyValueStoreSystem.NEW_KEY)
+        count_write(self.value_count_deltas, previous_entry[1], new_value)
+        self.previous_entries[key] = previous_entry
 
-    def end(self):
-        pass
 
-    def commit(self, operations):
-        for operation in operations:
-            operation.apply_on(self)
+class Transaction:
+    """Changes read and written against a snapshot of a KeyValueStoreSystem.
+
+    ``begin`` starts a nested transaction on top of the current one. Every
+    nesting level keeps in a savepoint what the writes it made replaced, so
+    its ``rollback`` undoes only them and its ``commit`` hands them to the
+    enclosing level. The writes of every level are kept in a single write
+    set, so reads do not depend on how deep the nesting is.
+
+    The write set holds only the last value written to each key, so a
+    pending write costs one dictionary entry, about 40 bytes besides the key
+    and the value, plus one more in the savepoint of each nesting level that
+    overwrites it.
+
+    A key written with a time to live gets its deadline when it is written,
+    and keeps being visible to the transaction that wrote it.
+    """
+
+    __slots__ = (
+        "_system",
+        "_snapshot",
+        "_release_snapshot",
+        "_writes",
+        "_value_count_deltas",
+        "_savepoints",
+        "_deadlines",
+        "__weakref__",
+    )
+
+    NOT_WRITTEN = object()
+    TOMBSTONE = object()
+
+    def __init__(self, system: KeyValueStoreSystem):
+        self._system = system
+        self._snapshot = None
+        self._release_snapshot = None
+        self._writes = {}
+        self._value_count_deltas = Counter()
+        self._savepoints = []
+        self._deadlines = {}
+
+    def begin(self):
+        self._savepoints.append(Savepoint())
+
+    @property
+    def nesting_level(self):
+        return len(self._savepoints)
+
+    def set(self, key, value, time_to_live: Optional[float] = None):
+        # Transaction.get, so that subclasses measure only the reads of the user
+        old_value = Transaction.get(self, key, KeyValueStoreSystem.NEW_KEY)
+        deadline = None if time_to_live is None else time.time() + time_to_live
+        self._write(key, value, old_value, deadline)
+
+    def expire(self, key, time_to_live: float) -> bool:
+        """Set the time to live of a key, if it exists"""
+        value = Transaction.get(self, key, KeyValueStoreSystem.NEW_KEY)
+        if value is KeyValueStoreSystem.NEW_KEY:
+            return False
+        self._write(key, value, value, time.time() + time_to_live)
+        return True
 
-    def get(self, key, default_if_key_does_not_exist: Any = KeyError):
-        if default_if_key_does_not_exist is KeyError:
-            return self._storage[key]
-        return self._storage.get(key, default_if_key_does_not_exist)
+    def unset(self, key):
+        old_value = Transaction.get(self, key, KeyValueStoreSystem.NEW_KEY)
+        self._write(key, Transaction.TOMBSTONE, old_value)
+
+    def _write(self, key, value, old_value, deadline=None):
+        if self._savepoints:
+            self._savepoints[-1].remember(key, self._writes.get(key, Transaction.NOT_WRITTEN), old_value, value)
+            if deadline is not None or key in self._deadlines:
+                self._savepoints[-1].remember_deadline(key, self._deadlines.get(key))
+        self._writes[key] = value
+        count_write(self._value_count_deltas, old_value, value)
+        if deadline is not None:
+            self._deadlines[key] = deadline
+        elif self._deadlines:
+            self._deadlines.pop(key, None)
+
+    def set_many(self, mapping):
+        self._write_many(dict(mapping))
+
+    def unset_many(self, keys):
+        self._write_many(dict.fromkeys(keys, Transaction.TOMBSTONE))
+
+    def _write_many(self, new_values: dict):
+        # Like _write, but the values are counted once per distinct value instead of once per key
+        old_values = Transaction.get_many(self, new_values, KeyValueStoreSystem.NEW_KEY)
+        if self._savepoints:
+            self._savepoints[-1].remember_many(new_values, self._writes, old_values)
+        self._writes.update(new_values)
+        count_writes(self._value_count_deltas, old_values, new_values.values())
+        for key in new_values if self._deadlines else ():
+            if key in self._deadlines:
+                if self._savepoints:
+                    self._savepoints[-1].remember_deadline(key, self._deadlines[key])
+                del self._deadlines[key]
+
+    def get_many(self, keys, default_if_key_does_not_exist: Any = None) -> list:
+        if not self._writes:
+            return self._system.get_many(keys, default_if_key_does_not_exist, self._get_snapshot())
+        keys = list(keys)
+        values = [self._writes.get(key, Transaction.NOT_WRITTEN) for key in keys]
+        not_written = [key for key, value in zip(keys, values) if value is Transaction.NOT_WRITTEN]
+        committed_values = iter(self._system.get_many(not_written, default_if_key_does_not_exist, self._get_snapshot()))
+        for index, value in enumerate(values):
+            if value is Transaction.NOT_WRITTEN:
+                values[index] = next(committed_values)
+            elif value is Transaction.TOMBSTONE:
+                values[index] = default_if_key_does_not_exist
+        return values
 
-    def set_key(self, key, old_value, new_value):
-        self._assert_there_are_not_conflict(key, old_value)
-        self._storage[key] = new_value
+    def get(self, key, default_if_key_does_not_exist: Any = KeyError):
+        value = self._writes.get(key, Transaction.NOT_WRITTEN)
+        if value is Transaction.NOT_WRITTEN:
+            return self._system.get(key, default_if_key_does_not_exist, self._get_snapshot())
+        if value is Transaction.TOMBSTONE:
+            if default_if_key_does_not_exist is KeyError:
+                raise KeyError(key)
+            return default_if_key_does_not_exist
+        return value
+
+    def scan(self, start=None, end=None, limit: Optional[int] = None):
+        """Iterate in order over the keys from start to end, not included, and their values"""
+        # The committed items are streamed and the writes of the transaction take their place
+        written_items = sorted(
+            (key, value)
+            for key, value in self._writes.items()
+            if (start is None or key >= start) and (end is None or key < end)
+        )
+        committed_items = self._system.scan(start, end, self._get_snapshot())
+        items = self._merge_writes(merge(written_items, committed_items, key=itemgetter(0)))
+        return islice(items, limit)
+
+    def prefix(self, prefix, limit: Optional[int] = None):
+        """Iterate in order over the keys that start with prefix and their values"""
+        items = takewhile(lambda item: item[0].startswith(prefix), Transaction.scan(self, prefix))
+        return islice(items, limit)
+
+    @staticmethod
+    def _merge_writes(items):
+        previous_key = Transaction.NOT_WRITTEN
+        for key, value in items:
+            if key == previous_key:
+                continue
+            previous_key = key
+            if value is not Transaction.TOMBSTONE:
+                yield key, value
+
+    def _get_snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = self._system.take_snapshot()
+            self._release_snapshot = weakref.finalize(self, self._system.abandon_snapshot, self._snapshot)
+        return self._snapshot
 
-    def unset_key(self, key, old_value):
-        self._assert_there_are_not_conflict(key, old_value)
-        del self._storage[key]
+    def commit(self):
+        if self._savepoints:
+            savepoint = self._savepoints.pop()
+            if self._savepoints:
+                self._savepoints[-1].merge(savepoint)
+            return
+        self._system.commit(self._writes, self._snapshot, self._deadlines)
+        self._reset()
 
-    def _assert_there_are_not_conflict(self, key, old_value):
-        current_value = self.get(key, KeyValueStoreSystem.NEW_KEY)
-        if current_value != old_value:
-            raise KeyValueStoreSystem.TransactionConflict()
+    def rollback(self):
+        if self._savepoints:
+            self._savepoints.pop().undo(self._writes, self._value_count_deltas, self._deadlines)
+            return
+        self._reset()
+
+    def _reset(self):
+        if self._release_snapshot is not None:
+            self._release_snapshot.detach()
+            self._system.release_snapshot(self._snapshot)
+        self._snapshot = None
+        self._release_snapshot = None
+        self._writes = {}
+        self._value_count_deltas = Counter()
+        self._deadlines = {}
 
     def number_of_keys_with_value(self, a_value):
-        return sum(value == a_value for value in self._storage.values())
+        number = self._system.number_of_keys_with_value(a_value, self._get_snapshot())
+        return number + self._value_count_deltas[a_value]
 
 
-class Transaction:
-    def __init__(self, system: KeyValueStoreSystem):
-        self._system = system
-        self._operations = []
+class InstrumentedTransaction(Transaction):
+    """Transaction that records in the metrics of its system what it does"""
 
-    def set(self, key, value):
-        previous_operation = self._get_last_operation()
-        old_value = self.get(key, KeyValueStoreSystem.NEW_KEY)
-        self._operations.append(
-            SetKey(key, old_value=old_value, new_value=value, previous_operation=previous_operation)
-        )
+    __slots__ = ()
 
-    def get(self, key, default_if_key_does_not_exist: Any = KeyError):
-        last_operation = self._get_last_operation()
-        return last_operation.get(key, default_if_key_does_not_exist)
+    def __init__(self, system: KeyValueStoreSystem):
+        super().__init__(system)
+        system.metrics.increment("transactions")
 
-    def _get_last_operation(self):
-        return self._operations[-1] if self._operations else self._system
+    def get(self, key, default_if_key_does_not_exist: Any = KeyError):
+        start = time.perf_counter()
+        try:
+            return super().get(key, default_if_key_does_not_exist)
+        finally:
+            self._system.metrics.observe("get_seconds", time.perf_counter() - start)
 
     def commit(self):
-        self._system.commit(self._operations)
-        self._operations = []
+        if self._savepoints:
+            super().commit()
+            return
+        metrics = self._system.metrics
+        number_of_writes = len(self._writes)
+        start = time.perf_counter()
+        try:
+            super().commit()
+        except KeyValueStoreSystem.TransactionConflict:
+            metrics.increment("conflicts")
+            raise
+        metrics.observe("commit_seconds", time.perf_counter() - start)
+        metrics.observe("transaction_writes", number_of_writes)
+        metrics.increment("commits")
 
     def rollback(self):
-        self._operations = []
-
-    def unset(self, key):
-        previous_operation = self._get_last_operation()
-        old_value = self.get(key, KeyValueStoreSystem.NEW_KEY)
-        self._operations.append(Unset(key, old_value=old_value, previous_operation=previous_operation))
+        if not self._savepoints:
+            self._system.metrics.increment("rollbacks")
+        super().rollback()
 
     def number_of_keys_with_value(self, a_value):
-        last_operation = self._get_last_operation()
-        return last_operation.number_of_keys_with_value(a_value)
+        start = time.perf_counter()
+        number = super().number_of_keys_with_value(a_value)
+        self._system.metrics.observe("numequalto_seconds", time.perf_counter() - start)
+        return number
 
 
-class Operation(metaclass=ABCMeta):
-    @abstractmethod
-    def apply_on(self, system):
-        """Apply the operation in a system"""
+class SerializableTransaction(Transaction):
+    """Transaction whose commit also conflicts when a later commit changed what it read.
 
-    @abstractmethod
-    def get(self, key, default_if_key_does_not_exist):
-        """Get the value associated with a key"""
+    Keys written by the transaction itself are not remembered when read,
+    since the commit already checks them.
+    """
 
-    @abstractmethod
-    def number_of_keys_with_value(self, a_value):
-        """Get the number of keys with the same value"""
+    __slots__ = ("_read_set",)
 
+    def __init__(self, system: KeyValueStoreSystem):
+        super().__init__(system)
+        self._read_set = ReadSet()
+
+    def get(self, key, default_if_key_does_not_exist: Any = KeyError):
+        if key not in self._writes:
+            self._read_set.add_key(key)
+        return super().get(key, default_if_key_does_not_exist)
 
-class SetKey(Operation):
-    def __init__(self, key, old_value, new_value, previous_operation):
-        self._key = key
-        self._old_value = old_value
-        self._new_value = new_value
-        self._previous_operatation = previous_operation
+    def get_many(self, keys, default_if_key_does_not_exist: Any = None) -> list:
+        keys = list(keys)
+        self._read_set.add_keys(key for key in keys if key not in self._writes)
+        return super().get_many(keys, default_if_key_does_not_exist)
 
-    def apply_on(self, system):
-        system.set_key(self._key, self._old_value, self._new_value)
+    def scan(self, start=None, end=None, limit: Optional[int] = None):
+        self._read_set.add_range(start, end)
+        return super().scan(start, end, limit)
 
-    def get(self, key, default_if_key_does_not_exist):
-        if key == self._key:
-            return self._new_value
-        return self._previous_operatation.get(key, default_if_key_does_not_exist)
+    def prefix(self, prefix, limit: Optional[int] = None):
+        self._read_set.add_prefix(prefix)
+        return super().prefix(prefix, limit)
 
     def number_of_keys_with_value(self, a_value):
-        if a_value == self._new_value:
-            return 1 + self._previous_operatation.number_of_keys_with_value(a_value)
-        return self._previous_operatation.number_of_keys_with_value(a_value)
+        self._read_set.add_value(a_value)
+        return super().number_of_keys_with_value(a_value)
 
+    def commit(self):
+        if self._savepoints:
+            super().commit()
+            return
+        self._system.commit(self._writes, self._snapshot, self._deadlines, self._read_set)
+        self._reset()
 
-class Unset(Operation):
-    def __init__(self, key, old_value, previous_operation):
-        self._key = key
-        self._old_value = old_value
-        self._previous_operatation = previous_operation
+    def _reset(self):
+        super()._reset()
+        self._read_set = ReadSet()
 
-    def apply_on(self, system):
-        system.unset_key(self._key, self._old_value)
 
-    def get(self, key, default_if_key_does_not_exist):
-        if key == self._key:
-            if default_if_key_does_not_exist is KeyError:
-                raise KeyError(key)
-            return default_if_key_does_not_exist
-        return self._previous_operatation.get(key, default_if_key_does_not_exist)
+class InstrumentedSerializableTransaction(InstrumentedTransaction, SerializableTransaction):
+    __slots__ = ()
 
-    def number_of_keys_with_value(self, a_value):
-        if a_value == self._old_value:
-            return -1 + self._previous_operatation.number_of_keys_with_value(a_value)
-        return self._previous_operatation.number_of_keys_with_value(a_value)
+
+class Savepoint:
+    """What the writes of a nested transaction replaced in the write set"""
+
+    __slots__ = ("_previous_writes", "_value_count_deltas", "_previous_deadlines")
+
+    def __init__(self):
+        self._previous_writes = {}
+        self._value_count_deltas = Counter()
+        self._previous_deadlines = {}
+
+    def remember(self, key, previous_write, old_value, new_value):
+        if key not in self._previous_writes:
+            self._previous_writes[key] = previous_write
+        count_write(self._value_count_deltas, old_value, new_value)
+
+    def remember_many(self, new_values, writes, old_values):
+        for key in new_values:
+            if key not in self._previous_writes:
+                self._previous_writes[key] = writes.get(key, Transaction.NOT_WRITTEN)
+        count_writes(self._value_count_deltas, old_values, new_values.values())
+
+    def remember_deadline(self, key, previous_deadline):
+        self._previous_deadlines.setdefault(key, previous_deadline)
+
+    def merge(self, nested: "Savepoint"):
+        for key, previous_write in nested._previous_writes.items():
+            self._previous_writes.setdefault(key, previous_write)
+        for key, previous_deadline in nested._previous_deadlines.items():
+            self._previous_deadlines.setdefault(key, previous_deadline)
+        for value, delta in nested._value_count_deltas.items():
+            update_count(self._value_count_deltas, value, delta)
+
+    def undo(self, writes, value_count_deltas, deadlines):
+        for key, previous_write in self._previous_writes.items():
+            if previous_write is Transaction.NOT_WRITTEN:
+                del writes[key]
+            else:
+                writes[key] = previous_write
+        for key, previous_deadline in self._previous_deadlines.items():
+            if previous_deadline is None:
+                deadlines.pop(key, None)
+            else:
+                deadlines[key] = previous_deadline
+        for value, delta in self._value_count_deltas.items():
+            update_count(value_count_deltas, value, -delta)
+
+
+def count_write(value_count_deltas, old_value, new_value):
+    if old_value is not KeyValueStoreSystem.NEW_KEY:
+        update_count(value_count_deltas, old_value, -1)
+    if new_value is not Transaction.TOMBSTONE:
+        update_count(value_count_deltas, new_value, 1)
+
+
+def count_writes(value_count_deltas, old_values, new_values):
+    removed = Counter(old_values)
+    removed.pop(KeyValueStoreSystem.NEW_KEY, None)
+    added = Counter(new_values)
+    added.pop(Transaction.TOMBSTONE, None)
+    for value, number in removed.items():
+        update_count(value_count_deltas, value, -number)
+    for value, number in added.items():
+        update_count(value_count_deltas, value, number)
@@ -0,0 +1,118 @@
+"""Import and export of every key of a KeyValueStoreSystem, in bulk.
+
+Dumps are binary, the magic followed by each key, a string, and its
+value encoded as in the log, CSV, with a row per key and its value as text, or JSON
+lines, with an object with the key and the value per line, both strings
+like the ones of the CLI. The deadlines of the keys are not part of a
+dump.
+"""
+import csv
+import json
+import mmap
+import os
+import struct
+
+from keyvaluestore.codec import decode_value, encode_value
+from keyvaluestore.system import KeyValueStoreSystem, Transaction
+
+MAGIC = b"KVSDUMP1"
+FORMATS = ("binary", "csv", "jsonl")
+
+BUFFER_SIZE = 1 << 20
+
+
+class CorruptDump(ValueError):
+    """Raised when a file cannot be read as a dump in the given format"""
+
+
+def export_items(system: KeyValueStoreSystem, path, dump_format="binary") -> int:
+    """Write the last commit to a dump, while commits go on, and return the number of keys"""
+    snapshot = system.take_snapshot()
+    try:
+        return _WRITERS[dump_format](path, system.items(snapshot))
+    finally:
+        system.release_snapshot(snapshot)
+
+
+def import_items(system: KeyValueStoreSystem, path, dump_format="binary") -> int:
+    """Write the keys of a dump to the system, replacing the ones it has, and return their number"""
+    return system.import_items(_READERS[dump_format](path))
+
+
+def _write_binary(path, items) -> int:
+    number_of_items = 0
+    with open(path, "wb", buffering=BUFFER_SIZE) as dump:
+        dump.write(MAGIC)
+        for key, value in items:
+            dump.write(encode_value(key) + encode_value(value))
+            number_of_items += 1
+    return number_of_items
+
+
+def _read_binary(path):
+    if os.path.getsize(path) < len(MAGIC):
+        raise CorruptDump(path)
+    with open(path, "rb") as dump, mmap.mmap(dump.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if mapped[: len(MAGIC)] != MAGIC:
+            raise CorruptDump(path)
+        offset = len(MAGIC)
+        while offset < len(mapped):
+            try:
+                key, value_offset = decode_value(mapped, offset)
+                value, end = decode_value(mapped, value_offset)
+            except (struct.error, KeyError, ValueError) as error:
+                raise CorruptDump(f"{path} has a corrupt record at offset {offset}") from error
+            if end > len(mapped):
+                raise CorruptDump(f"{path} ends in the middle of the record at offset {offset}")
+            if type(key) is not str:
+                raise CorruptDump(f"{path} has a key that is not a string at offset {offset}")
+            if value is Transaction.TOMBSTONE:
+                raise CorruptDump(f"{path} has a deleted value at offset {offset}")
+            offset = end
+            yield key, value
+
+
+def _write_csv(path, items) -> int:
+    number_of_items = 0
+    with open(path, "w", newline="", buffering=BUFFER_SIZE) as dump:
+        writer = csv.writer(dump)
+        for item in items:
+            writer.writerow(item)
+            number_of_items += 1
+    return number_of_items
+
+
+def _read_csv(path):
+    with open(path, newline="", buffering=BUFFER_SIZE) as dump:
+        for row in csv.reader(dump):
+            if len(row) != 2:
+                raise CorruptDump(f"{path} has a row with {len(row)} fields instead of a key and a value")
+            yield row[0], row[1]
+
+
+def _write_json_lines(path, items) -> int:
+    number_of_items = 0
+    with open(path, "w", buffering=BUFFER_SIZE) as dump:
+        for key, value in items:
+            dump.write(json.dumps({"key": key, "value": value}) + "\n")
+            number_of_items += 1
+    return number_of_items
+
+
+def _read_json_lines(path):
+    with open(path, buffering=BUFFER_SIZE) as dump:
+        for line_number, line in enumerate(dump, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                key, value = item["key"], item["value"]
+            except (ValueError, TypeError, KeyError) as error:
+                raise CorruptDump(f"{path} has no key and value in line {line_number}") from error
+            if type(key) is not str or type(value) is not str:
+                raise CorruptDump(f"{path} has a key or a value that is not a string in line {line_number}")
+            yield key, value
+
+
+_WRITERS = {"binary": _write_binary, "csv": _write_csv, "jsonl": _write_json_lines}
+_READERS = {"binary": _read_binary, "csv": _read_csv, "jsonl": _read_json_lines}
@@ -0,0 +1,216 @@
+import glob
+import os
+import struct
+import threading
+import zlib
+
+from keyvaluestore.codec import VERSION, decode_deadlines, decode_writes, encode_deadlines, encode_writes
+
+# Every record is framed by the length and the CRC32 of its payload
+FRAME = struct.Struct(">II")
+
+
+class LogFailed(OSError):
+    """Raised by a log that could not write or sync its records, which takes no more records after that"""
+
+
+class WriteAheadLog:
+    """Append-only log of the net write set of every commit, and the deadlines it set.
+
+    Commits append their record while they hold the commit lock, so records
+    are in commit order, and then wait until the record is durable without
+    holding it. Whoever finds records waiting writes all of them and syncs
+    the file once, so concurrent committers share a single fsync (group
+    commit). The sync policy decides when the file is synced: on every
+    group commit (``always``), from a background thread every
+    ``sync_interval`` seconds (``interval``), or only when the operating
+    system decides to (``never``). In the last two modes a commit waits until
+    its record reaches the operating system, so only a machine crash can lose
+    it.
+
+    ``roll`` closes the file and renames it after the last version it holds,
+    and ``truncate`` removes the closed files a snapshot made unnecessary.
+
+    A write or a sync that fails can leave part of the records in the file,
+    so nothing can be written after them: the commits that were waiting
+    fail, and so does every later commit, until the program starts again
+    from the records that are whole.
+    """
+
+    SYNC_ALWAYS = "always"
+    SYNC_INTERVAL = "interval"
+    SYNC_NEVER = "never"
+
+    SYNC_POLICIES = (SYNC_ALWAYS, SYNC_INTERVAL, SYNC_NEVER)
+
+    def __init__(self, path, sync=SYNC_ALWAYS, sync_interval=0.01):
+        if sync not in WriteAheadLog.SYNC_POLICIES:
+            raise ValueError(f"Unknown sync policy {sync!r}")
+        self._path = path
+        self._sync = sync
+        self._file = open(path, "ab")
+        self._condition = threading.Condition()
+        self._pending = []
+        self._last_appended = 0
+        self._last_written = 0
+        self._last_synced = 0
+        self._is_writing = False
+        self._is_syncing = False
+        self._is_closed = False
+        self._is_failed = False
+        if sync == WriteAheadLog.SYNC_INTERVAL:
+            self._syncer = threading.Thread(target=self._sync_periodically, args=(sync_interval,), daemon=True)
+            self._syncer.start()
+
+    def replay(self):
+        """Yield the version, the write set and the deadlines of every complete record in the log.
+
+        A record that was being written when the process stopped is cut off
+        the end of the file.
+        """
+        for segment in self._closed_segments():
+            yield from self._replay_segment(segment)
+        yield from self._replay_segment(self._path)
+
+    def _closed_segments(self):
+        return sorted(glob.glob(f"{glob.escape(self._path)}.{'[0-9]' * 20}"))
+
+    def _replay_segment(self, path):
+        end_of_valid_records = 0
+        with open(path, "rb") as log:
+            while True:
+                frame = log.read(FRAME.size)
+                if len(frame) < FRAME.size:
+                    break
+                length, checksum = FRAME.unpack(frame)
+                payload = log.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                end_of_valid_records += FRAME.size + length
+                yield decode_record(payload)
+        if end_of_valid_records < os.path.getsize(path):
+            os.truncate(path, end_of_valid_records)
+
+    def encode(self, version, writes, deadlines=None) -> bytes:
+        """Return the record of a commit, to append it, or fail if the log cannot take it"""
+        if self._is_failed:
+            raise LogFailed(f"Writing {self._path} failed before")
+        return encode_record(version, writes, deadlines)
+
+    def append(self, version, record: bytes):
+        with self._condition:
+            self._pending.append(record)
+            self._last_appended = version
+
+    def wait_until_durable(self, version):
+        with self._condition:
+            while self._last_durable() < version:
+                if self._is_failed:
+                    raise LogFailed(f"Writing {self._path} failed before version {version} was durable")
+                if self._is_writing:
+                    self._condition.wait()
+                else:
+                    self._write_pending_records()
+
+    def _last_durable(self):
+        if self._sync == WriteAheadLog.SYNC_ALWAYS:
+            return self._last_synced
+        return self._last_written
+
+    def _write_pending_records(self):
+        records, self._pending = self._pending, []
+        last_version = self._last_appended
+        self._is_writing = True
+        self._condition.release()
+        is_written = False
+        try:
+            self._file.write(b"".join(records))
+            self._file.flush()
+            if self._sync == WriteAheadLog.SYNC_ALWAYS:
+                os.fsync(self._file.fileno())
+            is_written = True
+        finally:
+            self._condition.acquire()
+            self._is_writing = False
+            self._is_failed = self._is_failed or not is_written
+            self._condition.notify_all()
+        self._last_written = last_version
+        if self._sync == WriteAheadLog.SYNC_ALWAYS:
+            self._last_synced = last_version
+
+    def roll(self):
+        """Continue the log in a new file"""
+        with self._condition:
+            while self._is_writing or self._is_syncing:
+                self._condition.wait()
+            if self._is_failed:
+                raise LogFailed(f"Writing {self._path} failed before")
+            if self._pending:
+                self._write_pending_records()
+            if self._file.tell() == 0:
+                return
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self._path, f"{self._path}.{self._last_appended:020d}")
+            self._file = open(self._path, "ab")
+            self._last_synced = self._last_written
+
+    def truncate(self, version):
+        """Remove the closed files that only have records up to the given version"""
+        for segment in self._closed_segments():
+            if int(segment.rsplit(".", 1)[1]) <= version:
+                os.remove(segment)
+
+    def _sync_periodically(self, sync_interval):
+        while True:
+            with self._condition:
+                self._condition.wait(timeout=sync_interval)
+                if self._is_closed:
+                    return
+                last_written = self._last_written
+                if self._last_synced >= last_written:
+                    continue
+                self._is_syncing = True
+                fileno = self._file.fileno()
+            is_synced = False
+            try:
+                os.fsync(fileno)
+                is_synced = True
+            finally:
+                with self._condition:
+                    self._is_syncing = False
+                    if is_synced:
+                        self._last_synced = max(self._last_synced, last_written)
+                    else:
+                        self._is_failed = True
+                    self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            while self._is_writing or self._is_syncing:
+                self._condition.wait()
+            if self._pending and not self._is_failed:
+                self._write_pending_records()
+            self._is_closed = True
+            self._condition.notify_all()
+        if self._sync == WriteAheadLog.SYNC_INTERVAL:
+            self._syncer.join()
+        if self._sync != WriteAheadLog.SYNC_NEVER and not self._is_failed:
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+
+def encode_record(version, writes, deadlines=None) -> bytes:
+    """Frame the version, the write set and the deadlines of a commit"""
+    payload = VERSION.pack(version) + encode_writes(writes)
+    if deadlines:
+        payload += encode_deadlines(deadlines)
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_record(payload) -> tuple:
+    """Return the version, the write set and the deadlines of the payload of a record"""
+    (version,) = VERSION.unpack_from(payload)
+    writes, offset = decode_writes(payload, VERSION.size)
+    deadlines = decode_deadlines(payload, offset)[0] if offset < len(payload) else {}
+    return version, writes, deadlines
@@ -0,0 +1,33 @@
+import io
+from unittest import TestCase
+
+from keyvaluestore.bench import WORKLOADS, report, run
+from keyvaluestore.storage import InMemoryStorage
+
+
+class BenchTests(TestCase):
+    def test_run_every_workload(self):
+        results = run(list(WORKLOADS), InMemoryStorage, operations=200, isolated=False)
+
+        self.assertEqual(results["storage"], "InMemoryStorage")
+        self.assertEqual(list(results["workloads"]), list(WORKLOADS))
+        for name, result in results["workloads"].items():
+            with self.subTest(workload=name):
+                self.assertGreater(result["operations"], 0)
+                self.assertGreater(result["operations_per_second"], 0)
+                self.assertLessEqual(result["p50_us"], result["p99_us"])
+        self.assertIn("conflicts", results["workloads"]["high-conflict"])
+
+    def test_compare_with_a_baseline(self):
+        results = run(["read-heavy"], InMemoryStorage, operations=100, isolated=False)
+        baseline = {"workloads": {"read-heavy": dict(results["workloads"]["read-heavy"])}}
+        baseline["workloads"]["read-heavy"]["operations_per_second"] = results["workloads"]["read-heavy"][
+            "operations_per_second"
+        ] / 2
+        output = io.StringIO()
+
+        report(results, baseline, output)
+
+        header, line = output.getvalue().splitlines()
+        self.assertTrue(header.endswith("vs baseline"))
+        self.assertTrue(line.endswith("2.00x"))
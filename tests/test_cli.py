@@ -2,6 +2,7 @@ import io
 from unittest import TestCase
 
 from keyvaluestore.cli import KeyValueStoreCLI
+from keyvaluestore.metrics import Metrics
 from keyvaluestore.system import KeyValueStoreSystem
 
 
@@ -70,9 +71,9 @@ class CliTests(TestCase):
         (
             given_a_CLI()
             .type("SET hello")
-            .expect("ERROR: Expected 2 arguments but got 1")
+            .expect("ERROR: Expected 2 to 4 arguments but got 1")
             .type("SET hello world world")
-            .expect("ERROR: Expected 2 arguments but got 3")
+            .expect("ERROR: Unknown option 'world'")
             .type("GET")
             .expect("ERROR: Expected 1 arguments but got 0")
             .type("UNSET")
@@ -153,6 +154,130 @@ class CliTests(TestCase):
             .do_it()
         )
 
+    def test_nested_transactions(self):
+        (
+            given_a_CLI()
+            .type("BEGIN")
+            .type("SET hello world")
+            .type("BEGIN")
+            .type("SET hello you")
+            .type("ROLLBACK")
+            .type("GET hello")
+            .expect("world")
+            .type("BEGIN")
+            .type("SET bye world")
+            .type("COMMIT")
+            .type("COMMIT")
+            .type("GET hello")
+            .expect("ERROR: Enter BEGIN command to start")
+            .type("BEGIN")
+            .type("NUMEQUALTO world")
+            .expect("2")
+            .type("END")
+            .do_it()
+        )
+
+    def test_set_get_and_unset_many_keys(self):
+        (
+            given_a_CLI()
+            .type("BEGIN")
+            .type("MSET hello world bye world")
+            .expect("OK")
+            .type("MGET hello missing bye")
+            .expect("world (NULL) world")
+            .type("NUMEQUALTO world")
+            .expect("2")
+            .type("MUNSET hello bye")
+            .expect("OK")
+            .type("MGET hello bye")
+            .expect("(NULL) (NULL)")
+            .type("MSET hello")
+            .expect("ERROR: Expected pairs of keys and values but got 1 arguments")
+            .type("MGET")
+            .expect("ERROR: Expected at least 1 argument but got 0")
+            .type("END")
+            .do_it()
+        )
+
+    def test_scan_keys_in_order(self):
+        (
+            given_a_CLI()
+            .type("BEGIN")
+            .type("MSET user:2 b user:1 a other c")
+            .expect("OK")
+            .type("SCAN user: user;")
+            .expect("user:1=a user:2=b")
+            .type("SCAN a z 1")
+            .expect("other=c")
+            .type("PREFIX user: 1")
+            .expect("user:1=a")
+            .type("PREFIX nobody")
+            .expect("(EMPTY)")
+            .type("PREFIX user: many")
+            .expect("ERROR: The limit must be a number but got 'many'")
+            .type("SCAN a")
+            .expect("ERROR: Expected 2 to 3 arguments but got 1")
+            .type("END")
+            .do_it()
+        )
+
+    def test_expire_keys(self):
+        (
+            given_a_CLI()
+            .type("BEGIN")
+            .type("SET session data EX 3600")
+            .expect("session=data")
+            .type("EXPIRE session 60")
+            .expect("1")
+            .type("EXPIRE missing 60")
+            .expect("0")
+            .type("SET session data PX 3600")
+            .expect("ERROR: Unknown option 'PX 3600'")
+            .type("EXPIRE session soon")
+            .expect("ERROR: The seconds must be a positive number but got 'soon'")
+            .type("END")
+            .do_it()
+        )
+
+    def test_stats(self):
+        (
+            given_a_CLI()
+            .type("BEGIN")
+            .type("SET hello world")
+            .type("COMMIT")
+            .type("STATS")
+            .expect("last_commit 1\nopen_snapshots 0\nhistory_versions 0\ntombstones 0\nexpiring_keys 0")
+            .type("END")
+            .do_it()
+        )
+
+
+class ValuesOfOtherTypesTests(TestCase):
+    def test_get_many_values_that_are_not_text(self):
+        system = KeyValueStoreSystem()
+        transaction = system.begin()
+        transaction.set_many({"answer": 42, "half": 0.5})
+        transaction.commit()
+        cli_output = io.StringIO()
+
+        KeyValueStoreCLI(system, io.StringIO("BEGIN\nMGET answer half\n"), cli_output, batch=True).run()
+
+        self.assertEqual(cli_output.getvalue(), "OK\n42 0.5\n")
+
+
+class StatsTests(TestCase):
+    def test_write_large_counters_with_all_their_digits(self):
+        system = KeyValueStoreSystem(metrics=Metrics())
+        system.replicate(1_234_567, {"hello": "world"})
+        cli_output = io.StringIO()
+
+        KeyValueStoreCLI(system, io.StringIO("BEGIN\nGET hello\nSTATS\n"), cli_output, batch=True).run()
+
+        statistics = cli_output.getvalue().splitlines()[2:]
+        self.assertIn("last_commit 1234567", statistics)
+        self.assertIn("transactions 1", statistics)
+        self.assertIn("get_seconds_count 1", statistics)
+
 
 class CLITestRunner:
     def __init__(self):
@@ -212,3 +337,26 @@ class CLITestRunner:
 
 def given_a_CLI() -> CLITestRunner:
     return CLITestRunner()
+
+
+class BatchModeTests(TestCase):
+    def test_write_only_the_responses(self):
+        commands = ["BEGIN", "SET hello world", "GET hello", "banana", "END", "GET hello"]
+        cli_input = io.StringIO("\n".join(commands))
+        cli_output = io.StringIO()
+
+        KeyValueStoreCLI(KeyValueStoreSystem(), cli_input, cli_output, batch=True).run()
+
+        actual = cli_output.getvalue()
+        expected = "OK\nhello=world\nworld\nERROR: Unknown command 'BANANA'\nGood bye\n"
+        self.assertEqual(actual, expected)
+
+    def test_read_the_input_in_several_chunks(self):
+        number_of_keys = 10_000
+        commands = ["BEGIN"] + [f"SET key-{number} value" for number in range(number_of_keys)] + ["NUMEQUALTO value"]
+        cli_input = io.StringIO("\n".join(commands))
+        cli_output = io.StringIO()
+
+        KeyValueStoreCLI(KeyValueStoreSystem(), cli_input, cli_output, batch=True).run()
+
+        self.assertEqual(cli_output.getvalue().splitlines()[-1], str(number_of_keys))
@@ -0,0 +1,33 @@
+from unittest import TestCase
+
+from keyvaluestore.codec import (
+    UnsupportedValue,
+    decode_deadlines,
+    decode_writes,
+    encode_deadlines,
+    encode_value,
+    encode_writes,
+)
+from keyvaluestore.system import Transaction
+
+
+class CodecTests(TestCase):
+    def test_decode_the_encoded_writes(self):
+        writes = {"text": "ñandú", "number": -42, "float": 0.5, b"bytes": b"\x00\xff", "deleted": Transaction.TOMBSTONE}
+
+        actual, end = decode_writes(memoryview(encode_writes(writes)))
+
+        self.assertEqual(actual, writes)
+        self.assertEqual(end, len(encode_writes(writes)))
+
+    def test_decode_the_encoded_deadlines(self):
+        deadlines = {"session": 1700000000.25, 42: 0.0}
+
+        actual, end = decode_deadlines(encode_deadlines(deadlines))
+
+        self.assertEqual(actual, deadlines)
+        self.assertEqual(end, len(encode_deadlines(deadlines)))
+
+    def test_reject_values_it_cannot_encode(self):
+        with self.assertRaises(UnsupportedValue):
+            encode_value(["a", "list"])
@@ -0,0 +1,90 @@
+import threading
+from unittest import TestCase
+
+from keyvaluestore.system import KeyValueStoreSystem
+
+NUMBER_OF_THREADS = 8
+NUMBER_OF_ITERATIONS = 200
+
+
+class ConcurrencyTests(TestCase):
+    def setUp(self):
+        self.system = KeyValueStoreSystem()
+
+    def test_concurrent_increments_of_the_same_key_are_not_lost(self):
+        self.set_committed_value("counter", 0)
+
+        def increment():
+            for _ in range(NUMBER_OF_ITERATIONS):
+                self.retry_on_conflict(lambda transaction: transaction.set("counter", transaction.get("counter") + 1))
+
+        run_in_threads(increment)
+
+        actual = self.system.begin().get("counter")
+        expected = NUMBER_OF_THREADS * NUMBER_OF_ITERATIONS
+        self.assertEqual(actual, expected)
+
+    def test_transactions_writing_different_keys_do_not_conflict(self):
+        def write_own_keys():
+            thread_name = threading.current_thread().name
+            for number in range(NUMBER_OF_ITERATIONS):
+                transaction = self.system.begin()
+                transaction.set(f"{thread_name}-{number}", number)
+                transaction.commit()
+
+        run_in_threads(write_own_keys)
+
+        actual = self.system.begin().number_of_keys_with_value(0)
+        expected = NUMBER_OF_THREADS
+        self.assertEqual(actual, expected)
+
+    def test_readers_always_see_a_consistent_snapshot(self):
+        self.set_committed_value("a", 100)
+        self.set_committed_value("b", 0)
+        inconsistent_reads = []
+
+        def transfer():
+            for _ in range(NUMBER_OF_ITERATIONS):
+                self.retry_on_conflict(move_one_unit)
+
+        def move_one_unit(transaction):
+            transaction.set("a", transaction.get("a") - 1)
+            transaction.set("b", transaction.get("b") + 1)
+
+        def read():
+            for _ in range(NUMBER_OF_ITERATIONS):
+                transaction = self.system.begin()
+                total = transaction.get("a") + transaction.get("b")
+                transaction.rollback()
+                if total != 100:
+                    inconsistent_reads.append(total)
+
+        run_in_threads(transfer, read)
+
+        self.assertEqual(inconsistent_reads, [])
+
+    def set_committed_value(self, key, value):
+        transaction = self.system.begin()
+        transaction.set(key, value)
+        transaction.commit()
+
+    def retry_on_conflict(self, change):
+        while True:
+            transaction = self.system.begin()
+            change(transaction)
+            try:
+                transaction.commit()
+                return
+            except KeyValueStoreSystem.TransactionConflict:
+                transaction.rollback()
+
+
+def run_in_threads(*targets):
+    threads = [
+        threading.Thread(target=targets[number % len(targets)], name=f"thread-{number}")
+        for number in range(NUMBER_OF_THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+from keyvaluestore.index import SortedKeys
+
+
+class SortedKeysTests(TestCase):
+    def test_keep_the_keys_in_order(self):
+        keys = SortedKeys(["d", "b"], bucket_size=2)
+
+        for key in ["a", "e", "c", "b", "f", "g"]:
+            keys.add(key)
+        keys.discard("e")
+        keys.discard("x")
+
+        self.assertEqual(keys.keys_from(None, 10), ["a", "b", "c", "d", "f", "g"])
+        self.assertEqual(len(keys), 6)
+        self.assertIn("f", keys)
+        self.assertNotIn("e", keys)
+
+    def test_get_the_keys_from_a_key(self):
+        keys = SortedKeys(range(0, 100, 2), bucket_size=4)
+
+        self.assertEqual(keys.keys_from(10, 3), [10, 12, 14])
+        self.assertEqual(keys.keys_from(10, 3, inclusive=False), [12, 14, 16])
+        self.assertEqual(keys.keys_from(11, 2), [12, 14])
+        self.assertEqual(keys.keys_from(97, 2), [98])
+        self.assertEqual(keys.keys_from(99, 2), [])
+
+    def test_split_and_remove_buckets(self):
+        keys = SortedKeys(bucket_size=2)
+
+        for key in range(20):
+            keys.add(key)
+        for key in range(0, 20, 3):
+            keys.discard(key)
+        for key in range(5):
+            keys.discard(key)
+
+        expected = [key for key in range(5, 20) if key % 3]
+        self.assertEqual(keys.keys_from(None, 100), expected)
@@ -0,0 +1,191 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from keyvaluestore import mapped
+from keyvaluestore.mapped import CorruptStorage, MappedStorage
+from keyvaluestore.snapshot import SnapshotFile
+from keyvaluestore.system import KeyValueStoreSystem
+from keyvaluestore.wal import WriteAheadLog
+from tests.test_wal import FailingFile
+
+
+class MappedStorageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "kvs.data")
+        self.storage = MappedStorage(self.path)
+        self.addCleanup(lambda: self.storage.close())
+
+    def reopen(self):
+        self.storage.close()
+        self.storage = MappedStorage(self.path)
+
+    def test_keep_the_number_of_keys_with_each_value(self):
+        self.storage.set("a", 1, "x")
+        self.storage.set("b", 1, "x")
+        self.storage.set("a", 2, "y")
+        self.storage.delete("b")
+
+        self.assertEqual(self.storage.number_of_keys_with_value("x"), 0)
+        self.assertEqual(self.storage.number_of_keys_with_value("y"), 1)
+        self.assertEqual(self.storage.get("a"), (2, "y"))
+        self.assertIsNone(self.storage.get("b"))
+
+    def test_keep_the_keys_when_the_file_is_opened_again(self):
+        self.storage.apply(1, {"a": "x", "b": 42, 3: b"bytes"}, [])
+        self.storage.apply(2, {"a": "y"}, ["b"])
+        self.storage.set_last_version(2)
+
+        self.reopen()
+
+        self.assertEqual(self.storage.last_version(), 2)
+        self.assertEqual(self.storage.get("a"), (2, "y"))
+        self.assertEqual(self.storage.get(3), (1, b"bytes"))
+        self.assertIsNone(self.storage.get("b"))
+        self.assertEqual(sorted(self.storage.keys(), key=str), [3, "a"])
+        self.assertEqual(self.storage.number_of_keys_with_value("y"), 1)
+
+    def test_grow_the_table_when_half_of_the_slots_are_used(self):
+        number_of_keys = mapped.MINIMUM_NUMBER_OF_SLOTS * 3
+        for number in range(number_of_keys):
+            self.storage.set(f"key-{number}", number, number % 7)
+
+        self.assertEqual(self.storage.get("key-0"), (0, 0))
+        self.assertEqual(self.storage.get(f"key-{number_of_keys - 1}"), (number_of_keys - 1, (number_of_keys - 1) % 7))
+        self.assertEqual(len(self.storage.keys()), number_of_keys)
+        self.assertEqual(sum(self.storage.number_of_keys_with_value(value) for value in range(7)), number_of_keys)
+
+    def test_compact_the_file_when_half_of_it_is_garbage(self):
+        value = "x" * 1024
+        for version in range(1, 4 * mapped.MINIMUM_GARBAGE_TO_COMPACT // len(value)):
+            self.storage.set("key", version, value)
+
+        self.assertLess(os.path.getsize(self.path), 4 * mapped.MINIMUM_GARBAGE_TO_COMPACT)
+        self.assertEqual(self.storage.get("key")[1], value)
+
+    def test_count_the_slots_again_after_an_incomplete_change(self):
+        self.storage.apply(1, {"a": "x", "b": "x"}, [])
+        self.storage._write_header(is_clean=False)
+        self.storage._number_of_keys = 0
+
+        self.reopen()
+
+        self.assertEqual(self.storage._number_of_keys, 2)
+        self.assertEqual(self.storage.number_of_keys_with_value("x"), 2)
+
+    def test_reject_files_that_are_not_mapped_storages(self):
+        self.storage.close()
+        with open(self.path, "wb") as file:
+            file.write(b"not a hash table")
+
+        with self.assertRaises(CorruptStorage):
+            self.storage = MappedStorage(self.path)
+        self.storage = MappedStorage(f"{self.path}.new")
+
+
+class SystemWithMappedStorageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "kvs.data")
+        self.log_path = os.path.join(directory.name, "kvs.log")
+        self.snapshot_path = os.path.join(directory.name, "kvs.snapshot")
+
+    def commit(self, system, **values):
+        transaction = system.begin()
+        transaction.set_many(values)
+        transaction.commit()
+
+    def test_start_from_the_keys_in_the_file(self):
+        system = KeyValueStoreSystem(MappedStorage(self.path))
+        self.commit(system, hello="world", answer=42)
+        self.commit(system, hello="you")
+        system.end()
+
+        system = KeyValueStoreSystem(MappedStorage(self.path))
+
+        transaction = system.begin()
+        self.assertEqual(transaction.get("hello"), "you")
+        self.assertEqual(transaction.get("answer"), 42)
+        self.assertEqual(transaction.number_of_keys_with_value("you"), 1)
+        self.commit(system, hello="again")
+        system.end()
+
+    def test_replay_only_the_commits_of_the_log_that_are_newer_than_the_file(self):
+        system = KeyValueStoreSystem(MappedStorage(self.path), log=WriteAheadLog(self.log_path))
+        self.commit(system, hello="world")
+        storage_of_a_previous_run = MappedStorage(f"{self.path}.old")
+        storage_of_a_previous_run.apply(1, {"hello": "world", "only in the file": "key"}, [])
+        storage_of_a_previous_run.set_last_version(1)
+        storage_of_a_previous_run.close()
+        self.commit(system, hello="you")
+        system.end()
+        os.replace(f"{self.path}.old", self.path)
+
+        system = KeyValueStoreSystem(MappedStorage(self.path), log=WriteAheadLog(self.log_path))
+
+        transaction = system.begin()
+        self.assertEqual(transaction.get("hello"), "you")
+        self.assertEqual(transaction.get("only in the file"), "key")
+        system.end()
+
+    def test_replace_the_keys_of_the_file_with_a_newer_snapshot(self):
+        system = KeyValueStoreSystem(log=WriteAheadLog(self.log_path), snapshot_file=SnapshotFile(self.snapshot_path))
+        self.commit(system, hello="world")
+        system.checkpoint()
+        system.end()
+        storage_of_a_previous_run = MappedStorage(self.path)
+        storage_of_a_previous_run.apply(0, {"stale": "key"}, [])
+        storage_of_a_previous_run.close()
+
+        system = KeyValueStoreSystem(
+            MappedStorage(self.path), log=WriteAheadLog(self.log_path), snapshot_file=SnapshotFile(self.snapshot_path)
+        )
+
+        transaction = system.begin()
+        self.assertEqual(transaction.get("hello"), "world")
+        self.assertIsNone(transaction.get("stale", None))
+        system.end()
+
+    def test_keep_the_deadlines_of_the_keys_in_the_file_after_a_restart(self):
+        system = KeyValueStoreSystem(
+            MappedStorage(self.path), log=WriteAheadLog(self.log_path), snapshot_file=SnapshotFile(self.snapshot_path)
+        )
+        transaction = system.begin()
+        transaction.set("expired in the snapshot", "data", time_to_live=0)
+        transaction.set("persisted", "data", time_to_live=0)
+        transaction.commit()
+        system.checkpoint()
+        transaction = system.begin()
+        transaction.set("expired in the log", "data", time_to_live=0)
+        transaction.set("persisted", "again")
+        transaction.commit()
+        system.end()
+
+        system = KeyValueStoreSystem(
+            MappedStorage(self.path), log=WriteAheadLog(self.log_path), snapshot_file=SnapshotFile(self.snapshot_path)
+        )
+
+        transaction = system.begin()
+        self.assertIsNone(transaction.get("expired in the snapshot", None))
+        self.assertIsNone(transaction.get("expired in the log", None))
+        self.assertEqual(transaction.get("persisted"), "again")
+        self.assertEqual(system.statistics()["expiring_keys"], 2)
+        system.end()
+
+    def test_keep_out_of_the_file_the_commits_that_the_log_could_not_write(self):
+        log = WriteAheadLog(self.log_path)
+        system = KeyValueStoreSystem(MappedStorage(self.path), log=log)
+        self.commit(system, hello="world")
+        log._file = FailingFile(log._file)
+        with self.assertRaises(OSError):
+            self.commit(system, hello="you", lost="key")
+        system.end()
+
+        system = KeyValueStoreSystem(MappedStorage(self.path), log=WriteAheadLog(self.log_path))
+
+        self.assertEqual(system.last_commit, 1)
+        self.assertEqual(system.get_many(["hello", "lost"], "missing"), ["world", "missing"])
+        system.end()
@@ -0,0 +1,113 @@
+import threading
+import urllib.request
+from unittest import TestCase
+
+from keyvaluestore.metrics import Histogram, Metrics, start_metrics_server
+from keyvaluestore.system import InstrumentedTransaction, KeyValueStoreSystem, Transaction
+
+
+class MetricsTests(TestCase):
+    def test_transactions_are_not_instrumented_without_metrics(self):
+        system = KeyValueStoreSystem()
+
+        self.assertIs(type(system.begin()), Transaction)
+        self.assertIsInstance(KeyValueStoreSystem(metrics=Metrics()).begin(), InstrumentedTransaction)
+
+    def test_count_commits_conflicts_and_rollbacks(self):
+        metrics = Metrics()
+        system = KeyValueStoreSystem(metrics=metrics)
+        transaction = system.begin()
+        transaction.set("hello", "world")
+        transaction.set("bye", "world")
+        transaction.begin()
+        transaction.rollback()
+        transaction.commit()
+        first, second = system.begin(), system.begin()
+        first.get("hello")
+        second.get("hello")
+        first.set("hello", "you")
+        second.set("hello", "me")
+        first.commit()
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            second.commit()
+        second.rollback()
+
+        summary = metrics.summary()
+        self.assertEqual(summary["transactions"], 3)
+        self.assertEqual(summary["commits"], 2)
+        self.assertEqual(summary["conflicts"], 1)
+        self.assertEqual(summary["rollbacks"], 1)
+        self.assertEqual(summary["get_seconds_count"], 2)
+        self.assertEqual(summary["commit_seconds_count"], 2)
+        self.assertEqual(summary["transaction_writes_p99"], 4)
+
+    def test_count_the_expired_keys(self):
+        metrics = Metrics()
+        system = KeyValueStoreSystem(metrics=metrics)
+        transaction = system.begin()
+        transaction.set("session", "data", time_to_live=0)
+        transaction.commit()
+
+        system.expire_keys()
+
+        self.assertEqual(metrics.summary()["expired_keys"], 1)
+
+    def test_histograms_estimate_quantiles_by_the_bounds_of_their_buckets(self):
+        histogram = Histogram((1.0, 10.0, 100.0))
+        for value in [0.5] * 90 + [50] * 9 + [1000]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.quantile(0.5), 1.0)
+        self.assertEqual(histogram.quantile(0.99), 100.0)
+        self.assertEqual(histogram.quantile(1), float("inf"))
+        self.assertEqual(Histogram((1.0,)).quantile(0.5), 0.0)
+
+    def test_gauges_of_the_system(self):
+        system = KeyValueStoreSystem()
+        reader = system.begin()
+        reader.get("hello", None)
+        writer = system.begin()
+        writer.set("hello", "world")
+        writer.commit()
+
+        statistics = system.statistics()
+
+        self.assertEqual(statistics["last_commit"], 1)
+        self.assertEqual(statistics["open_snapshots"], 1)
+        self.assertEqual(statistics["history_versions"], 1)
+
+    def test_serve_the_metrics_in_the_prometheus_format(self):
+        metrics = Metrics()
+        metrics.increment("commits", 3)
+        metrics.observe("commit_seconds", 0.001)
+        server = start_metrics_server(lambda: metrics.to_prometheus({"open_snapshots": 2}), port=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            text = response.read().decode()
+
+        self.assertIn("# TYPE keyvaluestore_commits_total counter\nkeyvaluestore_commits_total 3\n", text)
+        self.assertIn('keyvaluestore_commit_seconds_bucket{le="0.0009765625"} 0\n', text)
+        self.assertIn('keyvaluestore_commit_seconds_bucket{le="0.001953125"} 1\n', text)
+        self.assertIn('keyvaluestore_commit_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("keyvaluestore_commit_seconds_count 1\n", text)
+        self.assertIn("# TYPE keyvaluestore_open_snapshots gauge\nkeyvaluestore_open_snapshots 2\n", text)
+
+    def test_concurrent_observations_are_all_counted(self):
+        metrics = Metrics()
+
+        def observe():
+            for _ in range(1000):
+                metrics.observe("get_seconds", 0.000001)
+                metrics.increment("commits")
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        summary = metrics.summary()
+        self.assertEqual(summary["get_seconds_count"], 4000)
+        self.assertEqual(summary["commits"], 4000)
@@ -0,0 +1,160 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from keyvaluestore.replication import ReplicationFollower, ReplicationLeader
+from keyvaluestore.system import KeyValueStoreSystem
+from keyvaluestore.wal import WriteAheadLog
+
+
+class ReplicationTests(TestCase):
+    def setUp(self):
+        self.leader_system = KeyValueStoreSystem()
+        self.leader = ReplicationLeader(self.leader_system, port=0)
+        self.addCleanup(self.leader.close)
+
+    def follow(self):
+        follower = ReplicationFollower(*self.leader.address)
+        self.addCleanup(follower.close)
+        return follower
+
+    def commit(self, **values):
+        transaction = self.leader_system.begin()
+        for key, value in values.items():
+            if value is None:
+                transaction.unset(key)
+            else:
+                transaction.set(key, value)
+        transaction.commit()
+        return self.leader_system.last_commit
+
+    def test_start_from_a_snapshot_of_the_leader(self):
+        self.commit(hello="world", answer=42)
+        self.commit(gone="soon")
+        self.commit(gone=None)
+
+        follower = self.follow()
+
+        self.assertEqual(follower.position, 3)
+        transaction = follower.begin()
+        self.assertEqual(transaction.get("hello"), "world")
+        self.assertEqual(transaction.get("answer"), 42)
+        self.assertIsNone(transaction.get("gone", None))
+
+    def test_apply_the_commits_of_the_leader_in_order(self):
+        self.commit(hello="world")
+        follower = self.follow()
+
+        for number in range(100):
+            version = self.commit(counter=number, hello=None if number % 2 else "world")
+
+        self.assertTrue(follower.wait_for(version, timeout=5))
+        self.assertEqual(follower.position, version)
+        transaction = follower.begin()
+        self.assertEqual(transaction.get("counter"), 99)
+        self.assertIsNone(transaction.get("hello", None))
+        self.assertEqual(transaction.number_of_keys_with_value(99), 1)
+
+    def test_snapshot_reads_at_a_position_are_not_changed_by_later_commits(self):
+        version = self.commit(hello="world")
+        follower = self.follow()
+        reader = follower.begin()
+        self.assertEqual(reader.get("hello"), "world")
+
+        follower.wait_for(self.commit(hello="you"), timeout=5)
+
+        self.assertEqual(reader.get("hello"), "world")
+        self.assertEqual(follower.begin().get("hello"), "you")
+        self.assertGreater(follower.position, version)
+
+    def test_replicate_the_deadlines(self):
+        follower = self.follow()
+        transaction = self.leader_system.begin()
+        transaction.set("session", "data", time_to_live=0.05)
+        transaction.commit()
+        follower.wait_for(self.leader_system.last_commit, timeout=5)
+
+        self.assertEqual(follower.begin().get("session"), "data")
+        time.sleep(0.1)
+        self.assertIsNone(follower.begin().get("session", None))
+        self.assertEqual(self.leader_system.expire_keys(), 1)
+        self.assertTrue(follower.wait_for(self.leader_system.last_commit, timeout=5))
+
+    def test_followers_are_read_only(self):
+        follower = self.follow()
+        transaction = follower.begin()
+        transaction.set("hello", "world")
+
+        with self.assertRaises(KeyValueStoreSystem.ReadOnly):
+            transaction.commit()
+        self.assertEqual(follower.system.expire_keys(), 0)
+
+    def test_many_followers(self):
+        followers = [self.follow() for _ in range(3)]
+
+        version = self.commit(hello="world")
+
+        for follower in followers:
+            self.assertTrue(follower.wait_for(version, timeout=5))
+            self.assertEqual(follower.begin().get("hello"), "world")
+
+    def test_stop_when_the_leader_closes(self):
+        follower = self.follow()
+
+        self.leader.close()
+
+        self.assertFalse(follower.wait_for(1, timeout=5))
+        self.assertIsNotNone(follower.error)
+
+
+class ReplicationWithLogTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = SlowLog(os.path.join(directory.name, "kvs.log"))
+        self.leader_system = KeyValueStoreSystem(log=self.log)
+        self.addCleanup(self.leader_system.end)
+        self.leader = ReplicationLeader(self.leader_system, port=0)
+        self.addCleanup(self.leader.close)
+
+    def commit(self, **values):
+        transaction = self.leader_system.begin()
+        transaction.set_many(values)
+        transaction.commit()
+
+    def test_a_follower_gets_the_commits_waiting_for_the_log_when_it_connects(self):
+        self.commit(a="1")
+        self.log.records_can_be_durable.clear()
+        committer = threading.Thread(target=self.commit, kwargs={"b": "2"})
+        committer.start()
+        while not self.leader_system._waiting_commits:
+            time.sleep(0.001)
+        followers = []
+        connector = threading.Thread(target=lambda: followers.append(ReplicationFollower(*self.leader.address)))
+        connector.start()
+        time.sleep(0.05)
+
+        self.log.records_can_be_durable.set()
+        committer.join()
+        connector.join()
+        follower = followers[0]
+        self.addCleanup(follower.close)
+        self.commit(c="3")
+
+        self.assertTrue(follower.wait_for(3, timeout=5))
+        self.assertEqual(follower.begin().get_many(["a", "b", "c"]), ["1", "2", "3"])
+
+
+class SlowLog(WriteAheadLog):
+    """Log whose records are durable only when they are allowed to"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.records_can_be_durable = threading.Event()
+        self.records_can_be_durable.set()
+
+    def wait_until_durable(self, version):
+        self.records_can_be_durable.wait(timeout=5)
+        super().wait_until_durable(version)
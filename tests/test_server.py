@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from unittest import IsolatedAsyncioTestCase
+
+from keyvaluestore.cli import KeyValueStoreCLI
+from keyvaluestore.server import start_server
+from keyvaluestore.system import KeyValueStoreSystem
+
+
+class ServerTests(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.system = CommitWaitingSystem()
+        self.server = await start_server(self.system, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.addCleanup(writer.close)
+        return reader, writer
+
+    async def send(self, connection, *lines):
+        reader, writer = connection
+        writer.write("".join(f"{line}\n" for line in lines).encode())
+        await writer.drain()
+        return [(await reader.readline()).decode().removesuffix("\n") for _ in lines]
+
+    async def test_answer_pipelined_commands_in_order(self):
+        connection = await self.connect()
+
+        actual = await self.send(connection, "BEGIN", "SET hello world", "GET hello", "NUMEQUALTO world", "banana")
+
+        expected = ["OK", "hello=world", "world", "1", "ERROR: Unknown command 'BANANA'"]
+        self.assertEqual(actual, expected)
+
+    async def test_every_connection_has_its_own_transaction(self):
+        connection1 = await self.connect()
+        connection2 = await self.connect()
+
+        await self.send(connection1, "BEGIN", "SET hello world")
+        self.assertEqual(await self.send(connection2, "BEGIN", "GET hello"), ["OK", "(NULL)"])
+        await self.send(connection1, "COMMIT")
+        self.assertEqual(await self.send(connection2, "ROLLBACK", "GET hello"), ["OK", "world"])
+
+    async def test_report_conflicts_between_connections(self):
+        connection1 = await self.connect()
+        connection2 = await self.connect()
+
+        await self.send(connection1, "BEGIN", "SET hello world")
+        await self.send(connection2, "BEGIN", "SET hello you", "COMMIT")
+        actual = await self.send(connection1, "COMMIT")
+
+        self.assertEqual(actual, [KeyValueStoreCLI.ERROR_TRANSACTION_CONFLICT])
+
+    async def test_close_the_connection_on_end(self):
+        reader, writer = await self.connect()
+
+        self.assertEqual(await self.send((reader, writer), "END"), ["Good bye"])
+        self.assertEqual(await reader.read(), b"")
+
+    async def test_wait_for_the_rest_of_a_line(self):
+        reader, writer = await self.connect()
+
+        writer.write(b"BEGIN\nSET hel")
+        await writer.drain()
+        await asyncio.sleep(0.01)
+        writer.write(b"lo world\n")
+
+        self.assertEqual([await reader.readline(), await reader.readline()], [b"OK\n", b"hello=world\n"])
+
+    async def test_answer_the_commands_after_a_commit_in_order(self):
+        connection = await self.connect()
+
+        actual = await self.send(connection, "BEGIN", "SET hello world", "COMMIT", "BEGIN", "GET hello", "banana")
+
+        expected = ["OK", "hello=world", "OK", "OK", "world", "ERROR: Unknown command 'BANANA'"]
+        self.assertEqual(actual, expected)
+
+    async def test_serve_other_connections_while_a_commit_waits(self):
+        connection1 = await self.connect()
+        connection2 = await self.connect()
+        await self.send(connection1, "BEGIN", "SET hello world")
+        self.system.commits_can_end.clear()
+        reader1, writer1 = connection1
+        writer1.write(b"COMMIT\nBEGIN\nGET hello\n")
+
+        self.assertEqual(await self.send(connection2, "BEGIN", "GET hello"), ["OK", "(NULL)"])
+        self.system.commits_can_end.set()
+        self.assertEqual([await reader1.readline() for _ in range(3)], [b"OK\n", b"OK\n", b"world\n"])
+
+
+class CommitWaitingSystem(KeyValueStoreSystem):
+    """System whose commits wait until they are allowed to end, like a commit waiting for the log"""
+
+    def __init__(self):
+        super().__init__()
+        self.commits_can_end = threading.Event()
+        self.commits_can_end.set()
+
+    @property
+    def has_log(self):
+        return True
+
+    def commit(self, *arguments, **keyword_arguments):
+        self.commits_can_end.wait(timeout=5)
+        super().commit(*arguments, **keyword_arguments)
@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from keyvaluestore.shared import ReaderPool, SharedSnapshotReader, SharedSnapshots
+from keyvaluestore.system import KeyValueStoreSystem
+
+
+class SharedSnapshotsTests(TestCase):
+    def setUp(self):
+        self.system = KeyValueStoreSystem()
+        transaction = self.system.begin()
+        transaction.set_many({"hello": "world", "bye": "world", "answer": 42})
+        transaction.commit()
+        self.snapshots = SharedSnapshots(self.system)
+        self.addCleanup(self.snapshots.close)
+
+    def test_read_the_published_snapshot(self):
+        reader = SharedSnapshotReader(self.snapshots.name)
+        self.addCleanup(reader.close)
+
+        self.assertEqual(reader.get("hello"), "world")
+        self.assertEqual(reader.get("answer"), 42)
+        self.assertIsNone(reader.get("missing", None))
+        with self.assertRaises(KeyError):
+            reader.get("missing")
+        self.assertEqual(reader.number_of_keys_with_value("world"), 2)
+        self.assertEqual(reader.number_of_keys_with_value("nothing"), 0)
+        self.assertEqual(reader.version, 1)
+
+    def test_readers_move_to_the_next_snapshot(self):
+        reader = SharedSnapshotReader(self.snapshots.name)
+        self.addCleanup(reader.close)
+        reader.get("hello")
+        transaction = self.system.begin()
+        transaction.set("hello", "you")
+        transaction.unset("bye")
+        transaction.commit()
+
+        self.assertEqual(reader.get("hello"), "world")
+        self.assertEqual(self.snapshots.publish(), 2)
+
+        self.assertEqual(reader.get("hello"), "you")
+        self.assertIsNone(reader.get("bye", None))
+        self.assertEqual(reader.number_of_keys_with_value("world"), 0)
+        self.assertEqual(reader.version, 2)
+
+    def test_publish_only_new_commits(self):
+        self.assertEqual(self.snapshots.publish(), 1)
+        self.assertEqual(self.snapshots.version, 1)
+
+    def test_publish_many_keys(self):
+        transaction = self.system.begin()
+        transaction.set_many((f"key-{number}", number % 10) for number in range(5000))
+        transaction.commit()
+        self.snapshots.publish()
+        reader = SharedSnapshotReader(self.snapshots.name)
+        self.addCleanup(reader.close)
+
+        self.assertEqual([reader.get(f"key-{number}") for number in range(5000)], [number % 10 for number in range(5000)])
+        self.assertEqual(reader.number_of_keys_with_value(3), 500)
+
+    def test_read_from_a_pool_of_processes(self):
+        with ReaderPool(self.snapshots.name, processes=2) as pool:
+            self.assertEqual(pool.get_many(["hello", "missing", "answer"]), ["world", None, 42])
+            self.assertEqual(pool.number_of_keys_with_value("world"), 2)
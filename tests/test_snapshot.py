@@ -0,0 +1,117 @@
+import glob
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from keyvaluestore.codec import encode_value
+from keyvaluestore.snapshot import HEADER, MAGIC_WITHOUT_DEADLINES, SnapshotFile
+from keyvaluestore.system import KeyValueStoreSystem
+from keyvaluestore.wal import WriteAheadLog
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_path = os.path.join(directory.name, "kvs.log")
+        self.snapshot_path = os.path.join(directory.name, "kvs.snapshot")
+        self.system = self.start_system()
+
+    def start_system(self):
+        return KeyValueStoreSystem(log=WriteAheadLog(self.log_path), snapshot_file=SnapshotFile(self.snapshot_path))
+
+    def commit(self, **values):
+        transaction = self.system.begin()
+        for key, value in values.items():
+            if value is None:
+                transaction.unset(key)
+            else:
+                transaction.set(key, value)
+        transaction.commit()
+
+    def test_start_from_the_snapshot_and_the_rest_of_the_log(self):
+        self.commit(hello="world", answer=42, gone="soon")
+        self.commit(gone=None)
+        self.system.checkpoint()
+        self.commit(hello="you", new="key")
+        self.system.end()
+
+        self.system = self.start_system()
+
+        transaction = self.system.begin()
+        self.assertEqual(transaction.get("hello"), "you")
+        self.assertEqual(transaction.get("answer"), 42)
+        self.assertEqual(transaction.get("new"), "key")
+        self.assertEqual(transaction.number_of_keys_with_value("world"), 0)
+        with self.assertRaises(KeyError):
+            transaction.get("gone")
+        self.system.end()
+
+    def test_start_with_the_deadlines_of_the_snapshot(self):
+        transaction = self.system.begin()
+        transaction.set("session", "data", time_to_live=3600)
+        transaction.commit()
+        self.system.checkpoint()
+        self.system.end()
+
+        self.system = self.start_system()
+
+        self.assertEqual(self.system.begin().get("session"), "data")
+        self.assertEqual(self.system.expire_keys(now=time.time() + 7200), 1)
+        self.assertIsNone(self.system.begin().get("session", None))
+        self.system.end()
+
+    def test_read_snapshots_written_without_deadlines(self):
+        with open(self.snapshot_path, "wb") as snapshot:
+            snapshot.write(HEADER.pack(MAGIC_WITHOUT_DEADLINES, 7, 1) + encode_value("hello") + encode_value("world"))
+
+        version, items, deadlines = SnapshotFile(self.snapshot_path).read()
+
+        self.assertEqual((version, list(items), deadlines), (7, [("hello", "world")], {}))
+        self.system.end()
+
+    def test_a_checkpoint_removes_the_log_files_it_made_unnecessary(self):
+        for number in range(3):
+            self.commit(key=number)
+            self.system.checkpoint()
+
+        self.assertEqual(glob.glob(f"{self.log_path}.*"), [])
+        self.system.end()
+
+    def test_concurrent_checkpoints_keep_every_commit(self):
+        errors = []
+
+        def checkpoint_many_times():
+            try:
+                for _ in range(20):
+                    self.system.checkpoint()
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=checkpoint_many_times) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for number in range(100):
+            self.commit(**{f"key-{number}": number})
+        for thread in threads:
+            thread.join()
+        self.system.end()
+
+        self.assertEqual(errors, [])
+        self.system = self.start_system()
+        self.assertEqual(self.system.begin().get_many([f"key-{number}" for number in range(100)]), list(range(100)))
+        self.system.end()
+
+    def test_the_items_of_a_snapshot_do_not_change_with_later_commits(self):
+        self.commit(kept="value", changed="old", removed="value")
+        snapshot = self.system.take_snapshot()
+
+        self.commit(changed="new", removed=None, created="value")
+
+        actual = dict(self.system.items(snapshot))
+        expected = {"kept": "value", "changed": "old", "removed": "value"}
+        self.assertEqual(actual, expected)
+        self.system.release_snapshot(snapshot)
+        self.system.end()
@@ -0,0 +1,206 @@
+import threading
+from unittest import TestCase
+
+from keyvaluestore.storage import (
+    CachedStorage,
+    CompactStorage,
+    HashPartitioner,
+    InMemoryStorage,
+    RangePartitioner,
+    ShardedStorage,
+)
+from keyvaluestore.system import KeyValueStoreSystem
+
+
+class StorageTests(TestCase):
+    def test_keep_the_number_of_keys_with_each_value(self):
+        storage = InMemoryStorage()
+
+        storage.set("a", 1, "x")
+        storage.set("b", 1, "x")
+        storage.set("a", 2, "y")
+        storage.delete("b")
+
+        self.assertEqual(storage.number_of_keys_with_value("x"), 0)
+        self.assertEqual(storage.number_of_keys_with_value("y"), 1)
+        self.assertEqual(storage.get("a"), (2, "y"))
+        self.assertIsNone(storage.get("b"))
+
+    def test_apply_the_writes_of_a_commit_at_once(self):
+        storage = InMemoryStorage()
+        storage.apply(1, {"a": "x", "b": "x", "c": "y"}, [])
+
+        storage.apply(2, {"a": "y"}, ["b", "d"])
+
+        self.assertEqual(storage.number_of_keys_with_value("x"), 0)
+        self.assertEqual(storage.number_of_keys_with_value("y"), 2)
+        self.assertEqual(storage.get("a"), (2, "y"))
+        self.assertEqual(storage.get("c"), (1, "y"))
+        self.assertIsNone(storage.get("b"))
+
+
+class CompactStorageTests(TestCase):
+    def test_keep_the_number_of_keys_with_each_value(self):
+        storage = CompactStorage()
+
+        storage.set("a", 1, "x")
+        storage.set("b", 1, "x")
+        storage.set("a", 2, "y")
+        storage.delete("b")
+
+        self.assertEqual(storage.number_of_keys_with_value("x"), 0)
+        self.assertEqual(storage.number_of_keys_with_value("y"), 1)
+        self.assertEqual(storage.get("a"), (2, "y"))
+        self.assertIsNone(storage.get("b"))
+
+    def test_keep_each_value_once(self):
+        storage = CompactStorage()
+        storage.apply(1, {"a": "".join(["x", "y"]), "b": "".join(["x", "y"])}, [])
+
+        storage.set("c", 2, "".join(["x", "y"]))
+
+        self.assertIs(storage.get("a")[1], storage.get("c")[1])
+        self.assertIs(storage.get("a"), storage.get("b"))
+        self.assertEqual(storage.number_of_keys_with_value("xy"), 3)
+
+    def test_reuse_the_ids_of_values_no_key_has(self):
+        storage = CompactStorage()
+        storage.apply(1, {"a": "x", "b": "y"}, [])
+
+        storage.delete("b")
+        storage.set("a", 2, "z")
+
+        self.assertEqual(storage.get("a"), (2, "z"))
+        self.assertEqual(storage.number_of_keys_with_value("x"), 0)
+        self.assertEqual(storage.number_of_keys_with_value("y"), 0)
+        self.assertEqual(storage.number_of_keys_with_value("z"), 1)
+        self.assertEqual(len(storage._values), 2)
+
+    def test_read_equal_values_of_different_types_as_they_were_written(self):
+        storage = CompactStorage()
+        storage.apply(1, {"a": 1, "b": 1.0, "c": True}, [])
+
+        self.assertEqual([type(storage.get(key)[1]) for key in "abc"], [int, float, bool])
+        self.assertEqual(storage.number_of_keys_with_value(1), 3)
+
+        storage.delete("a")
+
+        self.assertEqual([type(storage.get(key)[1]) for key in "bc"], [float, bool])
+        self.assertEqual(storage.number_of_keys_with_value(True), 2)
+
+
+class CachedStorageTests(TestCase):
+    def test_read_each_key_from_the_storage_once(self):
+        storage = CachedStorage(InMemoryStorage(), max_entries=10)
+        storage.set("a", 1, "x")
+
+        for _ in range(3):
+            self.assertEqual(storage.get("a"), (1, "x"))
+            self.assertIsNone(storage.get("b"))
+
+        self.assertEqual((storage.hits, storage.misses, storage.evictions), (4, 2, 0))
+
+    def test_a_commit_drops_the_keys_it_writes(self):
+        storage = CachedStorage(InMemoryStorage(), max_entries=10)
+        storage.set("a", 1, "x")
+        storage.get("a")
+        storage.get("b")
+
+        storage.apply(2, {"b": "y"}, ["a"])
+
+        self.assertIsNone(storage.get("a"))
+        self.assertEqual(storage.get("b"), (2, "y"))
+        self.assertEqual(storage.number_of_keys_with_value("y"), 1)
+
+    def test_evict_the_least_recently_used_entries(self):
+        storage = CachedStorage(InMemoryStorage(), max_entries=2)
+        storage.apply(1, {"a": "x", "b": "x", "c": "x"}, [])
+        storage.get("a")
+        storage.get("b")
+        storage.get("a")
+
+        storage.get("c")
+
+        self.assertEqual(storage.evictions, 1)
+        storage.get("a")
+        self.assertEqual(storage.misses, 3)
+        storage.get("b")
+        self.assertEqual(storage.misses, 4)
+
+    def test_bound_the_bytes_of_the_entries(self):
+        storage = CachedStorage(InMemoryStorage(), max_bytes=10_000)
+        storage.apply(1, {number: "x" * 1000 for number in range(100)}, [])
+
+        for number in range(100):
+            storage.get(number)
+
+        self.assertLessEqual(storage._size, 10_000)
+        self.assertGreater(storage.evictions, 80)
+
+    def test_do_not_cache_an_entry_read_while_a_commit_was_applied(self):
+        storage = CachedStorage(InMemoryStorage(), max_entries=10)
+        storage.set("a", 1, "x")
+        read_from_the_storage = storage._storage.get
+
+        def commit_while_reading(key):
+            entry = read_from_the_storage(key)
+            storage.set("a", 2, "y")
+            return entry
+
+        storage._storage.get = commit_while_reading
+        self.assertEqual(storage.get("a"), (1, "x"))
+        storage._storage.get = read_from_the_storage
+
+        self.assertEqual(storage.get("a"), (2, "y"))
+
+
+class PartitionerTests(TestCase):
+    def test_range_partitioner_splits_keys_by_boundaries(self):
+        partitioner = RangePartitioner(["m", "f"])
+
+        self.assertEqual(partitioner.number_of_partitions, 3)
+        self.assertEqual(partitioner.partition_of("apple"), 0)
+        self.assertEqual(partitioner.partition_of("f"), 1)
+        self.assertEqual(partitioner.partition_of("zebra"), 2)
+
+    def test_hash_partitioner_spreads_keys_between_all_partitions(self):
+        partitioner = HashPartitioner(4)
+
+        partitions = {partitioner.partition_of(f"key-{number}") for number in range(100)}
+
+        self.assertEqual(partitions, {0, 1, 2, 3})
+
+
+class ShardedStorageTests(TestCase):
+    def test_a_commit_only_locks_the_shards_of_its_keys(self):
+        storage = ShardedStorage(RangePartitioner(["m"]))
+        system = KeyValueStoreSystem(storage)
+        committed = threading.Event()
+
+        def commit_in_the_first_shard():
+            transaction = system.begin()
+            transaction.set("apple", "red")
+            transaction.commit()
+            committed.set()
+
+        with storage.locking(["zebra"]):
+            threading.Thread(target=commit_in_the_first_shard).start()
+            self.assertTrue(committed.wait(timeout=5))
+
+    def test_count_keys_with_the_same_value_in_every_shard(self):
+        storage = ShardedStorage(HashPartitioner(8))
+        for number in range(100):
+            storage.set(f"key-{number}", 1, number % 2)
+
+        self.assertEqual(storage.number_of_keys_with_value(0), 50)
+
+    def test_apply_the_writes_of_a_commit_to_every_shard(self):
+        storage = ShardedStorage(HashPartitioner(8))
+        storage.apply(1, {f"key-{number}": number % 2 for number in range(100)}, [])
+
+        storage.apply(2, {"key-0": 1}, [f"key-{number}" for number in range(1, 100, 2)])
+
+        self.assertEqual(storage.number_of_keys_with_value(0), 49)
+        self.assertEqual(storage.number_of_keys_with_value(1), 1)
+        self.assertEqual(storage.get("key-0"), (2, 1))
+        self.assertIsNone(storage.get("key-1"))
@@ -1,5 +1,13 @@
-from unittest import TestCase
-
+import os
+import tempfile
+import time
+import tracemalloc
+from unittest import TestCase, mock
+
+from keyvaluestore.index import SortedKeys
+from keyvaluestore.mapped import MappedStorage
+from keyvaluestore.readset import ReadSet
+from keyvaluestore.storage import CachedStorage, CompactStorage, HashPartitioner, RangePartitioner, ShardedStorage
 from keyvaluestore.system import KeyValueStoreSystem
 
 A_KEY = "key"
@@ -123,3 +131,609 @@ class TestSystem(TestCase):
         actual = transaction2.number_of_keys_with_value(A_VALUE)
         expected = 2
         self.assertEqual(actual, expected)
+
+    def test_a_transaction_with_many_writes_can_read_its_own_values(self):
+        transaction = self.system.begin()
+        for number in range(10_000):
+            transaction.set(A_KEY, number)
+        transaction.unset(ANOTHER_KEY)
+
+        actual = transaction.get(A_KEY)
+        expected = 9_999
+        self.assertEqual(actual, expected)
+        with self.assertRaises(KeyError):
+            transaction.get(ANOTHER_KEY)
+
+    def test_overwriting_a_key_in_a_transaction_only_counts_its_last_value(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, A_VALUE)
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        transaction2.set(A_KEY, A_VALUE)
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+
+        self.assertEqual(transaction2.number_of_keys_with_value(A_VALUE), 0)
+        self.assertEqual(transaction2.number_of_keys_with_value(ANOTHER_VALUE), 1)
+
+    def test_the_number_of_keys_with_a_value_is_updated_on_commit(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, A_VALUE)
+        transaction1.set(ANOTHER_KEY, A_VALUE)
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        transaction2.unset(ANOTHER_KEY)
+        transaction2.commit()
+
+        transaction3 = self.system.begin()
+        self.assertEqual(transaction3.number_of_keys_with_value(A_VALUE), 0)
+        self.assertEqual(transaction3.number_of_keys_with_value(ANOTHER_VALUE), 1)
+
+    def test_a_rejected_commit_does_not_change_any_key(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, A_VALUE)
+        transaction1.set(ANOTHER_KEY, A_VALUE)
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        transaction3 = self.system.begin()
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        transaction2.set(ANOTHER_KEY, ANOTHER_VALUE)
+        transaction3.set(ANOTHER_KEY, ANOTHER_VALUE)
+        transaction3.commit()
+
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction2.commit()
+
+        transaction4 = self.system.begin()
+        self.assertEqual(transaction4.get(A_KEY), A_VALUE)
+        self.assertEqual(transaction4.number_of_keys_with_value(A_VALUE), 1)
+
+    def test_commit_the_net_effect_of_a_transaction(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, A_VALUE)
+        transaction1.unset(A_KEY)
+        transaction1.set(ANOTHER_KEY, A_VALUE)
+        transaction1.set(ANOTHER_KEY, ANOTHER_VALUE)
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        with self.assertRaises(KeyError):
+            transaction2.get(A_KEY)
+        self.assertEqual(transaction2.get(ANOTHER_KEY), ANOTHER_VALUE)
+
+    def test_a_transaction_keeps_reading_from_its_snapshot(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, A_VALUE)
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        transaction2.get(A_KEY)
+        transaction3 = self.system.begin()
+        transaction3.set(A_KEY, ANOTHER_VALUE)
+        transaction3.set(ANOTHER_KEY, A_VALUE)
+        transaction3.commit()
+        transaction4 = self.system.begin()
+        transaction4.unset(A_KEY)
+        transaction4.commit()
+
+        self.assertEqual(transaction2.get(A_KEY), A_VALUE)
+        self.assertEqual(transaction2.number_of_keys_with_value(A_VALUE), 1)
+        with self.assertRaises(KeyError):
+            transaction2.get(ANOTHER_KEY)
+
+    def test_reject_the_commit_when_the_key_changed_back_to_the_value_the_transaction_read(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, A_VALUE)
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        transaction3 = self.system.begin()
+        transaction3.set(A_KEY, ANOTHER_VALUE)
+        transaction3.commit()
+        transaction4 = self.system.begin()
+        transaction4.set(A_KEY, A_VALUE)
+        transaction4.commit()
+
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction2.commit()
+
+    def test_reject_the_commit_when_another_transaction_created_the_key_and_removed_it(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, A_VALUE)
+        transaction2 = self.system.begin()
+        transaction2.set(ANOTHER_KEY, A_VALUE)
+        transaction2.commit()
+        transaction3 = self.system.begin()
+        transaction3.unset(ANOTHER_KEY)
+        transaction3.commit()
+
+        transaction1.set(ANOTHER_KEY, ANOTHER_VALUE)
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction1.commit()
+
+    def test_rollback_a_nested_transaction_keeps_the_changes_of_the_enclosing_one(self):
+        transaction = self.system.begin()
+        transaction.set(A_KEY, A_VALUE)
+        transaction.begin()
+        transaction.set(A_KEY, ANOTHER_VALUE)
+        transaction.set(ANOTHER_KEY, ANOTHER_VALUE)
+        transaction.unset(A_KEY)
+
+        transaction.rollback()
+
+        self.assertEqual(transaction.get(A_KEY), A_VALUE)
+        self.assertEqual(transaction.number_of_keys_with_value(A_VALUE), 1)
+        self.assertEqual(transaction.number_of_keys_with_value(ANOTHER_VALUE), 0)
+        with self.assertRaises(KeyError):
+            transaction.get(ANOTHER_KEY)
+
+    def test_commit_a_nested_transaction_into_the_enclosing_one(self):
+        transaction = self.system.begin()
+        transaction.begin()
+        transaction.set(A_KEY, A_VALUE)
+        transaction.begin()
+        transaction.set(ANOTHER_KEY, A_VALUE)
+        transaction.commit()
+
+        self.assertEqual(transaction.number_of_keys_with_value(A_VALUE), 2)
+        transaction.rollback()
+
+        self.assertEqual(transaction.nesting_level, 0)
+        self.assertEqual(transaction.number_of_keys_with_value(A_VALUE), 0)
+        with self.assertRaises(KeyError):
+            transaction.get(ANOTHER_KEY)
+
+    def test_changes_of_nested_transactions_are_stored_when_the_outermost_one_commits(self):
+        transaction1 = self.system.begin()
+        transaction1.begin()
+        transaction1.set(A_KEY, A_VALUE)
+        transaction1.commit()
+        transaction1.begin()
+        transaction1.set(ANOTHER_KEY, A_VALUE)
+        transaction1.rollback()
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        self.assertEqual(transaction2.get(A_KEY), A_VALUE)
+        with self.assertRaises(KeyError):
+            transaction2.get(ANOTHER_KEY)
+
+    def test_set_and_get_many_keys_at_once(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, ANOTHER_VALUE)
+        transaction1.set_many({A_KEY: A_VALUE, ANOTHER_KEY: A_VALUE})
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        actual = transaction2.get_many([A_KEY, A_NON_EXISTENT_KEY, ANOTHER_KEY])
+        self.assertEqual(actual, [A_VALUE, None, A_VALUE])
+        self.assertEqual(transaction2.number_of_keys_with_value(A_VALUE), 2)
+        self.assertEqual(transaction2.number_of_keys_with_value(ANOTHER_VALUE), 0)
+
+    def test_get_many_keys_mixes_the_writes_of_the_transaction_with_its_snapshot(self):
+        transaction1 = self.system.begin()
+        transaction1.set_many([(A_KEY, A_VALUE), (ANOTHER_KEY, A_VALUE)])
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        transaction2.unset(ANOTHER_KEY)
+
+        self.assertEqual(transaction2.get_many([ANOTHER_KEY, A_KEY], default_if_key_does_not_exist=0), [0, ANOTHER_VALUE])
+
+    def test_unset_many_keys_at_once(self):
+        transaction1 = self.system.begin()
+        transaction1.set_many({A_KEY: A_VALUE, ANOTHER_KEY: A_VALUE})
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        transaction2.unset_many([A_KEY, ANOTHER_KEY, A_NON_EXISTENT_KEY])
+        self.assertEqual(transaction2.number_of_keys_with_value(A_VALUE), 0)
+        transaction2.commit()
+
+        transaction3 = self.system.begin()
+        self.assertEqual(transaction3.get_many([A_KEY, ANOTHER_KEY]), [None, None])
+        self.assertEqual(transaction3.number_of_keys_with_value(A_VALUE), 0)
+
+    def test_rollback_many_writes_of_a_nested_transaction(self):
+        transaction = self.system.begin()
+        transaction.set(A_KEY, A_VALUE)
+        transaction.begin()
+        transaction.set_many({A_KEY: ANOTHER_VALUE, ANOTHER_KEY: ANOTHER_VALUE})
+        transaction.unset_many([A_KEY])
+
+        transaction.rollback()
+
+        self.assertEqual(transaction.get_many([A_KEY, ANOTHER_KEY]), [A_VALUE, None])
+        self.assertEqual(transaction.number_of_keys_with_value(A_VALUE), 1)
+        self.assertEqual(transaction.number_of_keys_with_value(ANOTHER_VALUE), 0)
+
+    def test_many_writes_are_rejected_together_on_conflict(self):
+        transaction1 = self.system.begin()
+        transaction2 = self.system.begin()
+        transaction1.get(A_KEY, None)
+        transaction2.set(ANOTHER_KEY, A_VALUE)
+        transaction2.commit()
+
+        transaction1.set_many({A_KEY: A_VALUE, ANOTHER_KEY: ANOTHER_VALUE})
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction1.commit()
+
+        transaction3 = self.system.begin()
+        self.assertEqual(transaction3.get_many([A_KEY, ANOTHER_KEY]), [None, A_VALUE])
+
+    def test_scan_the_keys_of_a_range_in_order(self):
+        transaction1 = self.system.begin()
+        transaction1.set_many({"a": 1, "b": 2, "c": 3, "d": 4})
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        self.assertEqual(list(transaction2.scan("b", "d")), [("b", 2), ("c", 3)])
+        self.assertEqual(list(transaction2.scan(limit=2)), [("a", 1), ("b", 2)])
+        self.assertEqual(list(transaction2.scan("bb")), [("c", 3), ("d", 4)])
+
+    def test_scan_the_writes_of_the_transaction_with_the_committed_keys(self):
+        transaction1 = self.system.begin()
+        transaction1.set_many({"a": 1, "b": 2, "c": 3})
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        transaction2.set("b", 20)
+        transaction2.set("bb", 22)
+        transaction2.unset("c")
+
+        self.assertEqual(list(transaction2.scan()), [("a", 1), ("b", 20), ("bb", 22)])
+
+    def test_scan_the_keys_of_the_snapshot_of_the_transaction(self):
+        transaction1 = self.system.begin()
+        transaction1.set_many({"a": 1, "b": 2})
+        transaction1.commit()
+        transaction2 = self.system.begin()
+        self.assertEqual(list(transaction2.scan()), [("a", 1), ("b", 2)])
+
+        transaction3 = self.system.begin()
+        transaction3.unset("a")
+        transaction3.set_many({"b": 20, "c": 30})
+        transaction3.commit()
+
+        self.assertEqual(list(transaction2.scan()), [("a", 1), ("b", 2)])
+        self.assertEqual(list(self.system.begin().scan()), [("b", 20), ("c", 30)])
+
+    def test_scan_more_keys_than_a_batch(self):
+        number_of_keys = KeyValueStoreSystem.SCAN_BATCH_SIZE * 3 + 1
+        transaction1 = self.system.begin()
+        transaction1.set_many({f"key-{number:04}": number for number in range(number_of_keys)})
+        transaction1.commit()
+
+        actual = [value for _, value in self.system.begin().scan()]
+        self.assertEqual(actual, list(range(number_of_keys)))
+
+    def test_get_the_keys_with_a_prefix(self):
+        transaction = self.system.begin()
+        transaction.set_many({"user:1:name": "a", "user:12:name": "b", "user:2:name": "c", "users": "d"})
+
+        actual = [key for key, _ in transaction.prefix("user:1")]
+        self.assertEqual(actual, ["user:12:name", "user:1:name"])
+        self.assertEqual(list(transaction.prefix("user:", limit=1)), [("user:12:name", "b")])
+
+    def test_scan_the_keys_committed_while_they_are_sorted_for_the_first_time(self):
+        transaction = self.system.begin()
+        transaction.set_many({"a": 1, "b": 2})
+        transaction.commit()
+
+        def sort_while_committing(keys):
+            transaction = self.system.begin()
+            transaction.set("c", 3)
+            transaction.unset("a")
+            transaction.commit()
+            return SortedKeys(keys)
+
+        with mock.patch("keyvaluestore.system.SortedKeys", side_effect=sort_while_committing):
+            self.assertEqual(list(self.system.scan(snapshot=self.system.last_commit)), [("b", 2)])
+        self.assertEqual(list(self.system.scan(snapshot=self.system.last_commit)), [("b", 2), ("c", 3)])
+
+    def test_a_key_is_not_visible_once_it_expires(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, A_VALUE, time_to_live=0)
+        transaction1.set(ANOTHER_KEY, A_VALUE, time_to_live=3600)
+        self.assertEqual(transaction1.get(A_KEY), A_VALUE)
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        self.assertIsNone(transaction2.get(A_KEY, None))
+        self.assertEqual(transaction2.get_many([A_KEY, ANOTHER_KEY]), [None, A_VALUE])
+        self.assertEqual(list(transaction2.scan()), [(ANOTHER_KEY, A_VALUE)])
+
+    def test_expired_keys_are_not_counted_before_they_are_deleted(self):
+        transaction1 = self.system.begin()
+        transaction1.set(A_KEY, A_VALUE, time_to_live=0)
+        transaction1.set(ANOTHER_KEY, A_VALUE)
+        transaction1.commit()
+
+        transaction2 = self.system.begin()
+        self.assertEqual(transaction2.number_of_keys_with_value(A_VALUE), 1)
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        self.assertEqual(transaction2.number_of_keys_with_value(A_VALUE), 1)
+        self.assertEqual(transaction2.number_of_keys_with_value(ANOTHER_VALUE), 1)
+        transaction2.commit()
+
+        transaction3 = self.system.begin()
+        self.assertEqual(transaction3.number_of_keys_with_value(A_VALUE), 1)
+        self.assertEqual(transaction3.number_of_keys_with_value(ANOTHER_VALUE), 1)
+        self.assertEqual(self.system.expire_keys(), 0)
+
+    def test_expire_keys_deletes_the_keys_whose_deadline_passed(self):
+        transaction = self.system.begin()
+        transaction.set(A_KEY, A_VALUE, time_to_live=3600)
+        transaction.set(ANOTHER_KEY, A_VALUE, time_to_live=7200)
+        transaction.commit()
+
+        self.assertEqual(self.system.expire_keys(now=time.time() + 5400), 1)
+
+        transaction = self.system.begin()
+        self.assertEqual(transaction.number_of_keys_with_value(A_VALUE), 1)
+        self.assertEqual(transaction.get_many([A_KEY, ANOTHER_KEY]), [None, A_VALUE])
+
+    def test_writing_a_key_again_removes_its_deadline(self):
+        transaction = self.system.begin()
+        transaction.set(A_KEY, A_VALUE, time_to_live=3600)
+        transaction.commit()
+        transaction = self.system.begin()
+        transaction.set_many({A_KEY: ANOTHER_VALUE})
+        transaction.commit()
+
+        self.assertEqual(self.system.expire_keys(now=time.time() + 7200), 0)
+        self.assertEqual(self.system.begin().get(A_KEY), ANOTHER_VALUE)
+
+    def test_set_the_time_to_live_of_an_existing_key(self):
+        transaction = self.system.begin()
+        transaction.set(A_KEY, A_VALUE)
+        self.assertFalse(transaction.expire(A_NON_EXISTENT_KEY, 0))
+        self.assertTrue(transaction.expire(A_KEY, 0))
+        transaction.commit()
+
+        self.assertIsNone(self.system.begin().get(A_KEY, None))
+        self.assertEqual(self.system.expire_keys(), 1)
+
+    def test_writing_a_key_deleted_after_it_expired_does_not_conflict(self):
+        transaction = self.system.begin()
+        transaction.set(A_KEY, A_VALUE, time_to_live=0)
+        transaction.commit()
+        transaction = self.system.begin()
+        transaction.set(A_KEY, ANOTHER_VALUE)
+
+        self.assertEqual(self.system.expire_keys(), 1)
+        transaction.commit()
+
+        self.assertEqual(self.system.begin().get(A_KEY), ANOTHER_VALUE)
+
+    def test_writing_a_key_written_after_the_snapshot_conflicts_even_if_it_expired(self):
+        transaction = self.system.begin()
+        transaction.get(A_KEY, None)
+        another_transaction = self.system.begin()
+        another_transaction.set(A_KEY, A_VALUE, time_to_live=0)
+        another_transaction.commit()
+        self.assertEqual(self.system.expire_keys(), 1)
+
+        transaction.set(A_KEY, ANOTHER_VALUE)
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction.commit()
+
+    def test_rollback_the_deadlines_of_a_nested_transaction(self):
+        transaction = self.system.begin()
+        transaction.set(A_KEY, A_VALUE, time_to_live=3600)
+        transaction.set(ANOTHER_KEY, A_VALUE)
+        transaction.begin()
+        transaction.set(A_KEY, A_VALUE)
+        transaction.expire(ANOTHER_KEY, 3600)
+        transaction.rollback()
+        transaction.commit()
+
+        self.assertEqual(self.system.expire_keys(now=time.time() + 7200), 1)
+        self.assertEqual(self.system.begin().get_many([A_KEY, ANOTHER_KEY]), [None, A_VALUE])
+
+    def test_expire_keys_in_batches(self):
+        number_of_keys = KeyValueStoreSystem.EXPIRE_BATCH_SIZE + 1
+        transaction = self.system.begin()
+        for number in range(number_of_keys):
+            transaction.set(f"key-{number}", A_VALUE, time_to_live=0)
+        transaction.commit()
+
+        self.assertEqual(self.system.expire_keys(), KeyValueStoreSystem.EXPIRE_BATCH_SIZE)
+        self.assertEqual(self.system.expire_keys(), 1)
+        self.assertEqual(self.system.begin().number_of_keys_with_value(A_VALUE), 0)
+
+
+class SerializableTransactionTests(TestCase):
+    def setUp(self):
+        self.system = KeyValueStoreSystem(serializable=True)
+        transaction = self.system.begin()
+        transaction.set_many({A_KEY: A_VALUE, ANOTHER_KEY: A_VALUE})
+        transaction.commit()
+
+    def tearDown(self):
+        self.system.end()
+
+    def test_write_skew_conflicts(self):
+        transaction1 = self.system.begin()
+        transaction2 = self.system.begin()
+        transaction1.get(A_KEY)
+        transaction2.get(ANOTHER_KEY)
+        transaction1.set(ANOTHER_KEY, ANOTHER_VALUE)
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        transaction1.commit()
+
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction2.commit()
+
+    def test_write_skew_commits_with_snapshot_isolation(self):
+        transaction1 = self.system.begin(serializable=False)
+        transaction2 = self.system.begin(serializable=False)
+        transaction1.get(A_KEY)
+        transaction2.get(ANOTHER_KEY)
+        transaction1.set(ANOTHER_KEY, ANOTHER_VALUE)
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        transaction1.commit()
+        transaction2.commit()
+
+        self.assertEqual(self.system.begin().get_many([A_KEY, ANOTHER_KEY]), [ANOTHER_VALUE, ANOTHER_VALUE])
+
+    def test_reading_a_key_that_did_not_exist_conflicts_with_its_creation(self):
+        transaction1 = self.system.begin()
+        transaction2 = self.system.begin()
+        transaction1.get_many([A_NON_EXISTENT_KEY])
+        transaction2.set(A_NON_EXISTENT_KEY, A_VALUE)
+        transaction2.commit()
+
+        transaction1.set(A_KEY, ANOTHER_VALUE)
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction1.commit()
+
+    def test_scan_conflicts_with_a_new_key_in_its_range(self):
+        transaction1 = self.system.begin()
+        transaction2 = self.system.begin()
+        list(transaction1.scan("a", "c"))
+        transaction2.set("b", A_VALUE)
+        transaction2.commit()
+
+        transaction1.set(A_KEY, ANOTHER_VALUE)
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction1.commit()
+
+    def test_scan_does_not_conflict_with_keys_out_of_its_range(self):
+        transaction1 = self.system.begin()
+        transaction2 = self.system.begin()
+        list(transaction1.prefix("a"))
+        transaction2.set("b", A_VALUE)
+        transaction2.commit()
+
+        transaction1.set(A_KEY, ANOTHER_VALUE)
+        transaction1.commit()
+
+    def test_number_of_keys_with_value_conflicts_with_a_change_of_the_number(self):
+        transaction1 = self.system.begin()
+        transaction2 = self.system.begin()
+        transaction1.number_of_keys_with_value(ANOTHER_VALUE)
+        transaction2.set(A_NON_EXISTENT_KEY, ANOTHER_VALUE)
+        transaction2.commit()
+
+        transaction1.set(A_KEY, ANOTHER_VALUE)
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction1.commit()
+
+    def test_a_transaction_that_only_reads_never_conflicts(self):
+        transaction1 = self.system.begin()
+        transaction2 = self.system.begin()
+        transaction1.get(A_KEY)
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        transaction2.commit()
+
+        transaction1.commit()
+
+    def test_reads_of_a_committed_transaction_are_forgotten(self):
+        transaction1 = self.system.begin()
+        transaction1.get(A_KEY)
+        transaction1.commit()
+        transaction2 = self.system.begin()
+        transaction2.set(A_KEY, ANOTHER_VALUE)
+        transaction2.commit()
+
+        transaction1.set(ANOTHER_KEY, ANOTHER_VALUE)
+        transaction1.commit()
+
+    def test_many_reads_are_remembered_in_a_bloom_filter(self):
+        keys = [f"key-{number}" for number in range(ReadSet.MAX_KEYS + 1)]
+        transaction1 = self.system.begin()
+        transaction2 = self.system.begin()
+        transaction1.get_many(keys)
+        transaction2.set(keys[0], A_VALUE)
+        transaction2.commit()
+
+        transaction1.set(A_KEY, ANOTHER_VALUE)
+        with self.assertRaises(KeyValueStoreSystem.TransactionConflict):
+            transaction1.commit()
+
+
+class TransactionMemoryTests(TestCase):
+    NUMBER_OF_WRITES = 10_000
+
+    def setUp(self):
+        self.system = KeyValueStoreSystem()
+        self.keys = [f"key-{number}" for number in range(TransactionMemoryTests.NUMBER_OF_WRITES)]
+        self.values = [f"value-{number % 10}" for number in range(TransactionMemoryTests.NUMBER_OF_WRITES)]
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+
+    def allocated_per_write(self, write):
+        before, _ = tracemalloc.get_traced_memory()
+        for key, value in zip(self.keys, self.values):
+            write(key, value)
+        after, _ = tracemalloc.get_traced_memory()
+        return (after - before) / TransactionMemoryTests.NUMBER_OF_WRITES
+
+    def test_a_pending_write_costs_about_one_dictionary_entry(self):
+        transaction = self.system.begin()
+        transaction.get(A_KEY, None)
+
+        self.assertLess(self.allocated_per_write(transaction.set), 64)
+
+    def test_writing_the_same_key_again_does_not_allocate(self):
+        transaction = self.system.begin()
+        for key, value in zip(self.keys, self.values):
+            transaction.set(key, value)
+
+        self.assertLess(self.allocated_per_write(transaction.set), 1)
+
+    def test_a_nested_transaction_costs_one_more_entry_per_overwritten_key(self):
+        transaction = self.system.begin()
+        for key, value in zip(self.keys, self.values):
+            transaction.set(key, value)
+        transaction.begin()
+
+        self.assertLess(self.allocated_per_write(transaction.set), 64)
+
+
+class TestSystemWithShardedStorage(TestSystem):
+    def setUp(self):
+        self.system = KeyValueStoreSystem(ShardedStorage(HashPartitioner(4)))
+        self.system.begin()
+
+
+class TestSystemWithRangePartitionedStorage(TestSystem):
+    def setUp(self):
+        self.system = KeyValueStoreSystem(ShardedStorage(RangePartitioner(["b", "k"])))
+        self.system.begin()
+
+
+class TestSystemWithCompactStorage(TestSystem):
+    def setUp(self):
+        self.system = KeyValueStoreSystem(CompactStorage())
+        self.system.begin()
+
+
+class TestSystemWithMappedStorage(TestSystem):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.system = KeyValueStoreSystem(MappedStorage(os.path.join(directory.name, "kvs.data")))
+        self.system.begin()
+
+
+class TestSystemWithCachedStorage(TestSystem):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storage = MappedStorage(os.path.join(directory.name, "kvs.data"))
+        self.system = KeyValueStoreSystem(CachedStorage(storage, max_entries=2))
+        self.system.begin()
+
+
+class TestSystemWithSerializableTransactions(TestSystem):
+    def setUp(self):
+        self.system = KeyValueStoreSystem(serializable=True)
+        self.system.begin()
@@ -0,0 +1,105 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from keyvaluestore.codec import encode_value
+from keyvaluestore.system import KeyValueStoreSystem, Transaction
+from keyvaluestore.transfer import FORMATS, MAGIC, CorruptDump, export_items, import_items
+from keyvaluestore.wal import WriteAheadLog
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.dump_path = os.path.join(self.directory, "kvs.dump")
+        self.system = KeyValueStoreSystem()
+        self.addCleanup(self.system.end)
+
+    def commit(self, **values):
+        transaction = self.system.begin()
+        transaction.set_many(values)
+        transaction.commit()
+
+    def test_import_what_was_exported_in_every_format(self):
+        self.commit(hello="world", comma="a,b", quote='say "hi"', line="two\nlines")
+
+        for dump_format in FORMATS:
+            with self.subTest(dump_format):
+                self.assertEqual(export_items(self.system, self.dump_path, dump_format), 4)
+                imported = KeyValueStoreSystem()
+
+                self.assertEqual(import_items(imported, self.dump_path, dump_format), 4)
+                self.assertEqual(dict(imported.items(imported.last_commit)), dict(self.system.items(self.system.last_commit)))
+
+    def test_binary_dumps_keep_the_type_of_the_values(self):
+        self.commit(integer=42, real=0.5)
+        export_items(self.system, self.dump_path)
+        imported = KeyValueStoreSystem()
+
+        import_items(imported, self.dump_path)
+
+        self.assertEqual(imported.get_many(["integer", "real"]), [42, 0.5])
+
+    def test_import_replaces_the_keys_the_store_has(self):
+        self.commit(kept="old", replaced="old")
+        other = KeyValueStoreSystem()
+        transaction = other.begin()
+        transaction.set("replaced", "new")
+        transaction.commit()
+        export_items(other, self.dump_path)
+
+        import_items(self.system, self.dump_path)
+
+        self.assertEqual(self.system.get_many(["kept", "replaced"]), ["old", "new"])
+        self.assertEqual(self.system.begin().number_of_keys_with_value("old"), 1)
+
+    def test_import_commits_in_batches_that_reach_the_log(self):
+        log_path = os.path.join(self.directory, "kvs.log")
+        system = KeyValueStoreSystem(log=WriteAheadLog(log_path))
+        items = [(f"key-{number}", number) for number in range(KeyValueStoreSystem.LOAD_BATCH_SIZE + 1)]
+
+        self.assertEqual(system.import_items(items), len(items))
+        self.assertEqual(system.last_commit, 2)
+        system.end()
+
+        system = KeyValueStoreSystem(log=WriteAheadLog(log_path))
+        self.addCleanup(system.end)
+        self.assertEqual(dict(system.items(system.last_commit)), dict(items))
+
+    def test_import_to_a_read_only_system_fails(self):
+        with open(self.dump_path, "wb") as dump:
+            dump.write(MAGIC)
+        system = KeyValueStoreSystem(read_only=True)
+
+        with self.assertRaises(KeyValueStoreSystem.ReadOnly):
+            import_items(system, self.dump_path)
+
+    def test_reject_corrupt_dumps(self):
+        self.commit(hello="world")
+        export_items(self.system, self.dump_path)
+        with open(self.dump_path, "rb") as dump:
+            data = dump.read()
+        corrupt_dumps = {
+            "binary": b"NOTADUMP" + data[len(MAGIC) :],
+            "binary truncated": data[:-2],
+            "csv": b"only a key\n",
+            "binary deleted value": MAGIC + encode_value("hello") + encode_value(Transaction.TOMBSTONE),
+            "binary deleted key": MAGIC + encode_value(Transaction.TOMBSTONE) + encode_value("world"),
+            "binary number key": MAGIC + encode_value(7) + encode_value("world"),
+            "jsonl": b'{"key": "hello"}\n',
+            "jsonl list value": b'{"key": "hello", "value": [1, 2]}\n',
+            "jsonl number key": b'{"key": 3, "value": "world"}\n',
+            "jsonl null value": b'{"key": "hello", "value": null}\n',
+        }
+
+        for name, corrupt_dump in corrupt_dumps.items():
+            with self.subTest(name):
+                with open(self.dump_path, "wb") as dump:
+                    dump.write(corrupt_dump)
+
+                system = KeyValueStoreSystem()
+                with self.assertRaises(CorruptDump):
+                    import_items(system, self.dump_path, name.split()[0])
+                self.assertEqual((system.last_commit, list(system.items(0))), (0, []))
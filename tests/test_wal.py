@@ -0,0 +1,155 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from keyvaluestore.codec import UnsupportedValue
+from keyvaluestore.system import KeyValueStoreSystem
+from keyvaluestore.wal import LogFailed, WriteAheadLog
+
+
+class WriteAheadLogTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "kvs.log")
+
+    def test_the_committed_data_survives_a_restart(self):
+        for sync in WriteAheadLog.SYNC_POLICIES:
+            with self.subTest(sync=sync):
+                system = KeyValueStoreSystem(log=WriteAheadLog(self.path, sync=sync))
+                transaction = system.begin()
+                transaction.set("hello", "world")
+                transaction.set("answer", 42)
+                transaction.set("gone", 1.5)
+                transaction.commit()
+                transaction.unset("gone")
+                transaction.commit()
+                system.end()
+
+                system = KeyValueStoreSystem(log=WriteAheadLog(self.path, sync=sync))
+                transaction = system.begin()
+                self.assertEqual(transaction.get("hello"), "world")
+                self.assertEqual(transaction.get("answer"), 42)
+                self.assertEqual(transaction.number_of_keys_with_value(42), 1)
+                with self.assertRaises(KeyError):
+                    transaction.get("gone")
+                system.end()
+                os.remove(self.path)
+
+    def test_the_deadlines_survive_a_restart(self):
+        system = KeyValueStoreSystem(log=WriteAheadLog(self.path))
+        transaction = system.begin()
+        transaction.set("session", "data", time_to_live=3600)
+        transaction.set("expired", "data", time_to_live=0)
+        transaction.commit()
+        system.end()
+
+        system = KeyValueStoreSystem(log=WriteAheadLog(self.path))
+
+        transaction = system.begin()
+        self.assertEqual(transaction.get("session"), "data")
+        self.assertIsNone(transaction.get("expired", None))
+        self.assertEqual(system.expire_keys(now=time.time() + 7200), 2)
+        self.assertIsNone(system.begin().get("session", None))
+        system.end()
+
+    def test_a_record_is_in_the_file_when_the_commit_returns(self):
+        system = KeyValueStoreSystem(log=WriteAheadLog(self.path, sync=WriteAheadLog.SYNC_NEVER))
+        transaction = system.begin()
+        transaction.set("hello", "world")
+        transaction.commit()
+
+        replayed = list(WriteAheadLog(self.path).replay())
+
+        self.assertEqual(replayed, [(1, {"hello": "world"}, {})])
+        system.end()
+
+    def test_a_torn_record_at_the_end_of_the_log_is_discarded(self):
+        system = KeyValueStoreSystem(log=WriteAheadLog(self.path))
+        transaction = system.begin()
+        transaction.set("hello", "world")
+        transaction.commit()
+        transaction.set("hello", "you")
+        transaction.commit()
+        system.end()
+        os.truncate(self.path, os.path.getsize(self.path) - 3)
+
+        system = KeyValueStoreSystem(log=WriteAheadLog(self.path))
+        transaction = system.begin()
+        transaction.set("bye", "world")
+        transaction.commit()
+        system.end()
+
+        system = KeyValueStoreSystem(log=WriteAheadLog(self.path))
+        transaction = system.begin()
+        self.assertEqual(transaction.get("hello"), "world")
+        self.assertEqual(transaction.get("bye"), "world")
+        system.end()
+
+    def test_concurrent_commits_are_all_durable(self):
+        system = KeyValueStoreSystem(log=WriteAheadLog(self.path))
+
+        def commit_keys(thread_number):
+            for number in range(50):
+                transaction = system.begin()
+                transaction.set(f"{thread_number}-{number}", number)
+                transaction.commit()
+
+        threads = [threading.Thread(target=commit_keys, args=(thread_number,)) for thread_number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        system.end()
+
+        versions = [version for version, _, _ in WriteAheadLog(self.path).replay()]
+        self.assertEqual(versions, list(range(1, 201)))
+
+    def test_a_commit_the_log_cannot_take_changes_nothing(self):
+        system = KeyValueStoreSystem(log=WriteAheadLog(self.path))
+        transaction = system.begin()
+        transaction.set("hello", None)
+        with self.assertRaises(UnsupportedValue):
+            transaction.commit()
+        transaction.rollback()
+        transaction.set("bye", "world")
+        transaction.commit()
+
+        self.assertEqual(system.begin().get_many(["hello", "bye"], "missing"), ["missing", "world"])
+        self.assertEqual(system.last_commit, 1)
+        system.end()
+
+    def test_a_failed_write_fails_the_commits_after_it(self):
+        log = WriteAheadLog(self.path)
+        system = KeyValueStoreSystem(log=log)
+        log._file = FailingFile(log._file)
+        transaction = system.begin()
+        transaction.set("hello", "world")
+        with self.assertRaises(OSError):
+            transaction.commit()
+        transaction.rollback()
+
+        transaction.set("bye", "world")
+        with self.assertRaises(LogFailed):
+            transaction.commit()
+        transaction.rollback()
+
+        self.assertEqual(system.begin().get_many(["hello", "bye"], "missing"), ["missing", "missing"])
+        self.assertEqual(system.last_commit, 0)
+        system.end()
+        self.assertEqual(list(WriteAheadLog(self.path).replay()), [])
+
+
+class FailingFile:
+    """File whose writes fail"""
+
+    def __init__(self, file):
+        self._file = file
+
+    def write(self, data):
+        raise OSError("No space left on device")
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)